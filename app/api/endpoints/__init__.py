@@ -1,3 +1,6 @@
 # app/api/endpoints/__init__.py
 
 from .embedding_routes import EmbeddingRoutes
+from .health_routes import HealthRoutes
+from .job_routes import JobRoutes
+from .metrics_routes import MetricsRoutes
@@ -1,35 +1,338 @@
 import json
-from typing import List
+import os
+from functools import partial
+from typing import List, Literal, Optional
 
-from sentence_transformers import SentenceTransformer
-from fastapi import APIRouter, HTTPException, Depends
+import numpy as np
 
-from app.api.schemas.embedding_schemas import TextRequest
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Request
+from playhouse.pool import MaxConnectionsExceeded
+from starlette.concurrency import run_in_threadpool
+
+from app.api.schemas.embedding_schemas import TextRequest, SearchRequest, BatchEmbeddingRequest, DocumentRequest
 from app.core.dependencies import Dependency
+from app.core.executor import InferenceExecutor
+from app.core.metrics import STAGE_SECONDS
+from app.core.model_registry import ModelRegistry, model_registry as default_model_registry
 from app.crud.embedding_crud import EmbeddingCRUD
-from app.utils.embedding_utils import compute_embeddings_from_texts, convert_embedding_to_float_list
+from app.models.embedding_model import hash_content
+from app.utils.embedding_cache import EmbeddingCache
+from app.utils.embedding_utils import chunk_documents, compute_embeddings_from_texts, \
+    compute_embeddings_from_tokens, convert_embedding_to_float_list, EmbeddingBatcher
+from app.utils.projection import transform_embeddings
+from app.utils.stream_utils import iter_batches, iter_ndjson_chunks, NDJSONStreamingResponse
+from app.utils.vector_encoding import encode_json, negotiate_vector_format, vector_response
 
 
 class EmbeddingRoutes:
-    def __init__(self, dependency: Dependency, embedding_crud=EmbeddingCRUD()):
+    def __init__(self, dependency: Dependency, embedding_crud=EmbeddingCRUD(), embedding_batcher=None,
+                 inference_executor=None, embedding_cache=None, model_registry: Optional[ModelRegistry] = None):
         self.router = APIRouter()
+        self.dependency = dependency
         self.db = dependency.get_db  # Assuming `get_db` is the correct way to access the database session
         self.embedding_crud = embedding_crud
+        self.inference_executor = inference_executor or InferenceExecutor()
+        self.model_registry = model_registry or default_model_registry
+        self.embedding_cache = embedding_cache or EmbeddingCache(self.model_registry.vector_space())
+        self.embedding_batcher = embedding_batcher or EmbeddingBatcher(
+            executor=self.inference_executor, cache=self.embedding_cache,
+            dimensions=self.model_registry.dimensions())
+        # The default model uses the objects above; the others get theirs on first use
+        self._cruds = {self.model_registry.model_name: embedding_crud}
+        self._batchers = {self.model_registry.model_name: self.embedding_batcher}
+        self.stream_batch_size = int(os.getenv('EMBEDDING_STREAM_BATCH_SIZE', 64))
+        self.stream_max_line_bytes = int(os.getenv('EMBEDDING_STREAM_MAX_LINE_BYTES', 1024 * 1024))
 
         @self.router.post("/embedding/text/")
-        async def create_embedding_from_text(request: TextRequest):
-            embeddings = compute_embeddings_from_texts(request.chunks)
+        async def create_embedding_from_text(request: TextRequest, accept: Optional[str] = Header(default=None)):
+            vector_format = negotiate_vector_format(accept)
+            model = self.resolve_model(request.model)
+            embedding_instances, vectors = await self.save_chunks(model, request.chunks, tenant=request.tenant,
+                                                                  metadata=request.metadata)
+            return vector_response({"embeddings": vectors}, vector_format, vectors,
+                                   [instance.id for instance in embedding_instances])
+
+        @self.router.post("/embedding/stream/")
+        async def create_embeddings_from_stream(request: Request, include_embeddings: bool = False,
+                                                encoding: Literal['list', 'base64'] = 'list',
+                                                batch_size: Optional[int] = Query(default=None, ge=1, le=1024),
+                                                model: Optional[str] = None, tenant: str = ''):
+            model = self.resolve_model(model)
+            # Chunks are read, encoded and saved one bounded batch at a time, so memory does not
+            # grow with the size of the body
+            chunks = iter_ndjson_chunks(request.stream(), self.stream_max_line_bytes)
+            batches = iter_batches(chunks, batch_size or self.stream_batch_size)
+            return NDJSONStreamingResponse(self.stream_embeddings(batches, include_embeddings, encoding, model,
+                                                                  tenant))
+
+        @self.router.post("/embedding/documents/")
+        async def create_embeddings_from_documents(request: DocumentRequest):
+            model = self.resolve_model(request.model)
+            return {"documents": await self.save_documents(model, request.documents, request.tenant,
+                                                           request.max_tokens, request.overlap)}
+
+        @self.router.post("/embeddings/search")
+        async def search_embeddings(request: SearchRequest, accept: Optional[str] = Header(default=None)):
+            vector_format = negotiate_vector_format(accept)
+            model = self.resolve_model(request.model)
+            if request.text is not None:
+                vector = (await self.batcher_for(model).embed([request.text]))[0]
+            else:
+                vector = request.vector
+                dimensions = self.model_registry.dimensions(model)
+                projection = self.model_registry.projection(model)
+                if projection is not None and len(vector) == projection.input_dimensions:
+                    # A full-dimension vector from the model itself, brought into the served space
+                    vector = transform_embeddings([vector], projection, self.model_registry.normalize)[0]
+                elif len(vector) != dimensions:
+                    raise HTTPException(status_code=422, detail=f"Vector must have {dimensions} dimensions")
+
+            if request.mode == "hybrid":
+                results = await self.run_db(self.crud_for(model).hybrid_search, request.text, vector, request.k,
+                                            request.metric, request.ef_search, request.probes, request.candidates,
+                                            request.tenant, request.metadata)
+                scores = [{"score": score, "distance": instance.distance, "vector_rank": instance.vector_rank,
+                           "text_rank": instance.text_rank} for instance, score in results]
+            else:
+                results = await self.run_db(self.crud_for(model).search_embeddings, vector, request.k,
+                                            request.metric, request.ef_search, request.probes,
+                                            request.include_text or request.include_embedding
+                                            or request.include_metadata, request.tenant, request.metadata)
+                scores = [{"distance": distance} for _, distance in results]
+            vectors = [np.asarray(instance.embedding) for instance, _ in results] if request.include_embedding else []
+            return vector_response({"results": [
+                {"id": instance.id, **scores[i],
+                 **({"text": instance.text} if request.include_text else {}),
+                 **({"metadata": instance.metadata} if request.include_metadata else {}),
+                 # Chunks split from a document by /embedding/documents/ also report where they came from
+                 **({"document": {"id": instance.document_id, "start": instance.chunk_start, "end": instance.chunk_end}}
+                    if request.include_metadata and instance.document_id is not None else {}),
+                 **({"embedding": vectors[i]} if request.include_embedding else {})}
+                for i, (instance, _) in enumerate(results)
+            ]}, vector_format, vectors, [instance.id for instance, _ in results])
+
+        @self.router.post("/embeddings/batch")
+        async def get_embeddings_batch(request: BatchEmbeddingRequest, accept: Optional[str] = Header(default=None)):
+            vector_format = negotiate_vector_format(accept)
+            found = await self.run_db(self.crud_for(self.resolve_model(request.model)).get_embeddings_by_ids,
+                                      request.ids, request.include_text, request.include_embedding)
+            # Results follow the request order; ids without a row are reported separately
+            ids = [embedding_id for embedding_id in request.ids if embedding_id in found]
+            vectors = [np.asarray(found[embedding_id].embedding) for embedding_id in ids] \
+                if request.include_embedding else []
+            return vector_response({
+                "embeddings": [
+                    {"id": embedding_id,
+                     **({"text": found[embedding_id].text} if request.include_text else {}),
+                     **({"embedding": vectors[i]} if request.include_embedding else {})}
+                    for i, embedding_id in enumerate(ids)
+                ],
+                "missing": [embedding_id for embedding_id in request.ids if embedding_id not in found],
+            }, vector_format, vectors, ids)
 
-            embedding_instances = embedding_crud.save_embedding(request.chunks, embeddings)
-            return {"embeddings": [instance.embedding for instance in embedding_instances]}
+        @self.router.get("/database/pool/stats")
+        async def get_database_pool_stats():
+            return self.dependency.db.pool_stats()
 
+        @self.router.get("/embedding/cache/stats")
+        async def get_embedding_cache_stats():
+            return self.embedding_cache.stats()
+
+        @self.router.get("/embedding/id-cache/stats")
+        async def get_embedding_id_cache_stats(model: Optional[str] = None):
+            return self.crud_for(self.resolve_model(model)).id_cache.stats()
+
+        @self.router.delete("/embeddings/{id}")
+        async def delete_embedding(id: int, model: Optional[str] = None):
+            deleted = await self.run_db(self.crud_for(self.resolve_model(model)).delete_embeddings, [id])
+            if not deleted:
+                raise HTTPException(status_code=404, detail="Embedding not found")
+            return {"deleted": id}
 
         @self.router.get("/embeddings/{id}")
-        async def get_embedding(id: int):
+        async def get_embedding(id: int, model: Optional[str] = None, accept: Optional[str] = Header(default=None)):
+            vector_format = negotiate_vector_format(accept)
             # Retrieve embedding by ID
-            result = embedding_crud.get_embedding_by_id(id)
+            result = await self.run_db(self.crud_for(self.resolve_model(model)).get_embedding_by_id, id)
             if result:
                 embedding_instance, embedding = result
-                return {"id": embedding_instance.id, "text": embedding_instance.text, "embedding": embedding}
+                vector = np.asarray(embedding)
+                return vector_response({"id": embedding_instance.id, "text": embedding_instance.text,
+                                        "embedding": vector}, vector_format, [vector], [embedding_instance.id])
             else:
                 raise HTTPException(status_code=404, detail="Embedding not found")
+
+    def resolve_model(self, model_name: Optional[str]) -> str:
+        """
+        The model a request asked for, or the default one.
+
+        Raises:
+            HTTPException: 404 when the model is not configured.
+        """
+        try:
+            return self.model_registry.resolve(model_name)
+        except KeyError:
+            raise HTTPException(status_code=404, detail=f"Unknown model: {model_name}")
+
+    def crud_for(self, model_name: str) -> EmbeddingCRUD:
+        """
+        CRUD bound to the vector table of `model_name`.
+        """
+        if model_name not in self._cruds:
+            self._cruds[model_name] = self.embedding_crud.for_table(self.model_registry.table(model_name))
+        return self._cruds[model_name]
+
+    def batcher_for(self, model_name: str) -> EmbeddingBatcher:
+        """
+        Batcher encoding with `model_name`, with its own cache.
+        """
+        if model_name not in self._batchers:
+            self._batchers[model_name] = EmbeddingBatcher(
+                encode=partial(compute_embeddings_from_texts, model_name=model_name),
+                executor=self.inference_executor, cache=EmbeddingCache(self.model_registry.vector_space(model_name)),
+                dimensions=self.model_registry.dimensions(model_name))
+        return self._batchers[model_name]
+
+    async def lookup_chunks(self, model_name: str, chunks: List[str], include_embeddings: bool = True,
+                            tenant: str = '', metadata: Optional[dict] = None):
+        """
+        Split chunks into those the model's table already holds for `tenant`, with this
+        metadata, and the distinct others.
+
+        Returns:
+            Tuple[Dict[str, Embedding], List[str]]: Existing rows keyed by text, and the texts
+            without one, each once, in input order.
+        """
+        with STAGE_SECONDS.labels('lookup').time():
+            existing = await self.run_db(self.crud_for(model_name).find_by_content, chunks, include_embeddings,
+                                         tenant, metadata)
+        return existing, list(dict.fromkeys(chunk for chunk in chunks if chunk not in existing))
+
+    async def save_chunks(self, model_name: str, chunks: List[str], include_embeddings: bool = True,
+                          tenant: str = '', metadata: Optional[dict] = None):
+        """
+        Encode and save the chunks the model's table does not hold yet for `tenant`, with this
+        metadata. Chunks it already holds, and repeats, resolve to their existing rows without
+        being encoded or written.
+
+        Returns:
+            Tuple[List[Embedding], List[np.ndarray]]: An instance per chunk in input order, and
+            their vectors (stored ones for existing rows), or no vectors without `include_embeddings`.
+        """
+        existing, missing = await self.lookup_chunks(model_name, chunks, include_embeddings, tenant, metadata)
+        rows, vectors = dict(existing), {}
+        if missing:
+            # Pool these chunks with those of concurrent requests into one encode call
+            with STAGE_SECONDS.labels('embed').time():
+                embeddings = await self.batcher_for(model_name).embed(missing)
+            # Keep blocking DB work off the event loop so reads are not starved
+            with STAGE_SECONDS.labels('save').time():
+                saved = await self.run_db(self.crud_for(model_name).save_embedding, missing, embeddings, tenant,
+                                          metadata)
+            rows.update(zip(missing, saved))
+            vectors = dict(zip(missing, embeddings))
+        instances = [rows[chunk] for chunk in chunks]
+        if not include_embeddings:
+            return instances, []
+        return instances, [np.asarray(vectors[chunk] if chunk in vectors else rows[chunk].embedding)
+                           for chunk in chunks]
+
+    async def save_documents(self, model_name: str, documents, tenant: str = '', max_tokens: Optional[int] = None,
+                             overlap: Optional[int] = None) -> List[dict]:
+        """
+        Split documents into overlapping chunks of the model's tokens, then encode and save the
+        chunks the model's table does not hold yet for `tenant`, each with its document's id and
+        metadata and its character span in the document.
+
+        Each document is tokenized once: chunks are encoded from the token ids the split
+        produced. A chunk is identified by its text, metadata, document and span, so a document
+        sent again resolves to its saved chunks without being encoded or written.
+
+        Returns:
+            List[dict]: Per document, its id and its chunks' row id, span and token count.
+
+        Raises:
+            HTTPException: 422 when the overlap is not smaller than the chunk size.
+        """
+        try:
+            chunked = await self.inference_executor.run(chunk_documents, [document.text for document in documents],
+                                                        max_tokens, overlap, model_name)
+        except ValueError as error:
+            raise HTTPException(status_code=422, detail=str(error))
+        hashes = [[hash_content(chunk.text, document.metadata, (document.id, chunk.start, chunk.end))
+                   for chunk in chunks] for document, chunks in zip(documents, chunked)]
+        crud = self.crud_for(model_name)
+        with STAGE_SECONDS.labels('lookup').time():
+            ids = await self.run_db(crud.find_by_hash, [value for values in hashes for value in values], tenant)
+
+        # Chunks to save, grouped by document as metadata is, each once
+        missing, pending = {}, set()
+        for index, (chunks, values) in enumerate(zip(chunked, hashes)):
+            for chunk, value in zip(chunks, values):
+                if value not in ids and value not in pending:
+                    pending.add(value)
+                    missing.setdefault(index, []).append((chunk, value))
+        if missing:
+            with STAGE_SECONDS.labels('embed').time():
+                embeddings = await self.inference_executor.run(
+                    compute_embeddings_from_tokens, [chunk.token_ids for rows in missing.values() for chunk, _ in rows],
+                    None, model_name)
+
+            def save():
+                saved, offset = {}, 0
+                for index, rows in missing.items():
+                    document = documents[index]
+                    instances = crud.save_embedding([chunk.text for chunk, _ in rows],
+                                                    embeddings[offset:offset + len(rows)], tenant, document.metadata,
+                                                    [(document.id, chunk.start, chunk.end) for chunk, _ in rows])
+                    saved.update((value, instance.id) for (_, value), instance in zip(rows, instances))
+                    offset += len(rows)
+                return saved
+
+            with STAGE_SECONDS.labels('save').time():
+                ids.update(await self.run_db(save))
+        return [{"id": document.id,
+                 "chunks": [{"id": ids[value], "start": chunk.start, "end": chunk.end, "tokens": len(chunk.token_ids)}
+                            for chunk, value in zip(chunks, values)]}
+                for document, chunks, values in zip(documents, chunked, hashes)]
+
+    async def stream_embeddings(self, batches, include_embeddings: bool, encoding: str,
+                                model_name: Optional[str] = None, tenant: str = ''):
+        """
+        Encode and save each batch as it arrives, yielding one NDJSON line per batch.
+
+        Batches already written stay saved if a later line is malformed or a later batch
+        fails; the failure is reported as a final `{"error": ...}` line.
+        """
+        model_name = self.model_registry.resolve(model_name)
+        batch_number = 0
+        try:
+            async for batch in batches:
+                instances, vectors = await self.save_chunks(model_name, batch, include_embeddings, tenant)
+                line = {"batch": batch_number, "ids": [instance.id for instance in instances]}
+                if include_embeddings:
+                    line["embeddings"] = vectors
+                yield encode_json(line, encoding) + "\n"
+                batch_number += 1
+        except ValueError as error:
+            yield encode_json({"batch": batch_number, "error": str(error)}) + "\n"
+        except HTTPException as error:
+            yield encode_json({"batch": batch_number, "error": error.detail, "status_code": error.status_code}) + "\n"
+
+    async def run_db(self, fn, *args):
+        """
+        Run a blocking CRUD call in the threadpool on a pooled connection, which is
+        returned to the pool as soon as the call finishes.
+
+        Raises:
+            HTTPException: 503 when no connection frees up within the pool wait timeout.
+        """
+        def call():
+            with self.db():
+                return fn(*args)
+
+        try:
+            return await run_in_threadpool(call)
+        except MaxConnectionsExceeded:
+            raise HTTPException(status_code=503, detail="Database connection pool exhausted, retry later",
+                                headers={"Retry-After": "1"})
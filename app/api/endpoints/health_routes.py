@@ -0,0 +1,22 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from app.core.model_registry import ModelRegistry, model_registry as default_model_registry
+
+
+class HealthRoutes:
+    def __init__(self, model_registry: ModelRegistry = default_model_registry):
+        self.router = APIRouter()
+        self.model_registry = model_registry
+
+        @self.router.get("/health/live")
+        async def liveness():
+            # Answers as soon as the process serves requests, whatever the model is doing
+            return {"status": "ok"}
+
+        @self.router.get("/health/ready")
+        async def readiness():
+            status = self.model_registry.status()
+            if not self.model_registry.ready:
+                return JSONResponse(status_code=503, content=status)
+            return status
@@ -0,0 +1,109 @@
+import os
+from typing import List, Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import JSONResponse
+
+from app.api.schemas.embedding_schemas import JobRequest
+from app.crud.job_crud import JobCRUD
+from app.utils.stream_utils import iter_batches, iter_file, iter_ndjson_chunks
+
+
+class JobRoutes:
+    def __init__(self, embedding_routes, job_crud: Optional[JobCRUD] = None):
+        """
+        Submit embedding jobs for large corpora and follow their progress.
+
+        Chunks are queued in batches and processed by `JobWorker`s, so submitting returns as
+        soon as everything is queued.
+        """
+        self.router = APIRouter()
+        self.embedding_routes = embedding_routes
+        self.job_crud = job_crud or JobCRUD()
+        self.batch_size = int(os.getenv('EMBEDDING_JOB_BATCH_SIZE', 256))
+        # Server-side files can only be read from below this directory; unset disables them
+        self.file_root = os.getenv('EMBEDDING_JOB_FILE_ROOT', '')
+
+        @self.router.post("/embedding/jobs", status_code=202)
+        async def create_job(request: JobRequest):
+            model = self.embedding_routes.resolve_model(request.model)
+            batch_size = request.batch_size or self.batch_size
+            if request.chunks is not None:
+                return await self.submit(model, "chunks", _aiter(request.chunks), batch_size)
+            return await self.submit(model, "file", iter_ndjson_chunks(
+                iter_file(self.resolve_path(request.path)), self.embedding_routes.stream_max_line_bytes), batch_size)
+
+        @self.router.post("/embedding/jobs/upload", status_code=202)
+        async def upload_job(request: Request, model: Optional[str] = None,
+                             batch_size: Optional[int] = Query(default=None, ge=1, le=4096)):
+            model = self.embedding_routes.resolve_model(model)
+            chunks = iter_ndjson_chunks(request.stream(), self.embedding_routes.stream_max_line_bytes)
+            return await self.submit(model, "upload", chunks, batch_size or self.batch_size)
+
+        @self.router.get("/embedding/jobs/{id}")
+        async def get_job(id: int):
+            status = await self.embedding_routes.run_db(self.job_crud.job_status, id)
+            if status is None:
+                raise HTTPException(status_code=404, detail="Job not found")
+            return status
+
+        @self.router.get("/embedding/jobs/{id}/results")
+        async def get_job_results(id: int, after: int = -1, limit: int = Query(default=100, ge=1, le=1000)):
+            status = await self.embedding_routes.run_db(self.job_crud.job_status, id)
+            if status is None:
+                raise HTTPException(status_code=404, detail="Job not found")
+            batches = await self.embedding_routes.run_db(self.job_crud.job_results, id, after, limit)
+            return {"batches": batches, "next": batches[-1]["batch"] if batches else after}
+
+    def resolve_path(self, path: str) -> str:
+        """
+        Absolute path of a server-side file, which must lie under `EMBEDDING_JOB_FILE_ROOT`.
+
+        Raises:
+            HTTPException: 403 when file jobs are disabled or the path leaves the root,
+                404 when the file does not exist.
+        """
+        if not self.file_root:
+            raise HTTPException(status_code=403, detail="File jobs are disabled, set EMBEDDING_JOB_FILE_ROOT")
+        root = os.path.realpath(self.file_root)
+        resolved = os.path.realpath(os.path.join(root, path))
+        if os.path.commonpath([root, resolved]) != root:
+            raise HTTPException(status_code=403, detail="Path is outside EMBEDDING_JOB_FILE_ROOT")
+        if not os.path.isfile(resolved):
+            raise HTTPException(status_code=404, detail="File not found")
+        return resolved
+
+    async def submit(self, model_name: str, source: str, chunks, batch_size: int) -> JSONResponse:
+        """
+        Create a job and queue its chunks, a few batches per insert, while they are read.
+
+        The job becomes claimable only once every chunk is queued. When the input turns out to
+        be malformed the job is deleted and nothing is processed.
+
+        Raises:
+            HTTPException: 400 on a malformed line.
+        """
+        run_db = self.embedding_routes.run_db
+        job = await run_db(self.job_crud.create_job, model_name, source, batch_size)
+        total, position, pending = 0, 0, []
+        try:
+            async for batch in iter_batches(chunks, batch_size):
+                pending.append(batch)
+                total += len(batch)
+                if len(pending) == 16:
+                    await run_db(self.job_crud.add_batches, job.id, pending, position)
+                    position, pending = position + len(pending), []
+            await run_db(self.job_crud.add_batches, job.id, pending, position)
+        except ValueError as error:
+            await run_db(self.job_crud.delete_job, job.id)
+            raise HTTPException(status_code=400, detail=str(error))
+        except Exception:
+            await run_db(self.job_crud.delete_job, job.id)
+            raise
+        await run_db(self.job_crud.seal_job, job.id, total)
+        return JSONResponse(status_code=202, content=await run_db(self.job_crud.job_status, job.id))
+
+
+async def _aiter(items: List[str]):
+    for item in items:
+        yield item
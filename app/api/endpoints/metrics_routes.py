@@ -0,0 +1,14 @@
+from fastapi import APIRouter
+from fastapi.responses import Response
+
+from app.core import metrics
+
+
+class MetricsRoutes:
+    def __init__(self):
+        self.router = APIRouter()
+
+        @self.router.get("/metrics")
+        async def get_metrics():
+            body, content_type = metrics.render()
+            return Response(content=body, media_type=content_type)
@@ -1,8 +1,8 @@
 from datetime import datetime
-from typing import Optional, List
+from typing import Any, Dict, Optional, List, Literal
 
 from fastapi import File, UploadFile
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field, model_validator
 
 
 
@@ -17,4 +17,70 @@ class EmbeddingRequest(BaseModel):
 
 class TextRequest(BaseModel):
     chunks: List[str]
+    model: Optional[str] = None
+    tenant: str = ""
+    metadata: Optional[Dict[str, Any]] = None
 
+
+
+
+class Document(BaseModel):
+    id: str = Field(min_length=1)
+    text: str
+    metadata: Optional[Dict[str, Any]] = None
+
+
+class DocumentRequest(BaseModel):
+    documents: List[Document] = Field(min_length=1, max_length=1000)
+    model: Optional[str] = None
+    tenant: str = ""
+    # Tokens per chunk and tokens shared by consecutive chunks, EMBEDDING_CHUNK_* when omitted
+    max_tokens: Optional[int] = Field(default=None, ge=16)
+    overlap: Optional[int] = Field(default=None, ge=0)
+
+
+class SearchRequest(BaseModel):
+    text: Optional[str] = None
+    vector: Optional[List[float]] = None
+    k: int = Field(default=10, ge=1, le=1000)
+    metric: Literal["cosine", "l2", "inner_product"] = "cosine"
+    ef_search: Optional[int] = Field(default=None, ge=1, le=1000)
+    probes: Optional[int] = Field(default=None, ge=1)
+    include_text: bool = True
+    include_embedding: bool = False
+    model: Optional[str] = None
+    mode: Literal["vector", "hybrid"] = "vector"
+    candidates: Optional[int] = Field(default=None, ge=1, le=1000)
+    # Only rows of this tenant, and whose metadata contains this object
+    tenant: Optional[str] = None
+    metadata: Optional[Dict[str, Any]] = None
+    include_metadata: bool = False
+
+    @model_validator(mode="after")
+    def check_query(self):
+        if (self.text is None) == (self.vector is None):
+            raise ValueError("Provide exactly one of 'text' or 'vector'")
+        if self.mode == "hybrid" and self.text is None:
+            raise ValueError("Hybrid search needs 'text'")
+        return self
+
+
+
+class BatchEmbeddingRequest(BaseModel):
+    ids: List[int] = Field(min_length=1, max_length=5000)
+    include_text: bool = True
+    include_embedding: bool = True
+    model: Optional[str] = None
+
+
+class JobRequest(BaseModel):
+    chunks: Optional[List[str]] = None
+    path: Optional[str] = None
+    model: Optional[str] = None
+    batch_size: Optional[int] = Field(default=None, ge=1, le=4096)
+
+    @model_validator(mode="after")
+    def check_source(self):
+        if (self.chunks is None) == (self.path is None):
+            raise ValueError("Provide exactly one of 'chunks' or 'path'")
+        return self
@@ -0,0 +1,87 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Optional
+
+from fastapi import HTTPException
+
+
+def _init_worker(torch_threads: Optional[int]):
+    """
+    Apply the torch intra-op thread setting inside a pool worker.
+    """
+    if torch_threads:
+        import torch
+        torch.set_num_threads(torch_threads)
+
+
+class InferenceExecutor:
+    def __init__(self, mode: Optional[str] = None, max_workers: Optional[int] = None,
+                 torch_threads: Optional[int] = None, max_queue_depth: Optional[int] = None):
+        """
+        Run model inference on a dedicated worker pool instead of the event loop.
+
+        Args:
+            mode (str): "thread" or "process". Process workers each load their own model copy.
+            max_workers (int): Number of pool workers.
+            torch_threads (int): torch intra-op threads per worker. Left unchanged when unset.
+                In thread mode this setting is process wide.
+            max_queue_depth (int): Jobs allowed in flight (running or queued) before new
+                submissions are rejected with HTTP 503.
+        """
+        self.mode = (mode or os.getenv('EMBEDDING_EXECUTOR', 'thread')).lower()
+        if self.mode not in ('thread', 'process'):
+            raise ValueError(f"Unknown executor mode: {self.mode}")
+        self.max_workers = max_workers or int(os.getenv('EMBEDDING_WORKERS', 1))
+        self.torch_threads = torch_threads or int(os.getenv('EMBEDDING_TORCH_THREADS', 0)) or None
+        self.max_queue_depth = max_queue_depth or int(os.getenv('EMBEDDING_MAX_QUEUE_DEPTH', 32))
+        self._pool: Optional[Executor] = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+
+    @property
+    def queue_depth(self) -> int:
+        """
+        Number of jobs currently running or waiting for a worker.
+        """
+        return self._in_flight
+
+    @property
+    def pool(self) -> Executor:
+        """
+        The underlying pool, created on first use.
+        """
+        with self._lock:
+            if self._pool is None:
+                pool_class = ProcessPoolExecutor if self.mode == 'process' else ThreadPoolExecutor
+                self._pool = pool_class(max_workers=self.max_workers, initializer=_init_worker,
+                                        initargs=(self.torch_threads,))
+            return self._pool
+
+    async def run(self, fn: Callable, *args):
+        """
+        Run `fn(*args)` on the pool and await its result.
+
+        Raises:
+            HTTPException: 503 when the queue-depth limit is reached.
+        """
+        with self._lock:
+            if self._in_flight >= self.max_queue_depth:
+                raise HTTPException(status_code=503, detail="Inference queue is full, retry later",
+                                    headers={"Retry-After": "1"})
+            self._in_flight += 1
+        try:
+            return await asyncio.wrap_future(self.pool.submit(fn, *args))
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def shutdown(self):
+        """
+        Stop the pool, waiting for running jobs to finish.
+        """
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
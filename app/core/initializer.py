@@ -1,16 +1,242 @@
 # initialize.py
+import os
+import re
+
 from fastapi import FastAPI
 
+from app.core.model_registry import ModelRegistry, model_registry as default_model_registry
 from app.database.database import Database
-from app.models.embedding_model import Embedding
+from app.models.embedding_cache_model import EmbeddingCacheEntry
+from app.models.embedding_model import CONTENT_HASH_SQL, VECTOR_INDEX_OPS, tenant_relation_name, \
+    vector_index_definition
+from app.models.job_model import EmbeddingJob, EmbeddingJobBatch
 
 
 class AppInitializer:
-    def __init__(self, app: FastAPI, db: Database):
+    def __init__(self, app: FastAPI, db: Database, model_registry: ModelRegistry = default_model_registry):
         self.app = app
         self.db = db
+        self.model_registry = model_registry
+
+    def embedding_tables(self):
+        """
+        The vector table of every configured model.
+        """
+        return [self.model_registry.table(model_name) for model_name in self.model_registry.models]
+
+    @staticmethod
+    def dedicated_tenants():
+        """
+        Tenants given a partial vector index, or a partition, of their own (EMBEDDING_DEDICATED_TENANTS).
+        """
+        return [tenant.strip() for tenant in os.getenv('EMBEDDING_DEDICATED_TENANTS', '').split(',') if tenant.strip()]
+
+    @staticmethod
+    def partition_by_tenant() -> bool:
+        return os.getenv('EMBEDDING_PARTITION_BY_TENANT', 'false').lower() == 'true'
 
     def initialize(self):
         # Initialize database
         self.app.state.database = self.db
-        self.db.create_tables([Embedding])
+        self.add_content_hash()
+        self.add_metadata()
+        if self.partition_by_tenant():
+            self.create_partitioned_tables()
+        self.db.create_tables([*self.embedding_tables(), EmbeddingCacheEntry, EmbeddingJob, EmbeddingJobBatch])
+        if self.partition_by_tenant():
+            self.create_tenant_partitions()
+        self.create_vector_index()
+        self.create_metadata_index()
+        if os.getenv('EMBEDDING_HYBRID_SEARCH', 'false').lower() == 'true':
+            self.create_text_search()
+        self.db.warm_up()
+
+    def add_content_hash(self, tables=None):
+        """
+        Add the `content_hash` column that saved chunks are deduplicated on to vector tables
+        created without it, and fill it in, all in one transaction that rewrites the table
+        once. Only the first row of each distinct text gets its hash: older duplicates keep
+        a null one, so the unique index `create_tables` then builds holds. Tables that do not
+        exist yet or already have the column are left alone.
+
+        Args:
+            tables (List[Type[Embedding]]): Only these tables.
+        """
+        for table in tables or self.embedding_tables():
+            name = table._meta.table_name
+            self.db.execute_sql(
+                f"DO $$ BEGIN "
+                f"IF to_regclass('\"{name}\"') IS NOT NULL AND NOT EXISTS (SELECT 1 FROM pg_attribute "
+                f"WHERE attrelid = to_regclass('\"{name}\"') AND attname = 'content_hash' AND NOT attisdropped) THEN "
+                f'ALTER TABLE "{name}" ADD COLUMN IF NOT EXISTS "content_hash" varchar(64); '
+                f'UPDATE "{name}" SET "content_hash" = {CONTENT_HASH_SQL} '
+                f'WHERE "id" IN (SELECT min("id") FROM "{name}" GROUP BY "text"); '
+                f"END IF; END $$")
+
+    def add_metadata(self, tables=None):
+        """
+        Add the `tenant`, `metadata` and document source (`document_id`, `chunk_start`,
+        `chunk_end`) columns to vector tables created without them; existing rows belong to the
+        empty tenant. Adding them does not rewrite the table. Chunks are
+        then unique per tenant, so the unique index on `content_hash` alone is dropped for the
+        `(tenant, content_hash)` one `create_tables` builds.
+
+        Args:
+            tables (List[Type[Embedding]]): Only these tables.
+        """
+        for table in tables or self.embedding_tables():
+            name = table._meta.table_name
+            self.db.execute_sql(f'ALTER TABLE IF EXISTS "{name}" '
+                                f'ADD COLUMN IF NOT EXISTS "tenant" text NOT NULL DEFAULT \'\', '
+                                f'ADD COLUMN IF NOT EXISTS "metadata" jsonb, '
+                                f'ADD COLUMN IF NOT EXISTS "document_id" text, '
+                                f'ADD COLUMN IF NOT EXISTS "chunk_start" integer, '
+                                f'ADD COLUMN IF NOT EXISTS "chunk_end" integer')
+            self.db.execute_sql(f'DROP INDEX IF EXISTS "{name}_content_hash"')
+
+    def create_partitioned_tables(self, tables=None):
+        """
+        Create vector tables that do not exist yet partitioned by tenant, with a default
+        partition for every tenant without one of its own. The primary key then spans
+        `(id, tenant)`, as keys of a partitioned table must include the partition key; ids
+        still come from one sequence. Existing tables are left as they are.
+
+        Args:
+            tables (List[Type[Embedding]]): Only these tables.
+        """
+        for table in tables or self.embedding_tables():
+            name = table._meta.table_name
+            sql, _ = table._meta.database.get_sql_context().sql(table._schema._create_table(safe=False)).query()
+            sql = sql.replace('"id" SERIAL NOT NULL PRIMARY KEY', '"id" SERIAL NOT NULL')
+            self.db.execute_sql(
+                f"DO $$ BEGIN IF to_regclass('\"{name}\"') IS NULL THEN "
+                f'{sql[:-1]}, PRIMARY KEY ("id", "tenant")) PARTITION BY LIST ("tenant"); '
+                f'CREATE TABLE "{name}_default" PARTITION OF "{name}" DEFAULT; '
+                f"END IF; END $$")
+
+    def create_tenant_partitions(self, tables=None, tenants=None):
+        """
+        Give every dedicated tenant a partition of its own in the partitioned vector tables,
+        which gets its own vector index, so a search within the tenant only reads that index.
+        Rows the tenant already has are moved out of the default partition in the same
+        transaction, which locks the table until they are.
+
+        Args:
+            tables (List[Type[Embedding]]): Only these tables.
+            tenants (List[str]): These tenants instead of EMBEDDING_DEDICATED_TENANTS.
+        """
+        database = self.db.database
+        for table in tables or self.embedding_tables():
+            name = table._meta.table_name
+            columns = ', '.join(f'"{field.column_name}"' for field in table._meta.sorted_fields)
+            for tenant in tenants or self.dedicated_tenants():
+                partition = tenant_relation_name(name, tenant)
+                # Plain statements, so the tenant stays a parameter the driver quotes as a literal
+                with database.connection_context(), database.atomic():
+                    # Writers wait, so no row of the tenant lands in the default partition meanwhile
+                    database.execute_sql(f'LOCK TABLE "{name}" IN SHARE ROW EXCLUSIVE MODE')
+                    exists, partitioned = database.execute_sql(
+                        "SELECT to_regclass(%s) IS NOT NULL, "
+                        "EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s))",
+                        (f'"{partition}"', f'"{name}"')).fetchone()
+                    if exists or not partitioned:
+                        continue
+                    database.execute_sql(f'CREATE TABLE "{partition}" (LIKE "{name}" INCLUDING DEFAULTS '
+                                         f'INCLUDING GENERATED INCLUDING CONSTRAINTS)')
+                    database.execute_sql(f'WITH "moved" AS (DELETE FROM "{name}" WHERE "tenant" = %s '
+                                         f'RETURNING {columns}) '
+                                         f'INSERT INTO "{partition}" ({columns}) SELECT {columns} FROM "moved"',
+                                         (tenant,))
+                    database.execute_sql(f'ALTER TABLE "{name}" ATTACH PARTITION "{partition}" FOR VALUES IN (%s)',
+                                         (tenant,))
+
+    def create_metadata_index(self, tables=None):
+        """
+        Create the GIN index that serves metadata containment (`@>`) filters on every model's
+        vector table.
+
+        Args:
+            tables (List[Type[Embedding]]): Only these tables.
+        """
+        for table in tables or self.embedding_tables():
+            name = table._meta.table_name
+            self.db.execute_sql(f'CREATE INDEX IF NOT EXISTS "{name}_metadata_idx" ON "{name}" '
+                                f'USING gin ("metadata" jsonb_path_ops)')
+
+    def create_vector_index(self, tables=None, concurrently: bool = False):
+        """
+        Create the ANN index configured through the environment on every model's vector table.
+
+        EMBEDDING_INDEX_TYPE selects "hnsw", "ivfflat" or "none", and EMBEDDING_INDEX_METRIC
+        the distance the index serves. Searches with another metric fall back to a scan.
+        Tables in a binary storage mode are indexed on their binary-quantized vectors by
+        Hamming distance, which serves every metric through reranking. Unless tables are
+        partitioned by tenant, every tenant in EMBEDDING_DEDICATED_TENANTS also gets a partial
+        index over its rows only, which searches filtered to it use instead.
+
+        Args:
+            tables (List[Type[Embedding]]): Only index these tables.
+            concurrently (bool): Build without blocking writes, as migrations on live tables do.
+        """
+        index_type = os.getenv('EMBEDDING_INDEX_TYPE', 'hnsw').lower()
+        if index_type == 'none':
+            return
+        metric = os.getenv('EMBEDDING_INDEX_METRIC', 'cosine').lower()
+        if index_type not in ('hnsw', 'ivfflat'):
+            raise ValueError(f"Unknown vector index type: {index_type}")
+        if metric not in VECTOR_INDEX_OPS:
+            raise ValueError(f"Unknown vector index metric: {metric}")
+
+        if index_type == 'hnsw':
+            options = (f"m = {int(os.getenv('EMBEDDING_HNSW_M', 16))}, "
+                       f"ef_construction = {int(os.getenv('EMBEDDING_HNSW_EF_CONSTRUCTION', 64))}")
+        else:
+            options = f"lists = {int(os.getenv('EMBEDDING_IVFFLAT_LISTS', 100))}"
+
+        tenants = [] if self.partition_by_tenant() else self.dedicated_tenants()
+        for table in tables or self.embedding_tables():
+            name, definition = vector_index_definition(table, index_type, metric)
+            self.db.execute_sql(
+                f'CREATE INDEX {"CONCURRENTLY " if concurrently else ""}IF NOT EXISTS "{name}" '
+                f'ON "{table._meta.table_name}" USING {index_type} {definition} WITH ({options})')
+            for tenant in tenants:
+                name, definition = vector_index_definition(table, index_type, metric, tenant)
+                self.db.execute_sql(
+                    f'CREATE INDEX {"CONCURRENTLY " if concurrently else ""}IF NOT EXISTS "{name}" '
+                    f'ON "{table._meta.table_name}" USING {index_type} {definition} WITH ({options}) '
+                    f'WHERE "tenant" = %s', (tenant,))
+
+    def create_text_search(self, tables=None):
+        """
+        Add the generated `text_search` tsvector column and its GIN index that hybrid search
+        ranks text with, to every model's vector table. Adding the column rewrites an existing
+        table once, under an exclusive lock.
+
+        EMBEDDING_TEXT_SEARCH_CONFIG selects the text search configuration ("english" stems
+        words and drops stop words, "simple" only lowercases). It applies when the column is added.
+
+        Args:
+            tables (List[Type[Embedding]]): Only these tables.
+        """
+        config = os.getenv('EMBEDDING_TEXT_SEARCH_CONFIG', 'english').lower()
+        if not re.fullmatch(r'[a-z_]+', config):
+            raise ValueError(f"Invalid text search configuration: {config}")
+        for table in tables or self.embedding_tables():
+            name = table._meta.table_name
+            self.db.execute_sql(
+                f'ALTER TABLE "{name}" ADD COLUMN IF NOT EXISTS "text_search" tsvector '
+                f'GENERATED ALWAYS AS (to_tsvector(\'{config}\'::regconfig, "text")) STORED')
+            self.db.execute_sql(f'CREATE INDEX IF NOT EXISTS "{name}_text_search_idx" ON "{name}" '
+                                f'USING gin ("text_search")')
+
+    def load_faiss_index(self, faiss_index, embedding_crud):
+        """
+        Fill the FAISS index from its snapshot and the `embedding` table, and snapshot it
+        again on shutdown.
+        """
+        self.db.connect()
+        try:
+            faiss_index.load(embedding_crud.iter_embeddings_after)
+        finally:
+            self.db.close()
+        self.app.add_event_handler("shutdown", faiss_index.save)
@@ -0,0 +1,102 @@
+import asyncio
+import json
+import logging
+import os
+from typing import List, Optional
+
+from fastapi import HTTPException
+
+from app.crud.job_crud import JobCRUD
+
+logger = logging.getLogger(__name__)
+
+
+class JobWorker:
+    def __init__(self, embedding_routes, job_crud: Optional[JobCRUD] = None, concurrency: Optional[int] = None,
+                 poll_interval: Optional[float] = None, lease_seconds: Optional[float] = None,
+                 max_attempts: Optional[int] = None):
+        """
+        Background tasks working through the batches of embedding jobs.
+
+        Batches are encoded through the same batchers and inference pool as HTTP requests and
+        saved through the same CRUDs, so job traffic is bounded by the same limits.
+
+        Args:
+            embedding_routes (EmbeddingRoutes): Provides the batchers, CRUDs and `run_db`.
+            job_crud (JobCRUD): Work queue access.
+            concurrency (int): Batches processed at once. Defaults to `EMBEDDING_JOB_WORKERS`.
+            poll_interval (float): Seconds to wait when the queue is empty. Defaults to
+                `EMBEDDING_JOB_POLL_SECONDS`.
+            lease_seconds (float): How long a claimed batch is reserved before another worker
+                may take it over. Defaults to `EMBEDDING_JOB_LEASE_SECONDS`.
+            max_attempts (int): Tries per batch before it is marked failed. Defaults to
+                `EMBEDDING_JOB_MAX_ATTEMPTS`.
+        """
+        self.embedding_routes = embedding_routes
+        self.job_crud = job_crud or JobCRUD()
+        self.concurrency = concurrency if concurrency is not None else int(os.getenv('EMBEDDING_JOB_WORKERS', 1))
+        self.poll_interval = poll_interval if poll_interval is not None \
+            else float(os.getenv('EMBEDDING_JOB_POLL_SECONDS', 1))
+        self.lease_seconds = lease_seconds or float(os.getenv('EMBEDDING_JOB_LEASE_SECONDS', 300))
+        self.max_attempts = max_attempts or int(os.getenv('EMBEDDING_JOB_MAX_ATTEMPTS', 3))
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self):
+        """
+        Start the worker tasks on the running event loop.
+        """
+        self._tasks = [asyncio.get_running_loop().create_task(self._work()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        """
+        Cancel the worker tasks. A batch interrupted mid-way is picked up again once its lease expires.
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _work(self):
+        while True:
+            try:
+                processed = await self.run_once()
+            except Exception:
+                # Whatever went wrong, the batch's lease makes sure it is retried
+                logger.exception("Embedding job worker error")
+                processed = False
+            if not processed:
+                await asyncio.sleep(self.poll_interval)
+
+    async def run_once(self) -> bool:
+        """
+        Claim and process one batch.
+
+        Returns:
+            bool: Whether a batch was processed, successfully or not.
+        """
+        run_db = self.embedding_routes.run_db
+        batch = await run_db(self.job_crud.claim_batch, self.lease_seconds, self.max_attempts)
+        if batch is None:
+            return False
+
+        model_name = batch.job.model_name
+        try:
+            chunks = json.loads(batch.chunks)
+            # Chunks saved before are not encoded again; their stored vectors fill their slots,
+            # and saving leaves their rows as they are
+            existing, missing = await self.embedding_routes.lookup_chunks(model_name, chunks)
+            encoded = dict(zip(missing, await self.embedding_routes.batcher_for(model_name).embed(missing)))
+            embeddings = [encoded[chunk] if chunk in encoded else existing[chunk].embedding for chunk in chunks]
+            completed = await run_db(self.job_crud.complete_batch, batch,
+                                     self.embedding_routes.crud_for(model_name), embeddings)
+            if not completed:
+                logger.warning("Lease on batch %d of job %d expired, another worker took it over",
+                               batch.position, batch.job_id)
+        except Exception as e:
+            if isinstance(e, HTTPException) and e.status_code == 503:
+                # The inference queue or the connection pool is full: leave the batch for later
+                await run_db(self.job_crud.release_batch, batch)
+                return False
+            logger.exception("Batch %d of job %d failed", batch.position, batch.job_id)
+            await run_db(self.job_crud.fail_batch, batch, str(e) or type(e).__name__, self.max_attempts)
+        return True
@@ -0,0 +1,77 @@
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, Gauge, Histogram, generate_latest
+
+# Latency buckets from 0.5 ms to 10 s
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096)
+TOKEN_BUCKETS = (8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 65536)
+
+STAGE_SECONDS = Histogram(
+    'embedding_stage_seconds', 'Time spent in each stage of producing embeddings',
+    ['stage'], buckets=LATENCY_BUCKETS)
+REQUEST_SECONDS = Histogram(
+    'embedding_request_seconds', 'Route handler latency', ['method', 'route', 'status'], buckets=LATENCY_BUCKETS)
+DB_QUERY_SECONDS = Histogram(
+    'embedding_db_query_seconds', 'Database time per CRUD operation', ['operation'], buckets=LATENCY_BUCKETS)
+BATCH_SIZE = Histogram(
+    'embedding_batch_size', 'Texts per encode call', ['model'], buckets=SIZE_BUCKETS)
+CHUNK_TOKENS = Histogram(
+    'embedding_chunk_tokens', 'Tokens per encoded text', ['model'], buckets=TOKEN_BUCKETS)
+BATCH_TOKENS = Histogram(
+    'embedding_forward_tokens', 'Padded tokens per model forward pass', ['model'], buckets=TOKEN_BUCKETS)
+QUEUE_DEPTH = Gauge(
+    'embedding_inference_queue_depth', 'Encode jobs running or waiting on the inference pool')
+DB_POOL_CONNECTIONS = Gauge(
+    'embedding_db_pool_connections', 'Pooled database connections', ['state'])
+
+
+def observe_executor(executor):
+    """
+    Report the queue depth of an `InferenceExecutor` when metrics are scraped.
+    """
+    QUEUE_DEPTH.set_function(lambda: executor.queue_depth)
+
+
+def observe_database(database):
+    """
+    Report connection pool usage of a `Database` when metrics are scraped.
+    """
+    DB_POOL_CONNECTIONS.labels('in_use').set_function(lambda: len(database.database._in_use))
+    DB_POOL_CONNECTIONS.labels('idle').set_function(lambda: len(database.database._connections))
+
+
+def render() -> tuple:
+    """
+    Current metrics in the Prometheus text format, with their content type.
+    """
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording `embedding_request_seconds` per route template and status.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The route template keeps ids out of the label values
+            route = getattr(scope.get('route'), 'path', 'unmatched')
+            REQUEST_SECONDS.labels(scope['method'], route, str(status)).observe(time.perf_counter() - start)
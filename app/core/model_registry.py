@@ -0,0 +1,327 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = 'paraphrase-MiniLM-L3-v2'
+
+BACKENDS = ('torch', 'onnx', 'onnx-int8')
+
+# How vectors are stored and indexed: float32 or float16 columns, indexed as they are or
+# binary quantized (searched by Hamming distance, then reranked on the stored vectors)
+STORAGE_MODES = ('vector', 'halfvec', 'bit', 'halfvec-bit')
+
+
+def load_model(model_name: str = MODEL_NAME, backend: Optional[str] = None):
+    """
+    Load the model on the configured inference backend.
+
+    The ONNX backends export the model once to `EMBEDDING_ONNX_DIR` and serve it through ONNX
+    Runtime. `onnx-int8` additionally applies dynamic int8 quantization with the
+    `EMBEDDING_ONNX_QUANTIZATION` instruction set (`arm64`, `avx2`, `avx512` or `avx512_vnni`).
+
+    Args:
+        model_name (str): Hugging Face model name or local path.
+        backend (str): "torch", "onnx" or "onnx-int8". Defaults to `EMBEDDING_BACKEND`.
+    """
+    backend = (backend or os.getenv('EMBEDDING_BACKEND', 'torch')).lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend: {backend}")
+    # Imported here so that importing the app does not pull in torch
+    from sentence_transformers import SentenceTransformer
+
+    if backend == 'torch':
+        return SentenceTransformer(model_name)
+
+    export_dir = os.path.join(os.getenv('EMBEDDING_ONNX_DIR', 'models'), model_name.replace('/', '__'))
+    exported = None
+    if not os.path.exists(os.path.join(export_dir, 'onnx', 'model.onnx')):
+        # Loading a model without ONNX weights with backend="onnx" exports it
+        exported = SentenceTransformer(model_name, backend='onnx')
+        exported.save_pretrained(export_dir)
+    if backend == 'onnx':
+        return SentenceTransformer(export_dir, backend='onnx')
+
+    from sentence_transformers import export_dynamic_quantized_onnx_model
+
+    quantization = os.getenv('EMBEDDING_ONNX_QUANTIZATION', 'avx2').lower()
+    file_name = f'onnx/model_int8_{quantization}.onnx'
+    if not os.path.exists(os.path.join(export_dir, file_name)):
+        # The quantizer reads the model config next to the ONNX file, which only a fresh export has
+        exported = exported or SentenceTransformer(model_name, backend='onnx')
+        export_dynamic_quantized_onnx_model(exported, quantization, export_dir, file_suffix=f'int8_{quantization}')
+    return SentenceTransformer(export_dir, backend='onnx', model_kwargs={'file_name': file_name})
+
+
+def _model_entries():
+    """
+    `(name, dimension, storage)` of each `EMBEDDING_MODELS` entry, storage None when not given.
+    """
+    for item in os.getenv('EMBEDDING_MODELS', '').split(','):
+        if not item.strip():
+            continue
+        name, _, dimension = item.strip().rpartition(':')
+        storage = None
+        if dimension in STORAGE_MODES:
+            storage = dimension
+            name, _, dimension = name.rpartition(':')
+        if not name or not dimension.isdigit():
+            raise ValueError(f"EMBEDDING_MODELS entries must look like name:dimension[:storage], got {item!r}")
+        yield name, int(dimension), storage
+
+
+def configured_models() -> Dict[str, int]:
+    """
+    Models the service can serve, keyed by name with their vector dimension.
+
+    Read from `EMBEDDING_MODELS` as `name:dimension` pairs separated by commas, optionally
+    followed by a storage mode (`name:dimension:storage`). The first one is the default model.
+    Without it, only `MODEL_NAME` with `DIMENSION` dimensions is served.
+    """
+    models = {name: dimension for name, dimension, _ in _model_entries()}
+    return models or {MODEL_NAME: int(os.getenv('DIMENSION', 384))}
+
+
+def configured_storage() -> Dict[str, str]:
+    """
+    Storage mode of each configured model: its own from `EMBEDDING_MODELS`, else `EMBEDDING_STORAGE`.
+    """
+    default = os.getenv('EMBEDDING_STORAGE', 'vector').lower()
+    if default not in STORAGE_MODES:
+        raise ValueError(f"Unknown embedding storage: {default}")
+    storage = {name: mode or default for name, _, mode in _model_entries()}
+    return storage or {MODEL_NAME: default}
+
+
+def configured_projections() -> Dict[str, int]:
+    """
+    Projection version each model serves, from `EMBEDDING_PROJECTIONS` as comma-separated
+    `name:version` pairs. Models missing from it serve their full-dimension vectors.
+    """
+    projections = {}
+    for item in os.getenv('EMBEDDING_PROJECTIONS', '').split(','):
+        if not item.strip():
+            continue
+        name, _, version = item.strip().rpartition(':')
+        if not name or not version.isdigit():
+            raise ValueError(f"EMBEDDING_PROJECTIONS entries must look like name:version, got {item!r}")
+        projections[name] = int(version)
+    return projections
+
+
+def model_memory_bytes(model) -> int:
+    """
+    Approximate memory held by a model: the size of its torch parameters.
+    """
+    try:
+        return sum(parameter.numel() * parameter.element_size() for parameter in model.parameters())
+    except (AttributeError, TypeError):
+        return 0
+
+
+class ModelRegistry:
+    def __init__(self, model_name: Optional[str] = None, backend: Optional[str] = None,
+                 loader: Callable = load_model, models: Optional[Dict[str, int]] = None,
+                 memory_budget: Optional[int] = None, storage: Optional[Dict[str, str]] = None,
+                 projections: Optional[Dict[str, int]] = None, normalize: Optional[bool] = None):
+        """
+        Hold the embedding models, loading each on first use and evicting the least recently
+        used ones when the loaded models exceed the memory budget.
+
+        Args:
+            model_name (str): Default model, used when a request does not pick one. It is
+                never evicted. Defaults to the first configured model.
+            backend (str): Inference backend passed to `loader`. Defaults to `EMBEDDING_BACKEND`.
+            loader (Callable): Function mapping `(model_name, backend)` to a model.
+            models (Dict[str, int]): Servable models and their dimensions. Defaults to
+                `configured_models()`.
+            memory_budget (int): Bytes of model weights kept loaded. Defaults to
+                `EMBEDDING_MODEL_MEMORY_BUDGET`; `0` means no limit.
+            storage (Dict[str, str]): Storage mode per model, one of `STORAGE_MODES`. Models
+                missing from it use `EMBEDDING_STORAGE`. Defaults to `configured_storage()`.
+            projections (Dict[str, int]): Projection version served per model, see
+                `app.utils.projection`. Defaults to `configured_projections()`.
+            normalize (bool): Scale encoded vectors to unit length. Defaults to `EMBEDDING_NORMALIZE`.
+        """
+        self.models = dict(models or configured_models())
+        self.model_name = model_name or next(iter(self.models))
+        self.models.setdefault(self.model_name, int(os.getenv('DIMENSION', 384)))
+        self.storage = dict(storage if storage is not None else configured_storage())
+        self.projections = dict(projections if projections is not None else configured_projections())
+        self.normalize = normalize if normalize is not None \
+            else os.getenv('EMBEDDING_NORMALIZE', 'false').lower() == 'true'
+        self._projections = {}
+        self.backend = (backend or os.getenv('EMBEDDING_BACKEND', 'torch')).lower()
+        self.loader = loader
+        self.memory_budget = memory_budget if memory_budget is not None \
+            else int(os.getenv('EMBEDDING_MODEL_MEMORY_BUDGET', 0))
+        self.evictions = 0
+        self._loaded: "OrderedDict[str, object]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._states: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._load_locks = {name: threading.Lock() for name in self.models}
+
+    @property
+    def ready(self) -> bool:
+        return self.model_name in self._loaded
+
+    @property
+    def state(self) -> str:
+        return self._states.get(self.model_name, {}).get('state', 'not_loaded')
+
+    def resolve(self, model_name: Optional[str]) -> str:
+        """
+        Name of the model to use for a request, the default when none is given.
+
+        Raises:
+            KeyError: When the model is not configured.
+        """
+        if model_name is None:
+            return self.model_name
+        if model_name not in self.models:
+            raise KeyError(model_name)
+        return model_name
+
+    def storage_for(self, model_name: Optional[str] = None) -> str:
+        """
+        Storage mode of a model's vector table.
+        """
+        return self.storage.get(self.resolve(model_name)) or os.getenv('EMBEDDING_STORAGE', 'vector').lower()
+
+    def projection(self, model_name: Optional[str] = None):
+        """
+        The projection a model's vectors are reduced with, loaded from its file on first use,
+        or None when the model serves full-dimension vectors.
+        """
+        from app.utils.projection import Projection, projection_path
+
+        model_name = model_name or self.model_name
+        version = self.projections.get(model_name)
+        if version is None:
+            return None
+        if model_name not in self._projections:
+            projection = Projection.load(projection_path(model_name, version))
+            if projection.input_dimensions != self.models[model_name]:
+                raise ValueError(f"Projection {version} of {model_name} expects {projection.input_dimensions} "
+                                 f"dimensions, the model has {self.models[model_name]}")
+            self._projections[model_name] = projection
+        return self._projections[model_name]
+
+    def dimensions(self, model_name: Optional[str] = None) -> int:
+        """
+        Dimension of the vectors a model serves and stores, after any projection.
+        """
+        projection = self.projection(model_name)
+        return projection.output_dimensions if projection is not None else self.models[self.resolve(model_name)]
+
+    def vector_space(self, model_name: Optional[str] = None) -> str:
+        """
+        Name of the vectors a model serves under its projection and normalization, such as
+        `model@v2+l2`. Cached vectors are keyed by it, so changing either starts a fresh cache.
+        """
+        model_name = self.resolve(model_name)
+        version = self.projections.get(model_name)
+        return f"{model_name}{f'@v{version}' if version is not None else ''}{'+l2' if self.normalize else ''}"
+
+    def table(self, model_name: Optional[str] = None):
+        """
+        Table storing a model's vectors: `embedding` for the default model and
+        `embedding_<model>` for the others, with a `_p<version>` suffix while a projection is served.
+        The static `Embedding` class, sized by `DIMENSION`, only stands for the default model's
+        table when the model has that many dimensions.
+        """
+        from app.models.embedding_model import Embedding, embedding_table, model_table_suffix
+
+        model_name = self.resolve(model_name)
+        storage = self.storage_for(model_name)
+        table_name = 'embedding' if model_name == self.model_name else None
+        version = self.projections.get(model_name)
+        if version is not None:
+            table_name = f'{table_name or "embedding_" + model_table_suffix(model_name)}_p{version}'
+        elif (table_name and storage == 'vector'
+              and self.dimensions(model_name) == int(Embedding.embedding.dimensions)):
+            return Embedding
+        return embedding_table(model_name, self.dimensions(model_name), storage, table_name=table_name)
+
+    def get(self, model_name: Optional[str] = None):
+        """
+        Return a model, loading it first if needed. Concurrent callers wait for one load.
+        """
+        model_name = self.resolve(model_name)
+        with self._lock:
+            if model_name in self._loaded:
+                self._loaded.move_to_end(model_name)
+                return self._loaded[model_name]
+
+        with self._load_locks[model_name]:
+            with self._lock:
+                if model_name in self._loaded:
+                    self._loaded.move_to_end(model_name)
+                    return self._loaded[model_name]
+            self._states[model_name] = {'state': 'loading', 'load_seconds': None, 'error': None}
+            start = time.perf_counter()
+            try:
+                model = self.loader(model_name, self.backend)
+            except Exception as e:
+                self._states[model_name] = {'state': 'failed', 'load_seconds': None, 'error': str(e)}
+                raise
+            load_seconds = time.perf_counter() - start
+            with self._lock:
+                self._loaded[model_name] = model
+                self._sizes[model_name] = model_memory_bytes(model)
+                self._states[model_name] = {'state': 'ready', 'load_seconds': load_seconds, 'error': None}
+                self._evict(keep=model_name)
+            logger.info("Loaded %s (%s) in %.1fs", model_name, self.backend, load_seconds)
+            return model
+
+    def _evict(self, keep: str):
+        """
+        Drop least recently used models until the loaded ones fit the memory budget.
+        """
+        if self.memory_budget <= 0:
+            return
+        for name in list(self._loaded):
+            if sum(self._sizes.values()) <= self.memory_budget:
+                break
+            if name in (keep, self.model_name):
+                continue
+            del self._loaded[name]
+            del self._sizes[name]
+            self._states[name] = {'state': 'evicted', 'load_seconds': None, 'error': None}
+            self.evictions += 1
+            logger.info("Evicted %s to stay within the model memory budget", name)
+
+    def warm_up(self):
+        """
+        Load the default model and run one encode so the first request does not pay for either.
+        Failures are recorded in the status rather than raised.
+        """
+        try:
+            self.get().encode(["warm up"])
+        except Exception:
+            logger.exception("Warming up %s failed", self.model_name)
+
+    def start_warm_up(self) -> threading.Thread:
+        """
+        Run `warm_up` on a background thread and return the thread.
+        """
+        thread = threading.Thread(target=self.warm_up, name="model-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def status(self) -> dict:
+        default = self._states.get(self.model_name, {})
+        with self._lock:
+            loaded = {name: self._sizes[name] for name in self._loaded}
+        return {"model": self.model_name, "backend": self.backend, "state": self.state,
+                "load_seconds": default.get('load_seconds'), "error": default.get('error'),
+                "models": self.models, "loaded": loaded, "memory_bytes": sum(loaded.values()),
+                "memory_budget": self.memory_budget, "evictions": self.evictions}
+
+
+model_registry = ModelRegistry()
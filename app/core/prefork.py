@@ -0,0 +1,245 @@
+"""
+Serve the API from several worker processes that share one copy of the model weights.
+
+    python -m app.core.prefork [--workers 4] [--host 0.0.0.0] [--port 9002] [--share cow|shm] [--no-preload]
+
+The parent process builds the app once, which runs the startup migrations, loads the default
+model and binds the listening socket, then forks the workers. A forked worker sees the parent's
+memory copy-on-write, and inference only reads the weights, so their pages stay shared: N
+workers hold about one copy of the model instead of N. `--share shm` moves the weights to
+shared memory before forking, so they stay shared even if something writes to them. Each
+worker is pinned to its own slice of the CPUs and runs torch with one thread per CPU of its
+slice, so workers do not compete for cores.
+
+The parent only supervises: it restarts workers that exit and passes SIGTERM and SIGINT on to
+them. Each worker keeps its own caches and metrics. The in-memory FAISS tier cannot be kept
+in step across workers, so it is refused with more than one. The ONNX backends are not
+preloaded, as ONNX Runtime's thread pools do not survive a fork; each worker loads its own copy.
+"""
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+SHARE_MODES = ('cow', 'shm')
+
+
+def available_cpus() -> List[int]:
+    """
+    The CPUs this process may run on.
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def worker_cpus(index: int, workers: int, cpus: Optional[Sequence[int]] = None) -> List[int]:
+    """
+    The CPUs worker `index` of `workers` is pinned to: an even, contiguous slice of `cpus`, all
+    available CPUs by default. With fewer CPUs than workers, each worker gets one CPU, in turn.
+    """
+    cpus = sorted(available_cpus() if cpus is None else cpus)
+    if workers >= len(cpus):
+        return [cpus[index % len(cpus)]]
+    return cpus[index * len(cpus) // workers:(index + 1) * len(cpus) // workers]
+
+
+def set_torch_threads(threads: int):
+    """
+    Run torch, and the OpenMP and MKL pools it uses, with `threads` threads in this process.
+    The environment covers torch when it has not been imported yet.
+    """
+    for variable in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS'):
+        os.environ[variable] = str(threads)
+    if 'torch' in sys.modules:
+        sys.modules['torch'].set_num_threads(threads)
+
+
+def bind_socket(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    """
+    A listening socket the workers inherit and accept connections from.
+    """
+    sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class PreforkServer:
+    def __init__(self, app_factory: Optional[Callable] = None, registry=None, database=None,
+                 workers: Optional[int] = None, host: str = '0.0.0.0', port: int = 9002,
+                 share: Optional[str] = None, preload: Optional[bool] = None, pin: Optional[bool] = None,
+                 threads: Optional[int] = None, restart_delay: float = 1.0):
+        """
+        Serve the app from worker processes forked after the model is loaded.
+
+        Args:
+            app_factory (Callable): Builds the ASGI app, `app.main.create_app` by default.
+            registry (ModelRegistry): Registry whose default model is loaded before forking.
+            database (Database): Database whose pooled connections are closed before forking.
+            workers (int): Worker processes. Defaults to `EMBEDDING_PREFORK_WORKERS`, or one per CPU.
+            share (str): "cow" leaves the weights copy-on-write, "shm" moves them to shared memory.
+                Defaults to `EMBEDDING_PREFORK_SHARE`.
+            preload (bool): Load the model before forking. Defaults to `EMBEDDING_PREFORK_PRELOAD`,
+                and is always off for the ONNX backends.
+            pin (bool): Pin each worker to its slice of the CPUs. Defaults to `EMBEDDING_PREFORK_PIN`.
+            threads (int): torch threads per worker. Defaults to `EMBEDDING_TORCH_THREADS`, or
+                the number of CPUs in the worker's slice.
+            restart_delay (float): Seconds to wait before restarting a worker that exited.
+
+        Raises:
+            ValueError: For an unknown share mode, or the FAISS tier with more than one worker.
+        """
+        if registry is None:
+            from app.core.model_registry import model_registry
+            registry = model_registry
+        if database is None:
+            from app.database.database import database_instance
+            database = database_instance
+        if app_factory is None:
+            from app.main import create_app
+            app_factory = create_app
+        self.app_factory = app_factory
+        self.registry = registry
+        self.database = database
+        self.workers = workers or int(os.getenv('EMBEDDING_PREFORK_WORKERS', 0)) or len(available_cpus())
+        if self.workers > 1 and os.getenv('EMBEDDING_FAISS_ENABLED', 'false').lower() == 'true':
+            # Each worker would only index its own saves, and all would write the same snapshot
+            raise ValueError("EMBEDDING_FAISS_ENABLED needs a single process: the FAISS index is not "
+                             "shared between prefork workers")
+        self.host = host
+        self.port = port
+        self.share = (share or os.getenv('EMBEDDING_PREFORK_SHARE', 'cow')).lower()
+        if self.share not in SHARE_MODES:
+            raise ValueError(f"Unknown prefork share mode: {self.share}")
+        if preload is None:
+            preload = os.getenv('EMBEDDING_PREFORK_PRELOAD', 'true').lower() == 'true'
+        self.preload = preload and registry.backend == 'torch'
+        if preload and not self.preload:
+            logger.warning("The %s backend cannot be shared across a fork; each worker loads its own copy",
+                           registry.backend)
+        self.pin = pin if pin is not None else os.getenv('EMBEDDING_PREFORK_PIN', 'true').lower() == 'true'
+        self.threads = threads or int(os.getenv('EMBEDDING_TORCH_THREADS', 0)) or None
+        self.restart_delay = restart_delay
+        self.app = None
+        self.socket: Optional[socket.socket] = None
+        self.children: Dict[int, int] = {}
+        self.stopping = False
+
+    def run(self):
+        """
+        Build the app, load the model, fork the workers and supervise them until stopped.
+        """
+        self.app = self.app_factory()
+        if self.preload:
+            model = self.registry.get()
+            if self.share == 'shm':
+                model.share_memory()
+            logger.info("Loaded %s once for %d workers", self.registry.model_name, self.workers)
+        # Connections opened by the startup migrations must not be shared with the workers
+        self.database.close_pool()
+        self.socket = bind_socket(self.host, self.port)
+        # Objects created so far are never collected, so the collector does not write to their pages
+        gc.freeze()
+
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        try:
+            for index in range(self.workers):
+                self.spawn(index)
+            self.supervise()
+        finally:
+            self.socket.close()
+
+    def spawn(self, index: int) -> int:
+        """
+        Fork worker `index`; returns its pid in the parent.
+        """
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                self.serve(index)
+                code = 0
+            except BaseException:
+                logger.exception("Worker %d failed", index)
+            finally:
+                os._exit(code)
+        self.children[pid] = index
+        logger.info("Started worker %d (pid %d)", index, pid)
+        return pid
+
+    def serve(self, index: int):
+        """
+        Run the app in worker `index`, on its slice of the CPUs, until it is told to stop.
+        """
+        import uvicorn
+
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        cpus = worker_cpus(index, self.workers)
+        if self.pin and hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, cpus)
+        set_torch_threads(self.threads or len(cpus))
+        uvicorn.Server(uvicorn.Config(self.app, log_level='info')).run(sockets=[self.socket])
+
+    def supervise(self):
+        """
+        Wait for workers to exit, restarting them until `stop` is called.
+        """
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            index = self.children.pop(pid, None)
+            if index is None or self.stopping:
+                continue
+            logger.warning("Worker %d (pid %d) exited with status %d, restarting", index, pid,
+                           os.waitstatus_to_exitcode(status))
+            time.sleep(self.restart_delay)
+            if not self.stopping:
+                self.spawn(index)
+
+    def stop(self, signum=signal.SIGTERM, frame=None):
+        """
+        Stop restarting workers and ask the running ones to shut down.
+        """
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, help="Worker processes, one per CPU by default")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=9002)
+    parser.add_argument("--share", choices=SHARE_MODES, help="Leave the weights copy-on-write, or move them to "
+                                                             "shared memory before forking")
+    parser.add_argument("--threads", type=int, help="torch threads per worker, its CPUs by default")
+    parser.add_argument("--no-preload", dest="preload", action="store_false", default=None,
+                        help="Let every worker load its own copy of the model")
+    parser.add_argument("--no-pin", dest="pin", action="store_false", default=None,
+                        help="Leave workers free to run on any CPU")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    PreforkServer(workers=args.workers, host=args.host, port=args.port, share=args.share, preload=args.preload,
+                  pin=args.pin, threads=args.threads).run()
+
+
+if __name__ == "__main__":
+    main()
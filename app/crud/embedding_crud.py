@@ -1,35 +1,607 @@
+import io
 import json
-from typing import Optional, List
+import os
+import struct
+import time
+from functools import partial
+from typing import Any, Optional, List, Tuple, Dict, Type
 
 import numpy as np
 from fastapi import HTTPException
+from peewee import PostgresqlDatabase, SQL, fn
 
-from app.models.embedding_model import Embedding
+from app.core.metrics import DB_QUERY_SECONDS
+from app.models.embedding_model import BINARY_INDEX_STORAGE, Embedding, HALF_PRECISION_STORAGE, encode_metadata, \
+    hash_content
+from app.utils.embedding_id_cache import EmbeddingIdCache
+
+# Header of a PostgreSQL binary COPY stream: signature, flags and header-extension length
+COPY_BINARY_HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('>ii', 0, 0)
+COPY_BINARY_TRAILER = struct.pack('>h', -1)
+
+# Search metric -> VectorField distance operator. Inner product is negated so smaller is closer.
+DISTANCE_METHODS = {
+    'cosine': 'cosine_distance',
+    'l2': 'l2_distance',
+    'inner_product': 'max_inner_product',
+}
+DISTANCE_OPERATORS = {
+    'cosine': '<=>',
+    'l2': '<->',
+    'inner_product': '<#>',
+}
+# SQLSTATE of a unique constraint violation
+UNIQUE_VIOLATION = '23505'
+# Default and largest hnsw.ef_search of pgvector
+DEFAULT_EF_SEARCH = 40
+MAX_EF_SEARCH = 1000
+# Columns a search returns of each row
+ROW_COLUMNS = '"id", "text", "metadata", "document_id", "chunk_start", "chunk_end", "embedding"'
+# First pgvector release whose index scans can continue past their candidate list to satisfy a filter
+ITERATIVE_SCAN_VERSION = (0, 8)
 
 
 class EmbeddingCRUD:
-    def __init__(self):
-        pass
-    def save_embedding(self, chunks: List[str], embeddings: List[List[float]]) -> List[Embedding]:
+    def __init__(self, insert_batch_size: Optional[int] = None, copy_threshold: Optional[int] = None,
+                 faiss_index=None, table: Type[Embedding] = Embedding, id_cache: Optional[EmbeddingIdCache] = None,
+                 rerank_factor: Optional[int] = None, hybrid_search: Optional[bool] = None,
+                 hybrid_candidates: Optional[int] = None, rrf_k: Optional[int] = None,
+                 text_search_config: Optional[str] = None):
+        """
+        Args:
+            insert_batch_size (int): Rows per multi-row INSERT statement.
+            copy_threshold (int): Batches at least this large are written with binary COPY
+                when the database is PostgreSQL.
+            faiss_index (FaissIndex): In-memory index kept in sync with saved embeddings
+                and used to answer searches it supports.
+            table (Type[Embedding]): Table the embeddings are stored in, one per model.
+            id_cache (EmbeddingIdCache): Cache in front of `get_embedding_by_id`.
+            rerank_factor (int): In binary storage modes, searches for `k` results rerank the
+                `k * rerank_factor` nearest candidates by Hamming distance.
+            hybrid_search (bool): Whether the table has the `text_search` column hybrid search
+                needs. Defaults to `EMBEDDING_HYBRID_SEARCH`.
+            hybrid_candidates (int): Rows each side of a hybrid search ranks. Defaults to
+                `EMBEDDING_HYBRID_CANDIDATES`.
+            rrf_k (int): Reciprocal rank fusion constant; larger values flatten the weight of the
+                top ranks. Defaults to `EMBEDDING_RRF_K`.
+            text_search_config (str): PostgreSQL text search configuration the `text_search`
+                column is built with. Defaults to `EMBEDDING_TEXT_SEARCH_CONFIG`.
+        """
+        self.insert_batch_size = insert_batch_size or int(os.getenv('EMBEDDING_INSERT_BATCH_SIZE', 500))
+        self.copy_threshold = copy_threshold or int(os.getenv('EMBEDDING_COPY_THRESHOLD', 100))
+        self.faiss_index = faiss_index
+        self.table = table
+        self.id_cache = id_cache or EmbeddingIdCache()
+        self.rerank_factor = rerank_factor or int(os.getenv('EMBEDDING_RERANK_FACTOR', 20))
+        self.hybrid_search_enabled = hybrid_search if hybrid_search is not None \
+            else os.getenv('EMBEDDING_HYBRID_SEARCH', 'false').lower() == 'true'
+        self.hybrid_candidates = hybrid_candidates or int(os.getenv('EMBEDDING_HYBRID_CANDIDATES', 50))
+        self.rrf_k = rrf_k or int(os.getenv('EMBEDDING_RRF_K', 60))
+        self.text_search_config = text_search_config or os.getenv('EMBEDDING_TEXT_SEARCH_CONFIG', 'english')
+        self._iterative_scan = None
+
+    def for_table(self, table: Type[Embedding]) -> 'EmbeddingCRUD':
+        """
+        A CRUD with the same settings working on another model's table. The FAISS index only
+        mirrors the default table and ids are cached per table.
+        """
+        return EmbeddingCRUD(self.insert_batch_size, self.copy_threshold, table=table,
+                             id_cache=EmbeddingIdCache(self.id_cache.ttl, self.id_cache.max_bytes),
+                             rerank_factor=self.rerank_factor, hybrid_search=self.hybrid_search_enabled,
+                             hybrid_candidates=self.hybrid_candidates, rrf_k=self.rrf_k,
+                             text_search_config=self.text_search_config)
+
+    def save_embedding(self, chunks: List[str], embeddings: List[List[float]], tenant: str = '',
+                       metadata: Optional[Dict[str, Any]] = None,
+                       sources: Optional[List[Tuple[str, int, int]]] = None) -> List[Embedding]:
+        """
+        Save the embeddings in a single transaction, once per distinct text and metadata of a tenant.
+
+        A chunk the tenant already holds (same `content_hash`), or that repeats within `chunks`,
+        keeps its existing row: it is neither rewritten nor added to the vector index again.
+        Inserts skip such rows with ON CONFLICT DO NOTHING. COPY cannot, so a COPY that hits
+        one is rolled back, the saved chunks are looked up and only the others are copied.
+
+        Args:
+            tenant (str): Tenant the chunks belong to, which searches can be restricted to.
+            metadata (Dict[str, Any]): JSON object stored with every chunk, which searches can
+                filter on. It is part of the content hash: the same text with other metadata is
+                another row.
+            sources (List[Tuple[str, int, int]]): Per chunk split from a document, the document id
+                and the chunk's start and end character offsets in it. Also part of the content hash.
+
+        Returns:
+            List[Embedding]: Saved or existing instances, in the same order as `chunks`.
+        """
+        if not chunks:
+            return []
+        sources = sources or [None] * len(chunks)
+        hashes = [hash_content(chunk, metadata, source) for chunk, source in zip(chunks, sources)]
+        database = self.table._meta.database
+        use_copy = isinstance(database, PostgresqlDatabase) and len(chunks) >= self.copy_threshold
+        with DB_QUERY_SECONDS.labels('copy' if use_copy else 'insert').time(), database.atomic():
+            ids, inserted, rows = {}, None, list(zip(chunks, hashes, embeddings, sources))
+            if use_copy:
+                inserted = self._try_copy(database, rows, tenant, metadata)
+                if inserted is None:
+                    # Some chunks are saved already or repeat: copy each other one once
+                    ids = self._ids_by_hash(set(hashes), tenant)
+                    new_rows = {}
+                    for row in rows:
+                        if row[1] not in ids:
+                            new_rows.setdefault(row[1], row)
+                    rows = list(new_rows.values())
+                    inserted = self._try_copy(database, rows, tenant, metadata) if rows else []
+            if inserted is None:
+                # Also when a concurrent request saved some of the chunks since the lookup
+                inserted = self._insert_embeddings(rows, tenant, metadata)
+            ids.update(inserted)
+            existing = set(hashes) - set(ids)
+            if existing:
+                # Saved before, or by a concurrent request this insert waited for
+                ids.update(self._ids_by_hash(existing, tenant))
+        new_ids = [embedding_id for _, embedding_id in inserted]
+        # A new id can still be cached if it was handed out before: the SQLite stand-in reuses the
+        # highest id after a delete, and PostgreSQL does after its sequence is reset
+        self.id_cache.invalidate(new_ids)
+        if self.faiss_index is not None and new_ids:
+            position = {content_hash: index for index, content_hash in reversed(list(enumerate(hashes)))}
+            vectors = [embeddings[position[content_hash]] for content_hash, _ in inserted]
+            # Only once the rows are committed, which inside a caller's transaction is when that
+            # commits, so the index never holds rows that were rolled back
+            on_commit = getattr(database, 'on_commit', None)
+            if on_commit is None:
+                self.faiss_index.add(new_ids, vectors)
+            else:
+                on_commit(partial(self.faiss_index.add, new_ids, vectors))
+        return [self.table(id=ids[content_hash], text=chunk, tenant=tenant, metadata=metadata, embedding=embedding,
+                           **self._source_values(source))
+                for content_hash, chunk, embedding, source in zip(hashes, chunks, embeddings, sources)]
+
+    @staticmethod
+    def _source_values(source: Optional[Tuple[str, int, int]]) -> Dict[str, Any]:
+        document_id, start, end = source or (None, None, None)
+        return {"document_id": document_id, "chunk_start": start, "chunk_end": end}
+
+    def _try_copy(self, database: PostgresqlDatabase, rows, tenant: str = '',
+                  metadata: Optional[Dict[str, Any]] = None) -> Optional[List[Tuple[str, int]]]:
+        """
+        COPY `(text, content hash, embedding, source)` rows in a savepoint. Returns None, having
+        written nothing, when one of them is saved already or repeats.
+        """
+        try:
+            with database.atomic():
+                return self._copy_embeddings(database, *map(list, zip(*rows)), tenant=tenant, metadata=metadata)
+        except Exception as error:
+            if getattr(error, 'pgcode', None) != UNIQUE_VIOLATION:
+                raise
+            return None
+
+    def _insert_embeddings(self, rows, tenant: str = '',
+                           metadata: Optional[Dict[str, Any]] = None) -> List[Tuple[str, int]]:
+        """
+        Write `(text, content hash, embedding, source)` rows with multi-row INSERT ... ON CONFLICT DO
+        NOTHING RETURNING statements.
+
+        Returns:
+            List[Tuple[str, int]]: Content hash and id of each inserted row.
         """
-        Save the embedding as a list in the database.
+        inserted = []
+        for start in range(0, len(rows), self.insert_batch_size):
+            values = [{"text": chunk, "content_hash": content_hash, "tenant": tenant, "metadata": metadata,
+                       "embedding": embedding, **(self._source_values(source) if source else {})}
+                      for chunk, content_hash, embedding, source in rows[start:start + self.insert_batch_size]]
+            query = (self.table.insert_many(values).on_conflict_ignore()
+                     .returning(self.table.content_hash, self.table.id).tuples())
+            inserted.extend(query.execute())
+        return inserted
+
+    def _copy_embeddings(self, database: PostgresqlDatabase, chunks: List[str], hashes: List[str],
+                         embeddings: List[List[float]], sources: Optional[list] = None, tenant: str = '',
+                         metadata: Optional[Dict[str, Any]] = None) -> List[Tuple[str, int]]:
+        """
+        Write rows with a binary COPY.
+
+        COPY cannot return generated keys, so ids are reserved from the sequence first
+        and written explicitly, which also pins them to input order.
+
+        Returns:
+            List[Tuple[str, int]]: Content hash and id of each row.
+        """
+        table = self.table._meta.table_name
+        cursor = database.execute_sql(
+            "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+            (table, len(chunks)))
+        ids = sorted(row[0] for row in cursor.fetchall())
+
+        now = int(time.time())
+        # halfvec shares the vector binary layout with float2 values
+        dtype = '>f2' if self.table.storage in HALF_PRECISION_STORAGE else '>f4'
+        null_field = struct.pack('>i', -1)
+        tenant_bytes = tenant.encode('utf-8')
+        tenant_field = struct.pack('>i', len(tenant_bytes)) + tenant_bytes
+        if metadata is None:
+            metadata_field = null_field
+        else:
+            # jsonb binary format: a version byte, then the JSON text
+            metadata_bytes = b'\x01' + encode_metadata(metadata).encode('utf-8')
+            metadata_field = struct.pack('>i', len(metadata_bytes)) + metadata_bytes
+        buffer = io.BytesIO()
+        buffer.write(COPY_BINARY_HEADER)
+        for embedding_id, chunk, content_hash, embedding, source in zip(ids, chunks, hashes, embeddings,
+                                                                        sources or [None] * len(chunks)):
+            vector = np.asarray(embedding, dtype=dtype)
+            text = chunk.encode('utf-8')
+            buffer.write(struct.pack('>hii', 11, 4, embedding_id))
+            buffer.write(struct.pack('>i', len(text)))
+            buffer.write(text)
+            buffer.write(struct.pack('>i', len(content_hash)))
+            buffer.write(content_hash.encode('ascii'))
+            buffer.write(tenant_field)
+            buffer.write(metadata_field)
+            if source is None:
+                buffer.write(null_field * 3)
+            else:
+                document_id = source[0].encode('utf-8')
+                buffer.write(struct.pack('>i', len(document_id)))
+                buffer.write(document_id)
+                buffer.write(struct.pack('>iiii', 4, source[1], 4, source[2]))
+            # pgvector binary format: dimensions, unused, then big-endian float values
+            buffer.write(struct.pack('>iHH', 4 + vector.nbytes, vector.shape[0], 0))
+            buffer.write(vector.tobytes())
+            buffer.write(struct.pack('>iqiq', 8, now, 8, now))
+        buffer.write(COPY_BINARY_TRAILER)
+        buffer.seek(0)
+
+        database.cursor().copy_expert(
+            f'COPY "{table}" ("id", "text", "content_hash", "tenant", "metadata", "document_id", "chunk_start", '
+            f'"chunk_end", "embedding", "created_at", "updated_at") '
+            f'FROM STDIN WITH (FORMAT BINARY)', buffer)
+        return list(zip(hashes, ids))
+
+    def _content_hash_condition(self, hashes: List[str]):
+        if isinstance(self.table._meta.database, PostgresqlDatabase):
+            # One array parameter instead of one placeholder per hash
+            return self.table.content_hash == SQL('ANY(%s)', (hashes,))
+        return self.table.content_hash.in_(hashes)
+
+    def _ids_by_hash(self, hashes, tenant: str = '') -> Dict[str, int]:
+        query = (self.table
+                 .select(self.table.content_hash, self.table.id)
+                 .where((self.table.tenant == tenant) & self._content_hash_condition(list(hashes)))
+                 .tuples())
+        return dict(query)
+
+    def find_by_hash(self, hashes: List[str], tenant: str = '') -> Dict[str, int]:
+        """
+        Ids of the rows of `tenant` with these content hashes, keyed by hash. Hashes without a
+        row are absent from the result.
         """
-        embedding_instances = []
-        for chunk, embedding in zip(chunks, embeddings):
-            embedding_instance = Embedding.create(
-                text=chunk,
-                embedding=embedding  # Save as string representation of a list
-            )
-            embedding_instances.append(embedding_instance)
-        return embedding_instances
+        if not hashes:
+            return {}
+        with DB_QUERY_SECONDS.labels('get_by_content').time():
+            return self._ids_by_hash(hashes, tenant)
+
+    def find_by_content(self, chunks: List[str], include_embedding: bool = True, tenant: str = '',
+                        metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Embedding]:
+        """
+        Rows of `tenant` already holding these exact texts with this metadata, keyed by text,
+        found with one lookup of their hashes in the unique `(tenant, content_hash)` index.
+        Texts without a row are absent from the result.
+
+        On PostgreSQL vectors are read in pgvector's binary format, which NumPy reads
+        directly instead of parsing the text of every value.
+        """
+        if not chunks:
+            return {}
+        texts = {hash_content(chunk, metadata): chunk for chunk in chunks}
+        binary = include_embedding and isinstance(self.table._meta.database, PostgresqlDatabase)
+        half = self.table.storage in HALF_PRECISION_STORAGE
+        columns = [self.table.id, self.table.content_hash]
+        if binary:
+            send = fn.halfvec_send if half else fn.vector_send
+            columns.append(send(self.table.embedding).coerce(False).alias('embedding_binary'))
+        elif include_embedding:
+            columns.append(self.table.embedding)
+        with DB_QUERY_SECONDS.labels('get_by_content').time():
+            found = {}
+            condition = (self.table.tenant == tenant) & self._content_hash_condition(list(texts))
+            for instance in self.table.select(*columns).where(condition):
+                instance.text, instance.tenant, instance.metadata = texts[instance.content_hash], tenant, metadata
+                if binary:
+                    # Dimensions and an unused field, then big-endian values, as COPY writes them
+                    instance.embedding = np.frombuffer(instance.embedding_binary, '>f2' if half else '>f4',
+                                                       offset=4).astype(np.float32)
+                found[instance.text] = instance
+            return found
 
     def get_embedding_by_id(self, embedding_id: int):
-        embedding_instance = Embedding.get_or_none(Embedding.id == embedding_id)
+        """
+        Return `(instance, vector)` for an id, or None when it does not exist.
+
+        Reads go through `id_cache`, so popular ids skip the query and the vector parsing.
+        The instance carries only `id`, `text` and `embedding`.
+        """
+        cached = self.id_cache.get(embedding_id, self._load_embedding)
+        if cached is None:
+            return None
+        text, vector = cached
+        return self.table(id=embedding_id, text=text, embedding=vector), vector
+
+    def _load_embedding(self, embedding_id: int) -> Optional[Tuple[str, np.ndarray]]:
+        with DB_QUERY_SECONDS.labels('get_by_id').time():
+            embedding_instance = self.table.get_or_none(self.table.id == embedding_id)
         try:
 
             if embedding_instance:
-                return embedding_instance, embedding_instance.embedding
+                return embedding_instance.text, embedding_instance.embedding
         except Exception:
             raise HTTPException(status_code=404, detail="Embedding not found")
         return None
 
+    def delete_embeddings(self, embedding_ids: List[int]) -> int:
+        """
+        Delete embeddings by id and drop them from the id cache.
+
+        The FAISS index keeps their vectors until it is rebuilt; searches loading rows skip them.
+
+        Returns:
+            int: Number of rows deleted.
+        """
+        if not embedding_ids:
+            return 0
+        with DB_QUERY_SECONDS.labels('delete').time():
+            deleted = self.table.delete().where(self.table.id.in_(list(embedding_ids))).execute()
+        self.id_cache.invalidate(embedding_ids)
+        return deleted
+
+    def get_embeddings_by_ids(self, embedding_ids: List[int], include_text: bool = True,
+                              include_embedding: bool = True) -> Dict[int, Embedding]:
+        """
+        Fetch many embeddings in one query, keyed by id. Missing ids are absent from the result.
+
+        Columns that are not requested are not read from the database.
+        """
+        if not embedding_ids:
+            return {}
+        ids = list(set(embedding_ids))
+        columns = [self.table.id]
+        if include_text:
+            columns.append(self.table.text)
+        if include_embedding:
+            columns.append(self.table.embedding)
+        if isinstance(self.table._meta.database, PostgresqlDatabase):
+            # One array parameter instead of one placeholder per id
+            condition = self.table.id == SQL('ANY(%s)', (ids,))
+        else:
+            condition = self.table.id.in_(ids)
+        with DB_QUERY_SECONDS.labels('get_by_ids').time():
+            return {instance.id: instance for instance in self.table.select(*columns).where(condition)}
+
+    def iter_embeddings_after(self, embedding_id: int):
+        """
+        Yield `(id, vector)` for every row with a greater id, in id order.
+        """
+        query = (self.table
+                 .select(self.table.id, self.table.embedding)
+                 .where(self.table.id > embedding_id)
+                 .order_by(self.table.id)
+                 .tuples())
+        return query.iterator()
+
+    def search_embeddings(self, vector: List[float], k: int, metric: str = 'cosine',
+                          ef_search: Optional[int] = None, probes: Optional[int] = None,
+                          with_rows: bool = True, tenant: Optional[str] = None,
+                          metadata: Optional[Dict[str, Any]] = None) -> List[Tuple[Embedding, float]]:
+        """
+        Return the `k` nearest embeddings to `vector`, closest first.
+
+        Searches the FAISS index when it supports `metric` and no filter is given, otherwise
+        PostgreSQL. See `_search_filtered` for how filtered searches keep returning `k` rows.
+
+        Args:
+            ef_search (int): HNSW candidate list size for this query only.
+            probes (int): IVF lists to scan for this query only.
+            with_rows (bool): Load text and vectors for FAISS hits. When False, FAISS
+                results carry only ids and no query reaches the database.
+            tenant (str): Only search rows of this tenant.
+            metadata (Dict[str, Any]): Only search rows whose metadata contains this JSON object.
+        """
+        filter_sql, filter_params = self._filter_sql(tenant, metadata)
+        if self.faiss_index is not None and self.faiss_index.supports(metric) and not filter_sql:
+            with DB_QUERY_SECONDS.labels('faiss_search').time():
+                hits = self.faiss_index.search(vector, k, ef_search=ef_search, probes=probes)
+            if not with_rows:
+                return [(self.table(id=embedding_id), distance) for embedding_id, distance in hits]
+            with DB_QUERY_SECONDS.labels('get_by_ids').time():
+                rows = {row.id: row for row in self.table.select().where(self.table.id.in_([i for i, _ in hits]))}
+            return [(rows[embedding_id], distance) for embedding_id, distance in hits if embedding_id in rows]
+
+        if self.table.storage in BINARY_INDEX_STORAGE:
+            return self._search_binary_quantized(vector, k, metric, ef_search, probes, tenant, metadata)
+
+        distance = getattr(self.table.embedding, DISTANCE_METHODS[metric])(vector)
+        database = self.table._meta.database
+        # SET LOCAL keeps the tuning scoped to this transaction
+        with DB_QUERY_SECONDS.labels('search').time(), database.atomic():
+            if ef_search:
+                database.execute_sql(f"SET LOCAL hnsw.ef_search = {int(ef_search)}")
+            if probes:
+                database.execute_sql(f"SET LOCAL ivfflat.probes = {int(probes)}")
+            query = (self.table
+                     .select(self.table.id, self.table.text, self.table.metadata, self.table.document_id,
+                             self.table.chunk_start, self.table.chunk_end, self.table.embedding,
+                             distance.alias('distance'))
+                     .order_by(distance)
+                     .limit(k))
+            if not filter_sql:
+                return [(instance, instance.distance) for instance in query]
+            query = query.where(SQL(filter_sql, filter_params))
+            results = self._search_filtered(database, lambda: [(instance, instance.distance)
+                                                               for instance in query.clone()], k)
+            # IVFFlat iterative scans return rows slightly out of order
+            return sorted(results, key=lambda result: result[1])
+
+    def _search_binary_quantized(self, vector: List[float], k: int, metric: str, ef_search: Optional[int],
+                                 probes: Optional[int], tenant: Optional[str] = None,
+                                 metadata: Optional[Dict[str, Any]] = None) -> List[Tuple[Embedding, float]]:
+        """
+        Two-pass search for tables indexed on binary-quantized vectors: the index returns the
+        `k * rerank_factor` nearest candidates by Hamming distance, which are then reranked by
+        the exact `metric` distance to their stored vectors.
+        """
+        sql, params, index_rows = self._nearest_sql(vector, metric, k, tenant=tenant, metadata=metadata)
+        database = self.table._meta.database
+        with DB_QUERY_SECONDS.labels('search').time(), database.atomic():
+            self._tune_index(database, ef_search, probes, index_rows)
+            if tenant is None and not metadata:
+                return [(instance, instance.distance) for instance in self.table.raw(sql, *params)]
+            return self._search_filtered(database, lambda: [(instance, instance.distance)
+                                                            for instance in self.table.raw(sql, *params)], k)
+
+    def _search_filtered(self, database, search, k: int) -> list:
+        """
+        Run `search`, a filtered query of the `k` nearest rows, in the current transaction.
+
+        An ANN index scan reads a fixed number of candidates (`hnsw.ef_search`, or the rows of
+        `ivfflat.probes` lists) before the filter is applied, so a selective filter can leave
+        fewer than `k` of them. With pgvector 0.8 the scan is made iterative: the index keeps
+        returning candidates until `k` pass the filter (IVFFlat ones slightly out of order).
+        A search still short of `k` rows, on older pgvector or when the scan gives up, runs once
+        more with index scans disabled: an exact search over the filtered rows, which the
+        planner finds through the `(tenant, content_hash)` or metadata index. A tenant with a
+        partial index or partition of its own is searched through that and rarely needs it.
+        """
+        if self._iterative_scans(database):
+            database.execute_sql("SET LOCAL hnsw.iterative_scan = strict_order")
+            database.execute_sql("SET LOCAL ivfflat.iterative_scan = relaxed_order")
+        results = search()
+        if len(results) < k:
+            database.execute_sql("SET LOCAL enable_indexscan = off")
+            results = search()
+        return results
+
+    def _iterative_scans(self, database) -> bool:
+        """
+        Whether the installed pgvector supports iterative index scans, checked once.
+        """
+        if self._iterative_scan is None:
+            row = database.execute_sql("SELECT extversion FROM pg_extension WHERE extname = 'vector'").fetchone()
+            version = tuple(int(part) for part in row[0].split('.')[:2]) if row else ()
+            self._iterative_scan = version >= ITERATIVE_SCAN_VERSION
+        return self._iterative_scan
+
+    @staticmethod
+    def _filter_sql(tenant: Optional[str] = None, metadata: Optional[Dict[str, Any]] = None) -> Tuple[str, list]:
+        """
+        SQL condition restricting rows to `tenant` and to metadata containing `metadata`, with
+        its parameters; empty without either. Containment (`@>`) is what the GIN index on
+        `metadata` serves.
+        """
+        conditions, params = [], []
+        if tenant is not None:
+            # Compared as a literal, so the planner can match a tenant's partial index or partition
+            conditions.append('"tenant" = %s')
+            params.append(tenant)
+        if metadata:
+            conditions.append('"metadata" @> %s::jsonb')
+            params.append(encode_metadata(metadata))
+        return ' AND '.join(conditions), params
+
+    def hybrid_search(self, text: str, vector: List[float], k: int, metric: str = 'cosine',
+                      ef_search: Optional[int] = None, probes: Optional[int] = None,
+                      candidates: Optional[int] = None, tenant: Optional[str] = None,
+                      metadata: Optional[Dict[str, Any]] = None) -> List[Tuple[Embedding, float]]:
+        """
+        Fuse full-text and vector search with reciprocal rank fusion, in one statement.
+
+        The full-text side ranks rows matching `text` by `ts_rank_cd`, normalized by document
+        length as BM25 does, over the GIN-indexed `text_search` column. `text` is read as a web
+        search: every term must match unless joined by `or`, with `"quoted phrases"` and
+        `-excluded` terms. PostgreSQL ranking has no inverse document frequency, so matching any
+        term would let common words outrank a rare identifier. The vector side ranks the nearest
+        rows to `vector` through the ANN index. Each takes its best `candidates`
+        rows, and a row scores the sum of `1 / (rrf_k + rank)` over the rankings it is in.
+        `tenant` and `metadata` filter both sides, as in `search_embeddings`.
+
+        Returns:
+            List[Tuple[Embedding, float]]: Rows and their fused score, best first. Rows also
+            carry `distance`, `vector_rank` and `text_rank`, None where a side missed them.
+
+        Raises:
+            HTTPException: 400 when hybrid search is not enabled.
+        """
+        if not self.hybrid_search_enabled:
+            raise HTTPException(status_code=400, detail="Hybrid search is not enabled")
+        candidates = max(candidates or self.hybrid_candidates, k)
+        vector_sql, vector_params, index_rows = self._nearest_sql(vector, metric, candidates, columns='"id"',
+                                                                  tenant=tenant, metadata=metadata)
+        filter_sql, filter_params = self._filter_sql(tenant, metadata)
+        table = self.table._meta.table_name
+        sql = (f'WITH "vector_hits" AS ({vector_sql}), '
+               f'"ranked_vector_hits" AS (SELECT "id", "distance", '
+               f'row_number() OVER (ORDER BY "distance", "id") AS "rank" FROM "vector_hits"), '
+               f'"text_query" AS (SELECT websearch_to_tsquery(%s::regconfig, %s) AS "query"), '
+               f'"text_hits" AS (SELECT "id", row_number() OVER '
+               f'(ORDER BY ts_rank_cd("text_search", "query", 1) DESC, "id") AS "rank" '
+               f'FROM "{table}", "text_query" WHERE "text_search" @@ "query" '
+               f'{"AND " + filter_sql if filter_sql else ""} ORDER BY "rank" LIMIT %s), '
+               f'"fused" AS (SELECT coalesce(v."id", t."id") AS "id", v."distance", v."rank" AS "vector_rank", '
+               f't."rank" AS "text_rank", '
+               f'coalesce(1.0 / (%s + v."rank"), 0) + coalesce(1.0 / (%s + t."rank"), 0) AS "score" '
+               f'FROM "ranked_vector_hits" v FULL OUTER JOIN "text_hits" t ON v."id" = t."id") '
+               f'SELECT e."id", e."text", e."metadata", e."document_id", e."chunk_start", e."chunk_end", '
+               f'e."embedding", f."distance", f."vector_rank", '
+               f'f."text_rank", '
+               f'f."score"::float8 AS "score" '
+               f'FROM "fused" f JOIN "{table}" e ON e."id" = f."id" ORDER BY f."score" DESC, f."id" LIMIT %s')
+        params = [*vector_params, self.text_search_config, text, *filter_params, candidates, self.rrf_k, self.rrf_k,
+                  k]
+        database = self.table._meta.database
+        with DB_QUERY_SECONDS.labels('hybrid_search').time(), database.atomic():
+            self._tune_index(database, ef_search, probes, index_rows)
+            if not filter_sql:
+                return [(instance, instance.score) for instance in self.table.raw(sql, *params)]
+            # Short of `k` rows only when the vector side was, as either side alone ranks `candidates`
+            return self._search_filtered(database, lambda: [(instance, instance.score)
+                                                            for instance in self.table.raw(sql, *params)], k)
+
+    def _nearest_sql(self, vector: List[float], metric: str, limit: int,
+                     columns: str = ROW_COLUMNS, tenant: Optional[str] = None,
+                     metadata: Optional[Dict[str, Any]] = None) -> Tuple[str, list, int]:
+        """
+        SQL selecting `columns` and `distance` of the `limit` rows nearest to `vector` through
+        the table's ANN index, nearest first, among those passing the `tenant` and `metadata`
+        filter. Binary storage modes rerank `limit * rerank_factor` Hamming-distance candidates.
+
+        Returns:
+            Tuple[str, list, int]: The SQL, its parameters and the rows it reads from the index.
+        """
+        table = self.table._meta.table_name
+        dimensions = int(self.table.embedding.dimensions)
+        cast = f"{self.table.embedding.field_type}({dimensions})"
+        query_vector = self.table.embedding.db_value(vector)
+        distance = f'"embedding" {DISTANCE_OPERATORS[metric]} %s::{cast} AS "distance"'
+        filter_sql, filter_params = self._filter_sql(tenant, metadata)
+        where = f'WHERE {filter_sql} ' if filter_sql else ''
+        if self.table.storage not in BINARY_INDEX_STORAGE:
+            return f'SELECT {columns}, {distance} FROM "{table}" {where}ORDER BY "distance" LIMIT %s', \
+                [query_vector, *filter_params, limit], limit
+        index_rows = limit * self.rerank_factor
+        sql = (f'SELECT {columns}, {distance} '
+               f'FROM (SELECT {ROW_COLUMNS} FROM "{table}" {where}'
+               f'ORDER BY binary_quantize("embedding")::bit({dimensions}) <~> binary_quantize(%s::{cast}) '
+               f'LIMIT %s) AS "candidates" ORDER BY "distance" LIMIT %s')
+        return sql, [query_vector, *filter_params, query_vector, index_rows, limit], index_rows
+
+    @staticmethod
+    def _tune_index(database, ef_search: Optional[int], probes: Optional[int], index_rows: int):
+        """
+        Scope index tuning to the current transaction. HNSW returns at most ef_search rows, so it
+        is raised to cover every row the query reads from the index.
+        """
+        if ef_search or index_rows > DEFAULT_EF_SEARCH:
+            database.execute_sql(f"SET LOCAL hnsw.ef_search = "
+                                 f"{min(max(int(ef_search or 0), index_rows), MAX_EF_SEARCH)}")
+        if probes:
+            database.execute_sql(f"SET LOCAL ivfflat.probes = {int(probes)}")
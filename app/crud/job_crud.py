@@ -0,0 +1,190 @@
+import json
+import time
+from typing import List, Optional
+
+from peewee import PostgresqlDatabase, fn
+
+from app.core.metrics import DB_QUERY_SECONDS
+from app.models.job_model import EmbeddingJob, EmbeddingJobBatch
+
+
+class JobCRUD:
+    """
+    Embedding jobs and the work queue of their batches.
+
+    Workers claim batches with `SELECT ... FOR UPDATE SKIP LOCKED` on PostgreSQL, so any number
+    of workers, in any number of processes, take distinct batches without waiting on each other.
+    """
+
+    def create_job(self, model_name: str, source: str, batch_size: int) -> EmbeddingJob:
+        return EmbeddingJob.create(model_name=model_name, source=source, batch_size=batch_size)
+
+    def add_batches(self, job_id: int, batches: List[List[str]], first_position: int):
+        """
+        Queue batches of a job that is still receiving chunks.
+        """
+        if not batches:
+            return
+        rows = [{"job": job_id, "position": first_position + offset, "size": len(batch),
+                 "chunks": json.dumps(batch)}
+                for offset, batch in enumerate(batches)]
+        with DB_QUERY_SECONDS.labels('job_enqueue').time():
+            EmbeddingJobBatch.insert_many(rows).execute()
+
+    def seal_job(self, job_id: int, total_chunks: int):
+        """
+        Mark every chunk of the job as queued, which makes its batches claimable.
+        """
+        EmbeddingJob.update(total_chunks=total_chunks).where(EmbeddingJob.id == job_id).execute()
+
+    def delete_job(self, job_id: int):
+        with EmbeddingJob._meta.database.atomic():
+            EmbeddingJobBatch.delete().where(EmbeddingJobBatch.job == job_id).execute()
+            EmbeddingJob.delete().where(EmbeddingJob.id == job_id).execute()
+
+    def claim_batch(self, lease_seconds: float, max_attempts: int) -> Optional[EmbeddingJobBatch]:
+        """
+        Take the oldest pending batch, or one whose worker let its lease expire, and lease it.
+
+        Batches that already used `max_attempts` are marked failed instead of being retried,
+        so a batch that kills its worker does not do so forever.
+
+        Returns:
+            EmbeddingJobBatch: The claimed batch with its job, or None when there is no work.
+        """
+        database = EmbeddingJobBatch._meta.database
+        while True:
+            now = time.time()
+            sealed_jobs = EmbeddingJob.select(EmbeddingJob.id).where(EmbeddingJob.total_chunks.is_null(False))
+            query = (EmbeddingJobBatch
+                     .select()
+                     .where(EmbeddingJobBatch.job.in_(sealed_jobs) &
+                            ((EmbeddingJobBatch.status == 'pending') |
+                             ((EmbeddingJobBatch.status == 'running') & (EmbeddingJobBatch.lease_expires_at < now))))
+                     .order_by(EmbeddingJobBatch.id)
+                     .limit(1))
+            if isinstance(database, PostgresqlDatabase):
+                query = query.for_update('FOR UPDATE SKIP LOCKED')
+            with DB_QUERY_SECONDS.labels('job_claim').time(), database.atomic():
+                batch = query.first()
+                if batch is None:
+                    return None
+                if batch.attempts >= max_attempts:
+                    (EmbeddingJobBatch
+                     .update(status='failed', lease_expires_at=None,
+                             error=batch.error or f"Worker lost the batch after {batch.attempts} attempts")
+                     .where(EmbeddingJobBatch.id == batch.id)
+                     .execute())
+                    continue
+                batch.status = 'running'
+                batch.attempts += 1
+                batch.lease_expires_at = now + lease_seconds
+                batch.save(only=[EmbeddingJobBatch.status, EmbeddingJobBatch.attempts,
+                                 EmbeddingJobBatch.lease_expires_at])
+            batch.job = EmbeddingJob.get_by_id(batch.job_id)
+            return batch
+
+    def _owned(self, batch: EmbeddingJobBatch):
+        """
+        Condition matching the batch only while this claim of it still holds.
+        """
+        return ((EmbeddingJobBatch.id == batch.id) & (EmbeddingJobBatch.status == 'running') &
+                (EmbeddingJobBatch.attempts == batch.attempts))
+
+    def complete_batch(self, batch: EmbeddingJobBatch, embedding_crud, embeddings) -> bool:
+        """
+        Save the batch's embeddings and mark it done in one transaction.
+
+        Returns:
+            bool: False when the lease was lost to another worker, in which case nothing is saved.
+        """
+        database = EmbeddingJobBatch._meta.database
+        with DB_QUERY_SECONDS.labels('job_complete').time(), database.atomic():
+            # Marking first locks the row, so a worker that took the batch over waits for us
+            claimed = (EmbeddingJobBatch
+                       .update(status='done', chunks=None, lease_expires_at=None, error=None)
+                       .where(self._owned(batch))
+                       .execute())
+            if not claimed:
+                return False
+            instances = embedding_crud.save_embedding(json.loads(batch.chunks), embeddings)
+            (EmbeddingJobBatch
+             .update(embedding_ids=json.dumps([instance.id for instance in instances]))
+             .where(EmbeddingJobBatch.id == batch.id)
+             .execute())
+        return True
+
+    def fail_batch(self, batch: EmbeddingJobBatch, error: str, max_attempts: int):
+        """
+        Put the batch back in the queue, or mark it failed once it used `max_attempts`.
+        """
+        status = 'failed' if batch.attempts >= max_attempts else 'pending'
+        (EmbeddingJobBatch
+         .update(status=status, lease_expires_at=None, error=error)
+         .where(self._owned(batch))
+         .execute())
+
+    def release_batch(self, batch: EmbeddingJobBatch):
+        """
+        Put the batch back in the queue without counting the attempt, when it could not be
+        started for lack of capacity.
+        """
+        (EmbeddingJobBatch
+         .update(status='pending', lease_expires_at=None, attempts=EmbeddingJobBatch.attempts - 1)
+         .where(self._owned(batch))
+         .execute())
+
+    def job_status(self, job_id: int) -> Optional[dict]:
+        """
+        Progress of a job, or None when it does not exist.
+        """
+        job = EmbeddingJob.get_or_none(EmbeddingJob.id == job_id)
+        if job is None:
+            return None
+        counts = {state: {"batches": 0, "chunks": 0} for state in ('pending', 'running', 'done', 'failed')}
+        query = (EmbeddingJobBatch
+                 .select(EmbeddingJobBatch.status, fn.COUNT(EmbeddingJobBatch.id), fn.SUM(EmbeddingJobBatch.size))
+                 .where(EmbeddingJobBatch.job == job_id)
+                 .group_by(EmbeddingJobBatch.status)
+                 .tuples())
+        for state, batches, chunks in query:
+            counts[state] = {"batches": batches, "chunks": int(chunks or 0)}
+        errors = (EmbeddingJobBatch
+                  .select(EmbeddingJobBatch.position, EmbeddingJobBatch.error)
+                  .where((EmbeddingJobBatch.job == job_id) & (EmbeddingJobBatch.status == 'failed'))
+                  .order_by(EmbeddingJobBatch.position)
+                  .limit(10)
+                  .tuples())
+
+        if job.total_chunks is None:
+            status = 'receiving'
+        elif counts['pending']['batches'] or counts['running']['batches']:
+            started = counts['running']['batches'] or counts['done']['batches'] or counts['failed']['batches']
+            status = 'running' if started else 'queued'
+        else:
+            status = 'failed' if counts['failed']['batches'] else 'completed'
+        return {
+            "id": job.id,
+            "model": job.model_name,
+            "source": job.source,
+            "status": status,
+            "total_chunks": job.total_chunks,
+            "processed_chunks": counts['done']['chunks'],
+            "failed_chunks": counts['failed']['chunks'],
+            "batches": {state: count["batches"] for state, count in counts.items()},
+            "errors": [{"batch": position, "error": error} for position, error in errors],
+            "created_at": job.created_at.isoformat() if job.created_at else None,
+        }
+
+    def job_results(self, job_id: int, after: int, limit: int) -> List[dict]:
+        """
+        Saved ids of the job's finished batches after position `after`, in order.
+        """
+        query = (EmbeddingJobBatch
+                 .select(EmbeddingJobBatch.position, EmbeddingJobBatch.embedding_ids)
+                 .where((EmbeddingJobBatch.job == job_id) & (EmbeddingJobBatch.status == 'done') &
+                        (EmbeddingJobBatch.position > after))
+                 .order_by(EmbeddingJobBatch.position)
+                 .limit(limit)
+                 .tuples())
+        return [{"batch": position, "ids": json.loads(ids)} for position, ids in query]
@@ -1,22 +1,123 @@
 import os
-from typing import List
+import threading
+from typing import Callable, List, Optional
 
 from peewee import PostgresqlDatabase
+from playhouse.pool import PooledPostgresqlDatabase, PooledSqliteDatabase, MaxConnectionsExceeded
 
 from dotenv import load_dotenv
 
 load_dotenv()
+
+
+class _PoolHealthCheck:
+    """
+    Mixin for peewee pooled databases that validates idle connections on checkout,
+    keeps usage counters and runs callbacks once a transaction commits.
+    """
+    health_check = True
+
+    def __init__(self, *args, **kwargs):
+        self.checkouts = 0
+        self.health_check_failures = 0
+        self.wait_timeouts = 0
+        # Callbacks waiting for the outermost transaction of each thread to commit
+        self._commit_callbacks = threading.local()
+        super().__init__(*args, **kwargs)
+
+    def on_commit(self, callback: Callable[[], None]):
+        """
+        Run `callback` once this thread's outermost transaction commits, or straight away outside
+        one. It is dropped if that transaction rolls back. A nested `atomic()` is only a
+        savepoint, so its callbacks wait for the transaction around it.
+        """
+        if self.transaction_depth() == 0:
+            callback()
+            return
+        if not hasattr(self._commit_callbacks, 'pending'):
+            self._commit_callbacks.pending = []
+        self._commit_callbacks.pending.append(callback)
+
+    def commit(self):
+        super().commit()
+        callbacks, self._commit_callbacks.pending = getattr(self._commit_callbacks, 'pending', []), []
+        for callback in callbacks:
+            callback()
+
+    def rollback(self):
+        self._commit_callbacks.pending = []
+        super().rollback()
+
+    def connect(self, reuse_if_open=False):
+        try:
+            opened = super().connect(reuse_if_open)
+        except MaxConnectionsExceeded:
+            self.wait_timeouts += 1
+            raise
+        if opened:
+            self.checkouts += 1
+        return opened
+
+    def _is_closed(self, conn):
+        if super()._is_closed(conn):
+            return True
+        if not self.health_check:
+            return False
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+            cursor.close()
+        except Exception:
+            self.health_check_failures += 1
+            try:
+                conn.close()
+            except Exception:
+                pass
+            return True
+        return False
+
+
+class HealthCheckedPooledPostgresqlDatabase(_PoolHealthCheck, PooledPostgresqlDatabase):
+    pass
+
+
+class HealthCheckedPooledSqliteDatabase(_PoolHealthCheck, PooledSqliteDatabase):
+    pass
+
+
 class Database:
     database: PostgresqlDatabase
 
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: str, max_connections: Optional[int] = None, min_connections: Optional[int] = None,
+                 stale_timeout: Optional[int] = None, wait_timeout: Optional[float] = None,
+                 health_check: Optional[bool] = None):
         """
-        Initialize the Database class with a SQLite database file path.
+        Initialize the Database class with a pooled connection to `db_path`.
 
         Args:
-            db_path (str): Path to the SQLite database file.
+            db_path (str): PostgreSQL URL or database name. A `sqlite:///path` URL uses a
+                pooled SQLite database instead, as a local stand-in.
+            max_connections (int): Most connections open at once.
+            min_connections (int): Connections opened ahead of time by `warm_up`.
+            stale_timeout (int): Seconds after which an idle connection is recycled.
+            wait_timeout (float): Seconds to wait for a free connection before giving up.
+            health_check (bool): Run `SELECT 1` on idle connections before handing them out.
         """
-        self.database = PostgresqlDatabase(db_path)
+        self.max_connections = max_connections or int(os.getenv('DATABASE_POOL_MAX', 20))
+        self.min_connections = min_connections if min_connections is not None \
+            else int(os.getenv('DATABASE_POOL_MIN', 0))
+        self.stale_timeout = stale_timeout or int(os.getenv('DATABASE_POOL_STALE_TIMEOUT', 300))
+        self.wait_timeout = wait_timeout or float(os.getenv('DATABASE_POOL_WAIT_TIMEOUT', 10))
+
+        pool_class = HealthCheckedPooledPostgresqlDatabase
+        if db_path.startswith('sqlite:///'):
+            db_path = db_path[len('sqlite:///'):]
+            pool_class = HealthCheckedPooledSqliteDatabase
+        self.database = pool_class(db_path, max_connections=self.max_connections,
+                                   stale_timeout=self.stale_timeout, timeout=self.wait_timeout)
+        self.database.health_check = health_check if health_check is not None \
+            else os.getenv('DATABASE_POOL_HEALTH_CHECK', 'true').lower() == 'true'
 
     def connect(self):
         """
@@ -32,6 +133,53 @@ class Database:
         if not self.database.is_closed():
             self.database.close()
 
+    def close_pool(self):
+        """
+        Close every pooled connection, such as before forking, so none is shared between processes.
+        """
+        self.database.close_all()
+
+    def warm_up(self):
+        """
+        Open `min_connections` connections up front and park them in the pool.
+        """
+        if self.min_connections <= 0:
+            return
+        # Connections are per thread, so each one is opened from its own thread
+        barrier = threading.Barrier(self.min_connections)
+
+        def open_connection():
+            try:
+                self.database.connect(reuse_if_open=True)
+                barrier.wait(timeout=self.wait_timeout)
+            except Exception:
+                # Warming up is best effort; release the other threads
+                barrier.abort()
+            finally:
+                self.database.close()
+
+        threads = [threading.Thread(target=open_connection) for _ in range(self.min_connections)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def pool_stats(self) -> dict:
+        """
+        Connection pool usage.
+        """
+        return {
+            "max_connections": self.max_connections,
+            "min_connections": self.min_connections,
+            "in_use": len(self.database._in_use),
+            "idle": len(self.database._connections),
+            "checkouts": self.database.checkouts,
+            "health_check_failures": self.database.health_check_failures,
+            "wait_timeouts": self.database.wait_timeouts,
+            "stale_timeout": self.stale_timeout,
+            "wait_timeout": self.wait_timeout,
+        }
+
     def create_tables(self, table_names: List):
         """
         Initialize the database by creating tables.
@@ -40,5 +188,15 @@ class Database:
         self.database.create_tables(table_names, safe=True)
         self.close()
 
+    def execute_sql(self, sql: str, params=None):
+        """
+        Run a single statement, such as DDL, on its own connection.
+        """
+        self.connect()
+        try:
+            self.database.execute_sql(sql, params)
+        finally:
+            self.close()
+
 db_url = f"{os.getenv('DATABASE_URL')}"
-database_instance = Database(db_url)
\ No newline at end of file
+database_instance = Database(db_url)
@@ -0,0 +1,170 @@
+"""
+Fit a projection that reduces a model's vectors to fewer dimensions, and build the table it is served from.
+
+    python -m app.database.projection_migration --dimensions 128 [--method pca|truncate] [--model NAME]
+
+The projection is fitted on a random sample of the model's full-dimension table and saved as
+the next version under `EMBEDDING_PROJECTION_DIR`. Every row is then projected, under the same
+id, into `<table>_p<version>`, which draws new ids from the full table's sequence and gets the
+configured vector index. Serve it by adding `name:version` to `EMBEDDING_PROJECTIONS` and
+restarting. Run again with `--version <version>` after the restart to copy rows saved to the full
+table in the meantime; the full table is left as it is and stops receiving writes.
+"""
+import argparse
+import logging
+from typing import List, Optional, Type
+
+import numpy as np
+from peewee import SQL, fn
+
+from app.core.initializer import AppInitializer
+from app.core.model_registry import ModelRegistry
+from app.database.database import Database, database_instance
+from app.models.embedding_model import Embedding
+from app.utils.projection import PROJECTION_METHODS, Projection, projection_path, projection_versions, \
+    transform_embeddings
+
+logger = logging.getLogger(__name__)
+
+
+def sample_vectors(table: Type[Embedding], size: int, normalize: bool = False) -> np.ndarray:
+    """
+    Up to `size` vectors drawn at random from `table`, normalized as they will be when projected.
+    """
+    rows = table.select(table.embedding).order_by(fn.random()).limit(size)
+    vectors = [row.embedding for row in rows]
+    if not vectors:
+        raise ValueError(f"{table._meta.table_name} has no vectors to fit a projection on")
+    return transform_embeddings(np.stack(vectors), normalize=normalize)
+
+
+def backfill(source: Type[Embedding], target: Type[Embedding], projection: Projection, normalize: bool,
+             batch_size: int) -> int:
+    """
+    Project every row of `source` missing from `target` into it, keeping ids, content hashes,
+    tenants, metadata, document sources and timestamps.
+
+    Returns:
+        int: Rows copied.
+    """
+    database = target._meta.database
+    missing = ~fn.EXISTS(target.select(SQL('1')).where(target.id == source.id))
+    copied, last_id = 0, 0
+    while True:
+        rows = list(source
+                    .select(source.id, source.text, source.content_hash, source.tenant, source.metadata,
+                            source.document_id, source.chunk_start, source.chunk_end, source.embedding,
+                            source.created_at, source.updated_at)
+                    .where((source.id > last_id) & missing)
+                    .order_by(source.id)
+                    .limit(batch_size))
+        if not rows:
+            return copied
+        vectors = transform_embeddings(np.stack([row.embedding for row in rows]), projection, normalize)
+        with database.atomic():
+            target.insert_many([
+                {"id": row.id, "text": row.text, "content_hash": row.content_hash, "tenant": row.tenant,
+                 "metadata": row.metadata, "document_id": row.document_id, "chunk_start": row.chunk_start,
+                 "chunk_end": row.chunk_end, "embedding": vector, "created_at": row.created_at,
+                 "updated_at": row.updated_at}
+                for row, vector in zip(rows, vectors)
+            ]).on_conflict_ignore().execute()
+        copied += len(rows)
+        last_id = rows[-1].id
+        logger.info("Projected rows up to id %d", last_id)
+
+
+def share_id_sequence(database, source: Type[Embedding], target: Type[Embedding]):
+    """
+    Make `target` draw ids from `source`'s sequence, so rows saved to either never share an id.
+    The sequence is detached from `source`, which can then be dropped without it.
+    """
+    sequence = database.execute_sql("SELECT pg_get_serial_sequence(%s, 'id')",
+                                    (source._meta.table_name,)).fetchone()[0]
+    if sequence is None:
+        # Already shared by an earlier run
+        return
+    database.execute_sql(f'ALTER TABLE "{target._meta.table_name}" ALTER COLUMN "id" '
+                         f"SET DEFAULT nextval('{sequence}'::regclass)")
+    database.execute_sql(f"ALTER SEQUENCE {sequence} OWNED BY NONE")
+
+
+def table_bytes(database, table: Type[Embedding]) -> int:
+    return database.execute_sql("SELECT pg_total_relation_size(%s)", (table._meta.table_name,)).fetchone()[0]
+
+
+def migrate_projection(db: Database, registry: ModelRegistry, model_name: str, dimensions: Optional[int] = None,
+                       method: str = 'pca', sample_size: int = 20000, version: Optional[int] = None,
+                       batch_size: int = 10000) -> Projection:
+    """
+    Fit and save a new projection version of a model, or reuse `version`, and fill its table.
+
+    Args:
+        db (Database): Database holding the model's tables.
+        registry (ModelRegistry): Supplies the model's dimension, storage mode and normalization.
+        model_name (str): Model whose vectors are projected.
+        dimensions (int): Output dimension of a new projection.
+        method (str): "pca" or "truncate", see `Projection`.
+        sample_size (int): Vectors a PCA projection is fitted on.
+        version (int): Existing projection version to backfill instead of fitting a new one.
+        batch_size (int): Rows projected per transaction.
+    """
+    database = db.database
+    registry.projections.pop(model_name, None)
+    source = registry.table(model_name)
+    AppInitializer(None, db, registry).add_content_hash([source])
+    AppInitializer(None, db, registry).add_metadata([source])
+
+    with database.connection_context():
+        if version is not None:
+            projection = Projection.load(projection_path(model_name, version))
+        else:
+            if method == 'pca':
+                projection = Projection.fit_pca(sample_vectors(source, sample_size, registry.normalize), dimensions)
+            else:
+                sample = sample_vectors(source, min(sample_size, 1000), registry.normalize)
+                projection = Projection.truncation(sample.shape[1], dimensions, sample)
+            projection.version = max(projection_versions(model_name), default=0) + 1
+            projection.save(projection_path(model_name, projection.version))
+            logger.info("Saved %s projection v%d of %s to %d dimensions, keeping %.1f%% of the variance",
+                        method, projection.version, model_name, dimensions, 100 * projection.explained_variance)
+
+        registry.projections[model_name] = projection.version
+        registry._projections[model_name] = projection
+        target = registry.table(model_name)
+        database.create_tables([target])
+        share_id_sequence(database, source, target)
+        copied = backfill(source, target, projection, registry.normalize, batch_size)
+        logger.info("Copied %d rows to %s", copied, target._meta.table_name)
+
+    AppInitializer(None, db, registry).create_vector_index([target], concurrently=True)
+    AppInitializer(None, db, registry).create_metadata_index([target])
+
+    with database.connection_context():
+        before, after = table_bytes(database, source), table_bytes(database, target)
+    logger.info("%s: %.1f MB with indexes, %s: %.1f MB (%.0f%% smaller)", source._meta.table_name, before / 2 ** 20,
+                target._meta.table_name, after / 2 ** 20, 100 * (1 - after / before) if before else 0)
+    return projection
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dimensions", type=int, help="Output dimension of a new projection")
+    parser.add_argument("--method", choices=PROJECTION_METHODS, default="pca",
+                        help="pca, or truncate for models trained Matryoshka-style")
+    parser.add_argument("--model", help="Model whose vectors to project, the default model when omitted")
+    parser.add_argument("--sample", type=int, default=20000, help="Vectors the projection is fitted on")
+    parser.add_argument("--version", type=int, help="Backfill this existing projection instead of fitting one")
+    parser.add_argument("--batch-size", type=int, default=10000, help="Rows projected per transaction")
+    args = parser.parse_args(argv)
+    if (args.dimensions is None) == (args.version is None):
+        parser.error("give exactly one of --dimensions and --version")
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    registry = ModelRegistry()
+    migrate_projection(database_instance, registry, registry.resolve(args.model), args.dimensions, args.method,
+                       args.sample, args.version, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Move a model's vector table to another storage mode (see `STORAGE_MODES`) without downtime.
+
+    python -m app.database.storage_migration --to halfvec-bit [--model NAME] [--drop-old-indexes]
+
+A change of precision (`vector` <-> `halfvec`) adds a column of the new type, backfills it in
+id batches of short transactions, then swaps it in under a brief exclusive lock that also
+converts rows written meanwhile. The space of the old column is only returned by a table
+rewrite (`VACUUM FULL` or pg_repack). `--offline` converts with one `ALTER COLUMN ... TYPE`
+instead, which leaves a compact table but blocks the table until it is done.
+
+The index of the new mode is then built concurrently. Restart the service with the new
+`EMBEDDING_STORAGE` (or `EMBEDDING_MODELS` entry) afterwards. A change of precision drops the
+indexes of the old column along with it. A change that keeps the precision (`vector` <-> `bit`,
+`halfvec` <-> `halfvec-bit`) leaves the old indexes for instances still running with them,
+unless `--drop-old-indexes` is given.
+"""
+import argparse
+import logging
+from typing import List, Optional, Type
+
+from app.core.initializer import AppInitializer
+from app.core.model_registry import ModelRegistry, STORAGE_MODES
+from app.database.database import Database, database_instance
+from app.models.embedding_model import VECTOR_INDEX_OPS, Embedding, vector_index_definition
+
+logger = logging.getLogger(__name__)
+
+
+def column_type(database, table_name: str) -> str:
+    """
+    SQL type of the `embedding` column, such as `vector(384)`.
+    """
+    cursor = database.execute_sql(
+        "SELECT format_type(atttypid, atttypmod) FROM pg_attribute "
+        "WHERE attrelid = %s::regclass AND attname = 'embedding'", (table_name,))
+    return cursor.fetchone()[0]
+
+
+def embedding_indexes(database, table_name: str) -> List[str]:
+    """
+    Names of the vector indexes (HNSW or IVFFlat) over the `embedding` column.
+    """
+    cursor = database.execute_sql(
+        "SELECT indexname FROM pg_indexes WHERE tablename = %s AND indexdef ~ 'USING (hnsw|ivfflat) ' "
+        "ORDER BY indexname", (table_name,))
+    return [row[0] for row in cursor.fetchall()]
+
+
+def convert_column(database, table_name: str, target_type: str, batch_size: int):
+    """
+    Rewrite the `embedding` column as `target_type` while the table stays writable.
+    """
+    database.execute_sql(f'ALTER TABLE "{table_name}" ADD COLUMN IF NOT EXISTS "embedding_new" {target_type}')
+    last_id = 0
+    while True:
+        # Each batch is its own short transaction, so writers are never blocked for long
+        cursor = database.execute_sql(
+            f'WITH batch AS (SELECT "id" FROM "{table_name}" WHERE "id" > %s ORDER BY "id" LIMIT %s) '
+            f'UPDATE "{table_name}" SET "embedding_new" = "embedding"::{target_type} '
+            f'WHERE "id" IN (SELECT "id" FROM batch) RETURNING "id"', (last_id, batch_size))
+        ids = [row[0] for row in cursor.fetchall()]
+        if not ids:
+            break
+        last_id = max(ids)
+        logger.info("Converted rows up to id %d", last_id)
+
+    with database.atomic():
+        database.execute_sql(f'LOCK TABLE "{table_name}" IN ACCESS EXCLUSIVE MODE')
+        # Rows inserted since the backfill passed their id
+        database.execute_sql(
+            f'UPDATE "{table_name}" SET "embedding_new" = "embedding"::{target_type} WHERE "embedding_new" IS NULL')
+        database.execute_sql(f'ALTER TABLE "{table_name}" DROP COLUMN "embedding"')
+        database.execute_sql(f'ALTER TABLE "{table_name}" RENAME COLUMN "embedding_new" TO "embedding"')
+        database.execute_sql(f'ALTER TABLE "{table_name}" ALTER COLUMN "embedding" SET NOT NULL')
+
+
+def migrate_storage(db: Database, table: Type[Embedding], batch_size: int = 10000,
+                    drop_old_indexes: bool = False, offline: bool = False):
+    """
+    Bring `table`'s column and index in line with its storage mode.
+
+    Args:
+        db (Database): Database holding the table.
+        table (Type[Embedding]): Table class in the target storage mode, from `ModelRegistry.table`.
+        batch_size (int): Rows converted per transaction.
+        drop_old_indexes (bool): Drop indexes of other storage modes once the new one exists.
+        offline (bool): Convert the column in one blocking table rewrite.
+    """
+    database = db.database
+    table_name = table._meta.table_name
+    target_type = f"{table.embedding.field_type}({int(table.embedding.dimensions)})"
+    with database.connection_context():
+        current_type = column_type(database, table_name)
+        if current_type != target_type:
+            logger.info("Converting %s.embedding from %s to %s", table_name, current_type, target_type)
+            if offline:
+                # Dependent indexes are of the old type and would fail to rebuild
+                for index in embedding_indexes(database, table_name):
+                    database.execute_sql(f'DROP INDEX IF EXISTS "{index}"')
+                database.execute_sql(f'ALTER TABLE "{table_name}" ALTER COLUMN "embedding" TYPE {target_type} '
+                                     f'USING "embedding"::{target_type}')
+            else:
+                convert_column(database, table_name, target_type, batch_size)
+
+    initializer = AppInitializer(None, db)
+    initializer.create_vector_index([table], concurrently=True)
+
+    if drop_old_indexes:
+        with database.connection_context():
+            # The names Postgres stores, as `vector_index_definition` keeps them within its limit
+            keep = {vector_index_definition(table, index_type, metric, tenant)[0]
+                    for index_type in ('hnsw', 'ivfflat') for metric in VECTOR_INDEX_OPS
+                    for tenant in [None, *AppInitializer.dedicated_tenants()]}
+            for index in embedding_indexes(database, table_name):
+                if index not in keep:
+                    logger.info("Dropping index %s", index)
+                    database.execute_sql(f'DROP INDEX CONCURRENTLY IF EXISTS "{index}"')
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--to", required=True, choices=STORAGE_MODES, help="Target storage mode")
+    parser.add_argument("--model", help="Model whose table to migrate, the default model when omitted")
+    parser.add_argument("--batch-size", type=int, default=10000, help="Rows converted per transaction")
+    parser.add_argument("--offline", action="store_true",
+                        help="Convert in one blocking rewrite that leaves a compact table")
+    parser.add_argument("--drop-old-indexes", action="store_true",
+                        help="Drop indexes of other storage modes, once no instance uses them")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    registry = ModelRegistry()
+    model_name = registry.resolve(args.model)
+    registry.storage[model_name] = args.to
+    migrate_storage(database_instance, registry.table(model_name), args.batch_size, args.drop_old_indexes,
+                    args.offline)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,12 +3,18 @@ import os
 from fastapi import FastAPI
 from starlette.middleware.cors import CORSMiddleware
 
-from app.api.endpoints import EmbeddingRoutes
+from app.api.endpoints import EmbeddingRoutes, HealthRoutes, JobRoutes, MetricsRoutes
+from app.core import metrics
 from app.core.dependencies import Dependency
+from app.core.executor import InferenceExecutor
 from app.core.initializer import AppInitializer
+from app.core.job_worker import JobWorker
+from app.core.model_registry import model_registry
+from app.crud.embedding_crud import EmbeddingCRUD
+from app.utils.faiss_index import FaissIndex
 
 
-from app.database.database import Database
+from app.database.database import database_instance
 
 
 def create_app() -> FastAPI:
@@ -21,15 +27,46 @@ def create_app() -> FastAPI:
         allow_methods=["*"],  # Allow all HTTP methods
         allow_headers=["*"],  # Allow all headers
     )
-    database = Database(os.getenv('DATABASE_URL'))
-    initializer = AppInitializer(app, database)  # Adjust `database_instance` as needed
+    # Share the pool the models are bound to instead of opening a second one
+    database = database_instance
+    initializer = AppInitializer(app, database, model_registry)  # Adjust `database_instance` as needed
     initializer.initialize()
 
     dependency = Dependency(database)
 
+    # Optional in-memory FAISS tier, kept in sync by the CRUD on every save
+    default_table = model_registry.table()
+    faiss_index = FaissIndex.from_env(int(default_table.embedding.dimensions))
+    embedding_crud = EmbeddingCRUD(faiss_index=faiss_index, table=default_table)
+    if faiss_index is not None:
+        initializer.load_faiss_index(faiss_index, embedding_crud)
+
+    # Model inference runs on its own pool so the event loop stays free for reads
+    inference_executor = InferenceExecutor()
+    app.add_event_handler("shutdown", inference_executor.shutdown)
+
     # Include routers
-    embedding_routes = EmbeddingRoutes(dependency=dependency)
+    embedding_routes = EmbeddingRoutes(dependency=dependency, embedding_crud=embedding_crud,
+                                       inference_executor=inference_executor, model_registry=model_registry)
     app.include_router(embedding_routes.router)
+    app.include_router(HealthRoutes(model_registry).router)
+    app.include_router(JobRoutes(embedding_routes).router)
+
+    # Embedding jobs are worked through in the background, sharing the inference pool
+    job_worker = JobWorker(embedding_routes)
+    if job_worker.concurrency > 0:
+        app.add_event_handler("startup", job_worker.start)
+        app.add_event_handler("shutdown", job_worker.stop)
+
+    if os.getenv('EMBEDDING_METRICS_ENABLED', 'true').lower() == 'true':
+        app.add_middleware(metrics.MetricsMiddleware)
+        metrics.observe_executor(inference_executor)
+        metrics.observe_database(database)
+        app.include_router(MetricsRoutes().router)
+
+    # The model loads in the background; /health/ready turns 200 once it is in memory
+    if os.getenv('EMBEDDING_MODEL_WARM_UP', 'true').lower() == 'true':
+        app.add_event_handler("startup", model_registry.start_warm_up)
     return app
 
 
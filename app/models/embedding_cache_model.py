@@ -0,0 +1,16 @@
+from peewee import Model, CharField, CompositeKey
+
+from pgvector.peewee import VectorField
+
+from app.database.database import database_instance
+
+
+class EmbeddingCacheEntry(Model):
+    model_name = CharField(null=False)
+    text_hash = CharField(max_length=64, null=False)
+    embedding = VectorField()
+
+    class Meta:
+        database = database_instance.database
+        table_name = 'embedding_cache'
+        primary_key = CompositeKey('model_name', 'text_hash')
@@ -1,19 +1,171 @@
+import hashlib
 import json
 import os
-from peewee import Model, TextField, TimestampField, SQL, AutoField
+import re
+from typing import Dict, Optional, Sequence, Tuple, Type
 
-from pgvector.peewee import VectorField
+import numpy as np
+from peewee import Model, TextField, TimestampField, SQL, AutoField, CharField, Field, IntegerField
+
+from pgvector.peewee import HalfVectorField as _HalfVectorField, VectorField
 
 from app.database.database import database_instance
 
+# pgvector operator class used to index each supported distance metric
+VECTOR_INDEX_OPS = {
+    'cosine': 'vector_cosine_ops',
+    'l2': 'vector_l2_ops',
+    'inner_product': 'vector_ip_ops',
+}
+
+# Storage modes that keep float16 vectors in a `halfvec` column
+HALF_PRECISION_STORAGE = ('halfvec', 'halfvec-bit')
+# Storage modes whose index holds binary-quantized vectors, reranked on the stored ones
+BINARY_INDEX_STORAGE = ('bit', 'halfvec-bit')
+# `hash_content` of the `text` column in SQL
+CONTENT_HASH_SQL = 'encode(sha256(convert_to("text", \'UTF8\')), \'hex\')'
+# Longest identifier PostgreSQL keeps, in bytes; it silently truncates longer ones
+POSTGRES_MAX_IDENTIFIER = 63
+
+
+def hash_content(text: str, metadata: Optional[dict] = None, source: Optional[Sequence] = None) -> str:
+    """
+    SHA-256 hex digest of a chunk's exact text, its metadata and, for a chunk split from a
+    document, its `(document id, start, end)` source, which with its tenant identifies its row in
+    a vector table. Without metadata or source it is the digest of the text alone.
+    """
+    content = text if not metadata else f"{text}\0{encode_metadata(metadata)}"
+    if source is not None:
+        content = f"{content}\0{json.dumps(list(source), ensure_ascii=False)}"
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def encode_metadata(metadata: Optional[dict]) -> Optional[str]:
+    """
+    Metadata as canonical JSON: sorted keys and no spaces, so equal objects encode equally.
+    """
+    return None if metadata is None else json.dumps(metadata, sort_keys=True, separators=(',', ':'),
+                                                    ensure_ascii=False)
+
+
+class MetadataField(Field):
+    """
+    JSON object column, `jsonb` in PostgreSQL.
+    """
+    field_type = 'JSONB'
+
+    def db_value(self, value):
+        return encode_metadata(value)
+
+    def python_value(self, value):
+        return json.loads(value) if isinstance(value, str) else value
+
+
+class HalfVectorField(_HalfVectorField):
+    """
+    `halfvec` column read back as float32 NumPy arrays, like `VectorField`.
+    """
+
+    def python_value(self, value):
+        value = super().python_value(value)
+        return None if value is None else value.to_numpy().astype(np.float32)
+
 
 class Embedding(Model):
     DoesNotExist = None
+    storage = 'vector'
     id = AutoField(primary_key=True)
     text = TextField(null=False)
+    # Null only on duplicate rows saved before chunks were deduplicated
+    content_hash = CharField(max_length=64, null=True)
+    # Searches can be restricted to a tenant, which can get an index or partition of its own
+    tenant = TextField(null=False, default='', constraints=[SQL("DEFAULT ''")])
+    metadata = MetadataField(null=True)
+    # Set on chunks split from a document by the server: its id and the chunk's character span in it
+    document_id = TextField(null=True)
+    chunk_start = IntegerField(null=True)
+    chunk_end = IntegerField(null=True)
     embedding = VectorField(dimensions=os.environ.get('DIMENSION', 384 ))
     created_at = TimestampField(null=False, default=SQL('EXTRACT(EPOCH FROM CURRENT_TIMESTAMP)'))
     updated_at = TimestampField(null=False, default=SQL('EXTRACT(EPOCH FROM CURRENT_TIMESTAMP)'))
 
     class Meta:
         database = database_instance.database
+        # Also the index tenant filters use
+        indexes = ((('tenant', 'content_hash'), True),)
+
+
+def tenant_relation_name(table_name: str, tenant: str) -> str:
+    """
+    Name of the partition of `table_name`, or the prefix of its partial indexes, that holds the
+    rows of `tenant`: a digest of the tenant, as tenants may be any text.
+    """
+    return f"{table_name}_t{hashlib.sha256(tenant.encode('utf-8')).hexdigest()[:10]}"
+
+
+def postgres_identifier(name: str) -> str:
+    """
+    `name` within PostgreSQL's 63-byte identifier limit. Longer names end in a digest of the
+    whole name instead of being cut off by PostgreSQL, which would give names that differ only
+    past the limit the same identifier.
+    """
+    if len(name.encode('utf-8')) <= POSTGRES_MAX_IDENTIFIER:
+        return name
+    digest = hashlib.sha256(name.encode('utf-8')).hexdigest()[:10]
+    return f"{name[:POSTGRES_MAX_IDENTIFIER - len(digest) - 1]}_{digest}"
+
+
+def vector_index_definition(table: Type['Embedding'], index_type: str, metric: str,
+                            tenant: Optional[str] = None) -> Tuple[str, str]:
+    """
+    Name and `(expression opclass)` of the ANN index of a vector table in its storage mode, or
+    of its partial index over the rows of `tenant`.
+    """
+    name = table._meta.table_name if tenant is None else tenant_relation_name(table._meta.table_name, tenant)
+    if table.storage in BINARY_INDEX_STORAGE:
+        dimensions = int(table.embedding.dimensions)
+        return (postgres_identifier(f'{name}_embedding_{index_type}_bit_idx'),
+                f'((binary_quantize("embedding")::bit({dimensions})) bit_hamming_ops)')
+    if table.storage in HALF_PRECISION_STORAGE:
+        return (postgres_identifier(f'{name}_embedding_{index_type}_{metric}_halfvec_idx'),
+                f'("embedding" {VECTOR_INDEX_OPS[metric].replace("vector_", "halfvec_")})')
+    return (postgres_identifier(f'{name}_embedding_{index_type}_{metric}_idx'),
+            f'("embedding" {VECTOR_INDEX_OPS[metric]})')
+
+
+_model_tables: Dict[Tuple[str, str, Optional[str], int], Type[Embedding]] = {}
+
+
+def model_table_suffix(model_name: str) -> str:
+    """
+    `model_name` reduced to a table-name-safe suffix.
+    """
+    return re.sub(r'[^a-z0-9]+', '_', model_name.lower()).strip('_')[:48]
+
+
+def embedding_table(model_name: str, dimensions: int, storage: str = 'vector',
+                    table_name: Optional[str] = None) -> Type[Embedding]:
+    """
+    Model class for the table holding the vectors of `model_name`.
+
+    Each model gets its own `embedding_<model>` table, so every table has a fixed vector
+    dimension and its own vector index. Classes are created once per model and storage mode.
+
+    Args:
+        storage (str): "vector" and "bit" store float32 vectors, "halfvec" and "halfvec-bit"
+            float16 ones.
+        table_name (str): Overrides `embedding_<model>`.
+    """
+    key = (model_name, storage, table_name, int(dimensions))
+    if key not in _model_tables:
+        suffix = model_table_suffix(model_name)
+        field = HalfVectorField if storage in HALF_PRECISION_STORAGE else VectorField
+        # Indexes are named after the table rather than the class, which projection tables share
+        meta = type('Meta', (), {'table_name': table_name or f'embedding_{suffix}',
+                                 'database': database_instance.database, 'legacy_table_names': False})
+        _model_tables[key] = type(f'Embedding_{suffix}', (Embedding,), {
+            'embedding': field(dimensions=dimensions),
+            'storage': storage,
+            'Meta': meta,
+        })
+    return _model_tables[key]
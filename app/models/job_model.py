@@ -0,0 +1,43 @@
+from peewee import Model, AutoField, CharField, IntegerField, DoubleField, TextField, TimestampField, \
+    ForeignKeyField, SQL
+
+from app.database.database import database_instance
+
+# Batch states. Running batches hold a lease; when it expires the batch is claimed again.
+BATCH_STATES = ('pending', 'running', 'done', 'failed')
+
+
+class EmbeddingJob(Model):
+    id = AutoField(primary_key=True)
+    model_name = CharField(null=False)
+    source = CharField(null=False)  # "chunks", "file" or "upload"
+    batch_size = IntegerField(null=False)
+    # Set once every chunk has been queued; workers only pick up batches of sealed jobs
+    total_chunks = IntegerField(null=True)
+    created_at = TimestampField(null=False, default=SQL('EXTRACT(EPOCH FROM CURRENT_TIMESTAMP)'))
+
+    class Meta:
+        database = database_instance.database
+        table_name = 'embedding_job'
+
+
+class EmbeddingJobBatch(Model):
+    """
+    One unit of work of a job, and the job's checkpoint: a batch is marked done in the same
+    transaction that saves its embeddings.
+    """
+    id = AutoField(primary_key=True)
+    job = ForeignKeyField(EmbeddingJob, backref='batches', on_delete='CASCADE')
+    position = IntegerField(null=False)
+    size = IntegerField(null=False)
+    chunks = TextField(null=True)  # JSON list of texts, cleared once the batch is done
+    status = CharField(null=False, default='pending', index=True)
+    attempts = IntegerField(null=False, default=0)
+    lease_expires_at = DoubleField(null=True)  # epoch seconds; REAL would round them by up to a minute
+    embedding_ids = TextField(null=True)  # JSON list of saved ids, in chunk order
+    error = TextField(null=True)
+
+    class Meta:
+        database = database_instance.database
+        table_name = 'embedding_job_batch'
+        indexes = ((('job', 'position'), True),)
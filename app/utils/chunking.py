@@ -0,0 +1,90 @@
+import os
+import re
+from typing import List, NamedTuple, Optional
+
+# Split points, best first: a blank line, the end of a sentence, then any space between words
+PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+SENTENCE_END = re.compile(r'[.!?]["\')\]]*$')
+
+
+class DocumentChunk(NamedTuple):
+    text: str
+    # Character span of `text` in the document
+    start: int
+    end: int
+    # The chunk's tokens, without the special tokens the model adds around them
+    token_ids: List[int]
+
+
+def chunk_settings(max_seq_length: int, special_tokens: int, max_tokens: Optional[int] = None,
+                   overlap: Optional[int] = None):
+    """
+    Tokens per chunk and tokens shared by consecutive chunks, from the request or
+    EMBEDDING_CHUNK_TOKENS and EMBEDDING_CHUNK_OVERLAP. Chunks never exceed what the model
+    reads, `max_seq_length` less its `special_tokens`.
+
+    Raises:
+        ValueError: When the overlap is not smaller than the chunk size.
+    """
+    limit = max_seq_length - special_tokens
+    max_tokens = min(max_tokens or int(os.getenv('EMBEDDING_CHUNK_TOKENS', 256)), limit)
+    overlap = int(os.getenv('EMBEDDING_CHUNK_OVERLAP', 32)) if overlap is None else overlap
+    if not 0 <= overlap < max_tokens:
+        raise ValueError(f"Chunk overlap must be between 0 and {max_tokens - 1} tokens")
+    return max_tokens, overlap
+
+
+def chunk_text(tokenizer, text: str, max_tokens: int, overlap: int) -> List[DocumentChunk]:
+    """
+    Split a document into chunks of at most `max_tokens` tokens of `tokenizer`, each starting
+    `overlap` tokens before the previous one ended.
+
+    The document is tokenized once, with character offsets, and the chunks keep their token
+    ids so they can be encoded without tokenizing again. A chunk ends at the last paragraph
+    break in its second half, or failing that the last sentence end, or the last space between
+    words; only a single word longer than the chunk is cut inside. Overlaps start on a word.
+
+    Args:
+        tokenizer: A Hugging Face fast tokenizer, which reports offsets.
+    """
+    encoded = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True, verbose=False)
+    ids, offsets = encoded["input_ids"], encoded["offset_mapping"]
+    chunks, start = [], 0
+    while start < len(ids):
+        end = min(start + max_tokens, len(ids))
+        if end < len(ids):
+            end = _split_point(text, offsets, start + max(max_tokens // 2, 1), end)
+        chunks.append(DocumentChunk(text[offsets[start][0]:offsets[end - 1][1]], offsets[start][0],
+                                    offsets[end - 1][1], ids[start:end]))
+        if end == len(ids):
+            break
+        start = _word_start(offsets, max(end - overlap, start + 1), end)
+    return chunks
+
+
+def _split_point(text: str, offsets, lowest: int, end: int) -> int:
+    """
+    The best place between `lowest` and `end` to end a chunk: the token index the next one starts at.
+    """
+    best, best_rank = end, 0
+    for index in range(end, lowest - 1, -1):
+        gap = text[offsets[index - 1][1]:offsets[index][0]]
+        if not gap:
+            # Inside a word, or before punctuation
+            continue
+        if PARAGRAPH_BREAK.search(gap):
+            return index
+        rank = 2 if SENTENCE_END.search(text[offsets[index - 1][0]:offsets[index - 1][1]]) else 1
+        if rank > best_rank:
+            best, best_rank = index, rank
+    return best
+
+
+def _word_start(offsets, index: int, end: int) -> int:
+    """
+    `index`, moved forward to the first token that starts a word, if one comes before `end`.
+    """
+    for candidate in range(index, end):
+        if offsets[candidate][0] > offsets[candidate - 1][1]:
+            return candidate
+    return index
@@ -0,0 +1,136 @@
+import hashlib
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import List, Optional
+
+import numpy as np
+
+from app.models.embedding_cache_model import EmbeddingCacheEntry
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalize a chunk so trivially different copies share a cache entry.
+    """
+    return _WHITESPACE.sub(' ', unicodedata.normalize('NFC', text)).strip()
+
+
+def text_hash(text: str) -> str:
+    """
+    SHA-256 hex digest of the normalized text.
+    """
+    return hashlib.sha256(normalize_text(text).encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, model_name: str, max_entries: Optional[int] = None, max_bytes: Optional[int] = None,
+                 persistent: Optional[bool] = None):
+        """
+        Two-tier cache of embeddings keyed on (model name, normalized text hash).
+
+        Args:
+            model_name (str): Model the cached vectors belong to.
+            max_entries (int): Most vectors held in memory.
+            max_bytes (int): Most vector bytes held in memory.
+            persistent (bool): Also read and write the `embedding_cache` table.
+        """
+        self.model_name = model_name
+        self.max_entries = max_entries if max_entries is not None \
+            else int(os.getenv('EMBEDDING_CACHE_MAX_ENTRIES', 10000))
+        self.max_bytes = max_bytes if max_bytes is not None \
+            else int(os.getenv('EMBEDDING_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+        self.persistent = persistent if persistent is not None \
+            else os.getenv('EMBEDDING_CACHE_PERSISTENT', 'false').lower() == 'true'
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+
+    def lookup(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """
+        Return the cached embedding for each text, or None where it is not cached.
+        """
+        keys = [text_hash(text) for text in texts]
+        results = [None] * len(texts)
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._entries.get(key)
+                if vector is not None:
+                    self._entries.move_to_end(key)
+                    results[i] = vector
+                    self.hits += 1
+
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing and self.persistent:
+            rows = (EmbeddingCacheEntry
+                    .select(EmbeddingCacheEntry.text_hash, EmbeddingCacheEntry.embedding)
+                    .where((EmbeddingCacheEntry.model_name == self.model_name) &
+                           (EmbeddingCacheEntry.text_hash.in_({keys[i] for i in missing}))))
+            with EmbeddingCacheEntry._meta.database.connection_context():
+                found = {row.text_hash: np.asarray(row.embedding, dtype=np.float32) for row in rows}
+            with self._lock:
+                for i in missing:
+                    vector = found.get(keys[i])
+                    if vector is not None:
+                        results[i] = vector
+                        self.persistent_hits += 1
+                for key, vector in found.items():
+                    self._add(key, vector)
+
+        with self._lock:
+            self.misses += sum(1 for result in results if result is None)
+        return results
+
+    def store(self, texts: List[str], embeddings):
+        """
+        Cache freshly computed embeddings.
+        """
+        keys = [text_hash(text) for text in texts]
+        vectors = [np.asarray(embedding, dtype=np.float32) for embedding in embeddings]
+        with self._lock:
+            for key, vector in zip(keys, vectors):
+                self._add(key, vector)
+        if self.persistent and keys:
+            rows = [{"model_name": self.model_name, "text_hash": key, "embedding": vector}
+                    for key, vector in dict(zip(keys, vectors)).items()]
+            with EmbeddingCacheEntry._meta.database.connection_context():
+                EmbeddingCacheEntry.insert_many(rows).on_conflict_ignore().execute()
+
+    def stats(self) -> dict:
+        """
+        Hit/miss counters and memory usage.
+        """
+        return {
+            "model": self.model_name,
+            "hits": self.hits,
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "persistent": self.persistent,
+        }
+
+    def _add(self, key: str, vector: np.ndarray):
+        """
+        Insert into the memory tier and evict least recently used entries over budget.
+        Caller must hold the lock.
+        """
+        if self.max_entries <= 0 or vector.nbytes > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= previous.nbytes
+        self._entries[key] = vector
+        self._bytes += vector.nbytes
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.nbytes
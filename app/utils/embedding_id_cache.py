@@ -0,0 +1,144 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Iterable, Optional, Tuple
+
+import numpy as np
+
+# Rough per-entry bookkeeping cost on top of the vector and text bytes
+ENTRY_OVERHEAD_BYTES = 200
+
+
+class EmbeddingIdCache:
+    def __init__(self, ttl: Optional[float] = None, max_bytes: Optional[int] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        Read-through cache of stored embeddings keyed by id.
+
+        Vectors are kept as float32 arrays. Entries expire after `ttl` seconds and the least
+        recently used ones are evicted to stay within `max_bytes`. Concurrent misses for the
+        same id share one load.
+
+        Args:
+            ttl (float): Seconds an entry stays valid. Defaults to `EMBEDDING_ID_CACHE_TTL`;
+                `0` disables the cache.
+            max_bytes (int): Most bytes of vectors and texts held. Defaults to
+                `EMBEDDING_ID_CACHE_MAX_BYTES`; `0` disables the cache.
+            clock (Callable): Time source for expiry.
+        """
+        self.ttl = ttl if ttl is not None else float(os.getenv('EMBEDDING_ID_CACHE_TTL', 300))
+        self.max_bytes = max_bytes if max_bytes is not None \
+            else int(os.getenv('EMBEDDING_ID_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+        self.clock = clock
+        # id -> (expires at, text, vector, size)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._loads = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_bytes > 0
+
+    def get(self, embedding_id: int, load: Callable[[int], Optional[Tuple[str, object]]]
+            ) -> Optional[Tuple[str, np.ndarray]]:
+        """
+        Return `(text, vector)` for an id, calling `load` on a miss.
+
+        `load` returns `(text, vector)` or None when the id does not exist. Missing ids are not
+        cached. Callers that miss while another load of the same id is running wait for it
+        instead of loading again; they see its result or its exception.
+        """
+        if not self.enabled:
+            result = load(embedding_id)
+            return None if result is None else (result[0], np.asarray(result[1], dtype=np.float32))
+
+        with self._lock:
+            entry = self._entries.get(embedding_id)
+            if entry is not None and entry[0] > self.clock():
+                self._entries.move_to_end(embedding_id)
+                self.hits += 1
+                return entry[1], entry[2]
+            if entry is not None:
+                self._remove(embedding_id)
+            pending = self._loads.get(embedding_id)
+            leader = pending is None
+            if leader:
+                pending = self._loads[embedding_id] = Future()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            return pending.result()
+
+        try:
+            result = load(embedding_id)
+            if result is not None:
+                result = (result[0], np.asarray(result[1], dtype=np.float32))
+        except BaseException as e:
+            with self._lock:
+                if self._loads.get(embedding_id) is pending:
+                    del self._loads[embedding_id]
+            pending.set_exception(e)
+            raise
+
+        with self._lock:
+            # An invalidation during the load drops it from `_loads`; its result may be stale
+            if self._loads.get(embedding_id) is pending:
+                del self._loads[embedding_id]
+                if result is not None:
+                    self._add(embedding_id, *result)
+        pending.set_result(result)
+        return result
+
+    def invalidate(self, embedding_ids: Iterable[int]):
+        """
+        Forget these ids, including loads of them still in flight.
+        """
+        with self._lock:
+            for embedding_id in embedding_ids:
+                self._remove(embedding_id)
+                self._loads.pop(embedding_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._loads.clear()
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+        }
+
+    def _add(self, embedding_id: int, text: str, vector: np.ndarray):
+        """
+        Insert an entry and evict least recently used ones over budget. Caller must hold the lock.
+        """
+        size = vector.nbytes + len(text) + ENTRY_OVERHEAD_BYTES
+        if size > self.max_bytes:
+            return
+        self._remove(embedding_id)
+        # Shared between callers, so nobody may modify it in place
+        vector.flags.writeable = False
+        self._entries[embedding_id] = (self.clock() + self.ttl, text, vector, size)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted[3]
+
+    def _remove(self, embedding_id: int):
+        entry = self._entries.pop(embedding_id, None)
+        if entry is not None:
+            self._bytes -= entry[3]
@@ -1,23 +1,184 @@
-from sentence_transformers import SentenceTransformer
-from typing import List
+import asyncio
+import os
+
+import numpy as np
+from typing import List, Callable, Optional, Tuple, TYPE_CHECKING
 import json
 
-from torch import Tensor
+from app.core.metrics import BATCH_SIZE, BATCH_TOKENS, CHUNK_TOKENS, STAGE_SECONDS
+from app.core.model_registry import MODEL_NAME, model_registry
+from app.utils.chunking import DocumentChunk, chunk_settings, chunk_text
+from app.utils.projection import transform_embeddings
 
-model = SentenceTransformer('paraphrase-MiniLM-L3-v2')
+if TYPE_CHECKING:
+    from torch import Tensor
 
-def compute_embedding_from_text(text: str) -> Tensor:
+def get_model(model_name: Optional[str] = None):
+    """
+    An embedding model, the default one unless `model_name` is given, loaded on first use.
+    """
+    return model_registry.get(model_name)
+
+
+def compute_embedding_from_text(text: str) -> 'Tensor':
     """
     Compute the embedding for the input text and return as a numpy array.
     """
-    return model.encode(text)
+    return get_model().encode(text)
+
+def compute_embeddings_from_texts(chunks: List[str], token_budget: Optional[int] = None,
+                                  model_name: Optional[str] = None, normalize: Optional[bool] = None) -> np.ndarray:
+    """
+    Compute embeddings for a list of texts as a float32 matrix, one row per text.
+
+    Args:
+        chunks (List[str]): Texts to encode.
+        token_budget (int): Padded tokens per forward pass for length-bucketed encoding, see
+            `compute_embeddings_bucketed`. Defaults to `EMBEDDING_TOKEN_BUDGET`; `0` encodes the
+            texts with a plain `model.encode` call.
+        model_name (str): Model to encode with, the default model when omitted.
+        normalize (bool): Scale each vector to unit L2 norm. Defaults to `EMBEDDING_NORMALIZE`.
+
+    When the model serves a projection (`EMBEDDING_PROJECTIONS`), the vectors are reduced with
+    it, see `transform_embeddings`.
+    """
+    if token_budget is None:
+        token_budget = int(os.getenv('EMBEDDING_TOKEN_BUDGET', 4096))
+    BATCH_SIZE.labels(model_name or model_registry.model_name).observe(len(chunks))
+    if token_budget <= 0 or len(chunks) <= 1:
+        with STAGE_SECONDS.labels('encode').time():
+            embeddings = np.asarray(get_model(model_name).encode(chunks), dtype=np.float32)
+    else:
+        embeddings = compute_embeddings_bucketed(chunks, token_budget, model_name)
+    return _to_served_space(embeddings, model_name, normalize)
+
+def compute_embeddings_from_tokens(token_ids: List[List[int]], token_budget: Optional[int] = None,
+                                   model_name: Optional[str] = None, normalize: Optional[bool] = None) -> np.ndarray:
+    """
+    Compute embeddings for texts already tokenized by the model's tokenizer, such as the
+    chunks of `chunk_documents`, without tokenizing them again.
+
+    Args:
+        token_ids (List[List[int]]): Token ids of each text, without special tokens, which
+            are added here. Each must leave room for them within `max_seq_length`.
+        token_budget (int): Padded tokens per forward pass, see `compute_embeddings_bucketed`.
+            Defaults to `EMBEDDING_TOKEN_BUDGET`.
 
-def compute_embeddings_from_texts(chunks: List[str]) -> List[List[float]]:
+    The vectors are normalized and projected as in `compute_embeddings_from_texts`.
     """
-    Compute embeddings for a list of texts.
+    if token_budget is None:
+        token_budget = int(os.getenv('EMBEDDING_TOKEN_BUDGET', 4096))
+    BATCH_SIZE.labels(model_name or model_registry.model_name).observe(len(token_ids))
+    model = get_model(model_name)
+    with STAGE_SECONDS.labels('tokenize').time():
+        prefix, suffix, token_types = special_token_template(model.tokenizer)
+        input_ids = [prefix + ids + suffix for ids in token_ids]
+        encoded = {"input_ids": input_ids, "attention_mask": [[1] * len(ids) for ids in input_ids]}
+        if token_types:
+            encoded["token_type_ids"] = [[0] * len(ids) for ids in input_ids]
+    embeddings = encode_tokenized(model, encoded, token_budget, model_name)
+    return _to_served_space(embeddings, model_name, normalize)
+
+def special_token_template(tokenizer) -> Tuple[List[int], List[int], bool]:
+    """
+    The special token ids a tokenizer puts before and after a single text, found by tokenizing
+    a probe with and without them, and whether its model takes token type ids.
+    """
+    probe = tokenizer("a", add_special_tokens=False)["input_ids"]
+    encoded = tokenizer("a")
+    input_ids = encoded["input_ids"]
+    start = next(index for index in range(len(input_ids)) if input_ids[index:index + len(probe)] == probe)
+    return input_ids[:start], input_ids[start + len(probe):], "token_type_ids" in encoded
+
+def _to_served_space(embeddings: np.ndarray, model_name: Optional[str], normalize: Optional[bool]) -> np.ndarray:
+    """
+    Normalize the model's vectors and reduce them with its projection, as configured.
+    """
+    normalize = model_registry.normalize if normalize is None else normalize
+    projection = model_registry.projection(model_name)
+    if not normalize and projection is None:
+        return embeddings
+    with STAGE_SECONDS.labels('project').time():
+        return transform_embeddings(embeddings, projection, normalize)
+
+def chunk_documents(texts: List[str], max_tokens: Optional[int] = None, overlap: Optional[int] = None,
+                    model_name: Optional[str] = None) -> List[List[DocumentChunk]]:
+    """
+    Split each document into overlapping chunks of the model's tokens, see `chunk_text`.
+
+    Args:
+        max_tokens (int): Tokens per chunk. Defaults to `EMBEDDING_CHUNK_TOKENS`, and never
+            exceeds what the model reads.
+        overlap (int): Tokens shared by consecutive chunks. Defaults to `EMBEDDING_CHUNK_OVERLAP`.
+
+    Raises:
+        ValueError: When the overlap is not smaller than the chunk size.
+    """
+    model = get_model(model_name)
+    max_tokens, overlap = chunk_settings(model.max_seq_length, model.tokenizer.num_special_tokens_to_add(),
+                                         max_tokens, overlap)
+    with STAGE_SECONDS.labels('chunk').time():
+        return [chunk_text(model.tokenizer, text, max_tokens, overlap) for text in texts]
+
+def compute_embeddings_bucketed(chunks: List[str], token_budget: int,
+                                model_name: Optional[str] = None) -> np.ndarray:
     """
-    embeddings = model.encode(chunks)
-    return [embedding.tolist() for embedding in embeddings]
+    Encode texts in batches of similar token length.
+
+    The texts are tokenized once, then encoded by `encode_tokenized`.
+    """
+    model = get_model(model_name)
+    with STAGE_SECONDS.labels('tokenize').time():
+        encoded = model.tokenizer([chunk.strip() for chunk in chunks], truncation=True,
+                                  max_length=model.max_seq_length)
+    return encode_tokenized(model, encoded, token_budget, model_name)
+
+def encode_tokenized(model, encoded, token_budget: int, model_name: Optional[str] = None) -> np.ndarray:
+    """
+    Encode tokenized texts in batches of similar token length.
+
+    The texts are sorted by length, then cut into batches whose padded size (rows x longest
+    row) stays within `token_budget`, so short texts run in large batches and are not padded
+    to the length of long ones. Rows are returned in the input order.
+
+    Args:
+        encoded (Dict[str, List[List[int]]]): Tokenizer output, `input_ids` and the like, per text.
+    """
+    import torch
+
+    lengths = [len(input_ids) for input_ids in encoded["input_ids"]]
+    chunk_tokens = CHUNK_TOKENS.labels(model_name or model_registry.model_name)
+    for length in lengths:
+        chunk_tokens.observe(length)
+    # Longest first, so the largest padded batch runs (and fails, if it must) early
+    order = sorted(range(len(lengths)), key=lambda index: -lengths[index])
+
+    batches, batch = [], []
+    for index in order:
+        # Lengths only decrease, so the first row sets the batch's padded length
+        if batch and (len(batch) + 1) * lengths[batch[0]] > token_budget:
+            batches.append(batch)
+            batch = []
+        batch.append(index)
+    if batch:
+        batches.append(batch)
+
+    batch_tokens = BATCH_TOKENS.labels(model_name or model_registry.model_name)
+    embeddings = None
+    for batch in batches:
+        batch_tokens.observe(len(batch) * lengths[batch[0]])
+        with STAGE_SECONDS.labels('pad').time():
+            features = model.tokenizer.pad({key: [values[index] for index in batch]
+                                            for key, values in encoded.items()}, return_tensors="pt")
+            features = {key: value.to(model.device) for key, value in features.items()}
+        with STAGE_SECONDS.labels('forward').time(), torch.inference_mode():
+            output = model(features)["sentence_embedding"]
+        with STAGE_SECONDS.labels('to_numpy').time():
+            output = output.float().cpu().numpy()
+        if embeddings is None:
+            embeddings = np.empty((len(lengths), output.shape[1]), dtype=np.float32)
+        embeddings[batch] = output
+    return embeddings
 
 def convert_embedding_to_float_list(embedding_instance) -> List[float]:
     """
@@ -31,3 +192,127 @@ def convert_embedding_to_float_list(embedding_instance) -> List[float]:
             return json.loads(embedding_str)
     except (ValueError, json.JSONDecodeError, AttributeError) as e:
         raise ValueError(f"Failed to parse embedding: {e}")
+
+
+class EmbeddingBatcher:
+    def __init__(self, encode: Optional[Callable[[List[str]], np.ndarray]] = None,
+                 max_batch_size: Optional[int] = None, max_wait_ms: Optional[float] = None,
+                 executor=None, cache=None, dimensions: Optional[int] = None):
+        """
+        Pool chunks from concurrent requests into a single encode call.
+
+        A batch is flushed as soon as it holds `max_batch_size` chunks or when the
+        oldest pending request has waited `max_wait_ms`, whichever comes first.
+
+        Args:
+            encode (Callable): Function mapping a list of texts to their embeddings.
+                Defaults to `compute_embeddings_from_texts`.
+            max_batch_size (int): Number of chunks that triggers an immediate flush.
+            max_wait_ms (float): Longest time a request waits for others to join its batch.
+            executor (InferenceExecutor): Pool the encode call runs on. When omitted the
+                batch is encoded directly on the event loop.
+            cache (EmbeddingCache): When given, only chunks missing from the cache are encoded.
+            dimensions (int): Width of the empty array an empty request gets back.
+        """
+        self.encode = encode
+        self.executor = executor
+        self.cache = cache
+        self.dimensions = dimensions or 0
+        self.max_batch_size = max_batch_size or int(os.getenv('EMBEDDING_BATCH_MAX_SIZE', 64))
+        self.max_wait = (max_wait_ms if max_wait_ms is not None
+                         else float(os.getenv('EMBEDDING_BATCH_MAX_WAIT_MS', 5))) / 1000
+        self._loop = None
+        self._pending = []
+        self._pending_size = 0
+        self._flush_handle = None
+        self._tasks = set()
+
+    async def embed(self, chunks: List[str]) -> np.ndarray:
+        """
+        Queue the chunks for the next batch and wait for their embeddings.
+        """
+        if not chunks:
+            return np.empty((0, self.dimensions), dtype=np.float32)
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Pending work belongs to a loop that is gone; start over on this one.
+            self._loop = loop
+            self._pending = []
+            self._pending_size = 0
+            self._flush_handle = None
+
+        future = loop.create_future()
+        self._pending.append((chunks, future))
+        self._pending_size += len(chunks)
+
+        if self._pending_size >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        """
+        Take everything pending and start encoding it as one batch.
+        """
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending, self._pending_size = self._pending, [], 0
+        if not batch:
+            return
+        task = self._loop.create_task(self._run_batch(batch))
+        # Keep a reference so the task is not garbage collected mid-flight
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch):
+        """
+        Encode a batch in one call and hand each request its slice.
+        """
+        texts = [chunk for chunks, _ in batch for chunk in chunks]
+        try:
+            if self.cache is not None:
+                embeddings = await self._encode_cached(texts)
+            else:
+                embeddings = await self._encode(texts)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        offset = 0
+        for chunks, future in batch:
+            if not future.done():
+                future.set_result(embeddings[offset:offset + len(chunks)])
+            offset += len(chunks)
+
+    async def _encode(self, texts: List[str]) -> np.ndarray:
+        """
+        Run the encode function, on the executor when there is one.
+        """
+        encode = self.encode or compute_embeddings_from_texts
+        if self.executor is not None:
+            return await self.executor.run(encode, texts)
+        return encode(texts)
+
+    async def _encode_cached(self, texts: List[str]) -> np.ndarray:
+        """
+        Serve what the cache has and encode each distinct missing text once.
+        """
+        if self.cache.persistent:
+            embeddings = await asyncio.to_thread(self.cache.lookup, texts)
+        else:
+            embeddings = self.cache.lookup(texts)
+
+        misses = list(dict.fromkeys(text for text, embedding in zip(texts, embeddings) if embedding is None))
+        if misses:
+            encoded = dict(zip(misses, await self._encode(misses)))
+            if self.cache.persistent:
+                await asyncio.to_thread(self.cache.store, misses, [encoded[text] for text in misses])
+            else:
+                self.cache.store(misses, [encoded[text] for text in misses])
+            embeddings = [embedding if embedding is not None else encoded[text]
+                          for text, embedding in zip(texts, embeddings)]
+        return np.asarray(embeddings, dtype=np.float32)
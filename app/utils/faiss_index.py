@@ -0,0 +1,201 @@
+import json
+import logging
+import os
+import threading
+from typing import List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FAISS_METRICS = {
+    'cosine': faiss.METRIC_INNER_PRODUCT,
+    'inner_product': faiss.METRIC_INNER_PRODUCT,
+    'l2': faiss.METRIC_L2,
+}
+
+
+class FaissIndex:
+    def __init__(self, dimension: int, index_type: str = 'flat', metric: str = 'cosine',
+                 snapshot_path: Optional[str] = None, hnsw_m: int = 32, ivf_lists: int = 1024,
+                 pq_subquantizers: int = 48):
+        """
+        In-memory FAISS index over the `Embedding` table, mirrored on every save.
+
+        Args:
+            dimension (int): Vector dimension.
+            index_type (str): "flat" (exact), "hnsw" or "ivfpq".
+            metric (str): "cosine", "l2" or "inner_product". Cosine vectors are L2-normalized
+                and searched by inner product.
+            snapshot_path (str): File the index is written to on `save` and read from on `load`.
+            hnsw_m (int): HNSW graph degree.
+            ivf_lists (int): IVF-PQ coarse clusters.
+            pq_subquantizers (int): IVF-PQ sub-vectors, must divide `dimension`.
+        """
+        if index_type not in ('flat', 'hnsw', 'ivfpq'):
+            raise ValueError(f"Unknown FAISS index type: {index_type}")
+        if metric not in FAISS_METRICS:
+            raise ValueError(f"Unknown FAISS metric: {metric}")
+        self.dimension = dimension
+        self.index_type = index_type
+        self.metric = metric
+        self.snapshot_path = snapshot_path
+        self.hnsw_m = hnsw_m
+        self.ivf_lists = ivf_lists
+        self.pq_subquantizers = pq_subquantizers
+        self.last_id = 0
+        self.index = None
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_env(cls, dimension: int) -> Optional['FaissIndex']:
+        """
+        Build the index configured through the environment, or None when it is disabled.
+        """
+        if os.getenv('EMBEDDING_FAISS_ENABLED', 'false').lower() != 'true':
+            return None
+        return cls(dimension,
+                   index_type=os.getenv('EMBEDDING_FAISS_INDEX', 'flat').lower(),
+                   metric=os.getenv('EMBEDDING_FAISS_METRIC', 'cosine').lower(),
+                   snapshot_path=os.getenv('EMBEDDING_FAISS_SNAPSHOT') or None,
+                   hnsw_m=int(os.getenv('EMBEDDING_FAISS_HNSW_M', 32)),
+                   ivf_lists=int(os.getenv('EMBEDDING_FAISS_IVF_LISTS', 1024)),
+                   pq_subquantizers=int(os.getenv('EMBEDDING_FAISS_PQ_M', 48)))
+
+    @property
+    def size(self) -> int:
+        return self.index.ntotal if self.index is not None else 0
+
+    def supports(self, metric: str) -> bool:
+        """
+        Whether searches with this metric can be answered from the index.
+        """
+        return self.index is not None and metric == self.metric
+
+    def load(self, rows):
+        """
+        Restore the snapshot when there is one, then add every row newer than it.
+
+        Args:
+            rows (Callable[[int], Iterable]): Returns `(id, vector)` pairs with an id greater
+                than the given one, in id order.
+        """
+        with self._lock:
+            if not self._read_snapshot():
+                self.index = None
+                self.last_id = 0
+
+            pending_ids, pending_vectors = [], []
+            for embedding_id, vector in rows(self.last_id):
+                pending_ids.append(embedding_id)
+                pending_vectors.append(vector)
+            if self.index is None:
+                self.index = self._build_index(pending_vectors)
+            if pending_ids:
+                self.add(pending_ids, pending_vectors)
+            logger.info("FAISS %s index ready with %d vectors", self.index_type, self.size)
+
+    def add(self, ids: List[int], vectors):
+        """
+        Add vectors under their `Embedding` ids.
+        """
+        if not ids:
+            return
+        matrix = self._prepare(vectors)
+        with self._lock:
+            if self.index is None:
+                self.index = self._build_index(matrix)
+            self.index.add_with_ids(matrix, np.asarray(ids, dtype=np.int64))
+            self.last_id = max(self.last_id, max(ids))
+
+    def search(self, vector, k: int, ef_search: Optional[int] = None,
+               probes: Optional[int] = None) -> List[Tuple[int, float]]:
+        """
+        Return `(id, distance)` pairs for the `k` nearest vectors, closest first.
+
+        Distances follow the pgvector operators: cosine distance, L2 distance and
+        negative inner product.
+        """
+        query = self._prepare([vector])
+        params = None
+        if ef_search and self.index_type == 'hnsw':
+            params = faiss.SearchParametersHNSW(efSearch=int(ef_search))
+        elif probes and self.index_type == 'ivfpq':
+            params = faiss.SearchParametersIVF(nprobe=int(probes))
+        with self._lock:
+            scores, ids = self.index.search(query, k, params=params)
+
+        results = []
+        for embedding_id, score in zip(ids[0], scores[0]):
+            if embedding_id < 0:
+                continue
+            if self.metric == 'cosine':
+                distance = 1.0 - float(score)
+            elif self.metric == 'l2':
+                distance = float(np.sqrt(max(score, 0.0)))
+            else:
+                distance = -float(score)
+            results.append((int(embedding_id), distance))
+        return results
+
+    def save(self):
+        """
+        Write the index and its metadata to `snapshot_path`.
+        """
+        if not self.snapshot_path or self.index is None:
+            return
+        with self._lock:
+            faiss.write_index(self.index, self.snapshot_path)
+            with open(f"{self.snapshot_path}.json", "w") as metadata:
+                json.dump(self._metadata(), metadata)
+        logger.info("FAISS index snapshot written to %s", self.snapshot_path)
+
+    def _metadata(self) -> dict:
+        return {"index_type": self.index_type, "metric": self.metric, "dimension": self.dimension,
+                "last_id": self.last_id}
+
+    def _read_snapshot(self) -> bool:
+        """
+        Load the snapshot if it exists and was built with the current settings.
+        """
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return False
+        try:
+            with open(f"{self.snapshot_path}.json") as metadata_file:
+                metadata = json.load(metadata_file)
+        except (OSError, ValueError):
+            return False
+        if {key: metadata.get(key) for key in ("index_type", "metric", "dimension")} != \
+                {key: value for key, value in self._metadata().items() if key != "last_id"}:
+            logger.warning("FAISS snapshot settings differ from the configuration, rebuilding")
+            return False
+        self.index = faiss.read_index(self.snapshot_path)
+        self.last_id = metadata["last_id"]
+        return True
+
+    def _prepare(self, vectors) -> np.ndarray:
+        matrix = np.ascontiguousarray(np.asarray(vectors, dtype=np.float32).reshape(-1, self.dimension))
+        if self.metric == 'cosine':
+            matrix = matrix.copy()
+            faiss.normalize_L2(matrix)
+        return matrix
+
+    def _build_index(self, training_vectors):
+        """
+        Create an empty index. IVF-PQ is trained on `training_vectors` and falls back to a
+        flat index when there are too few of them to train on.
+        """
+        metric = FAISS_METRICS[self.metric]
+        if self.index_type == 'hnsw':
+            return faiss.IndexIDMap2(faiss.IndexHNSWFlat(self.dimension, self.hnsw_m, metric))
+        if self.index_type == 'ivfpq':
+            # k-means wants ~39 points per centroid for both the coarse and the PQ codebooks
+            if len(training_vectors) >= 39 * max(self.ivf_lists, 256):
+                quantizer = faiss.IndexFlat(self.dimension, metric)
+                index = faiss.IndexIVFPQ(quantizer, self.dimension, self.ivf_lists, self.pq_subquantizers, 8,
+                                         metric)
+                index.train(self._prepare(training_vectors))
+                return index
+            logger.warning("Not enough vectors to train IVF-PQ (%d), using a flat index", len(training_vectors))
+        return faiss.IndexIDMap2(faiss.IndexFlat(self.dimension, metric))
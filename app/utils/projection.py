@@ -0,0 +1,158 @@
+import json
+import os
+import re
+import time
+from typing import List, Optional
+
+import numpy as np
+
+PROJECTION_METHODS = ('pca', 'truncate')
+
+
+def l2_normalize(matrix) -> np.ndarray:
+    """
+    Scale every row of a matrix to unit L2 norm, as float32. All-zero rows stay zero.
+
+    On unit vectors inner product equals cosine similarity, so the cheaper inner-product
+    operator and index can serve cosine searches.
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, np.finfo(np.float32).tiny)
+
+
+class Projection:
+    def __init__(self, components: np.ndarray, mean: Optional[np.ndarray] = None, method: str = 'pca',
+                 version: Optional[int] = None, explained_variance: Optional[float] = None,
+                 sample_size: Optional[int] = None, created_at: Optional[float] = None):
+        """
+        Linear map of a model's vectors to fewer dimensions: `(x - mean) @ components.T`.
+
+        Args:
+            components (np.ndarray): One row per output dimension, one column per input dimension.
+            mean (np.ndarray): Subtracted before projecting, None for no centering.
+            method (str): "pca" for principal components, "truncate" for the leading dimensions
+                as they are (Matryoshka-style, for models trained to front-load information).
+            version (int): Version the projection is saved under.
+            explained_variance (float): Share of the sample's variance the output keeps.
+            sample_size (int): Vectors the projection was fitted on.
+            created_at (float): Epoch seconds of the fit.
+        """
+        self.components = np.ascontiguousarray(components, dtype=np.float32)
+        self.mean = None if mean is None else np.asarray(mean, dtype=np.float32)
+        self.method = method
+        self.version = version
+        self.explained_variance = explained_variance
+        self.sample_size = sample_size
+        self.created_at = created_at if created_at is not None else time.time()
+
+    @property
+    def input_dimensions(self) -> int:
+        return self.components.shape[1]
+
+    @property
+    def output_dimensions(self) -> int:
+        return self.components.shape[0]
+
+    @classmethod
+    def fit_pca(cls, sample, dimensions: int) -> 'Projection':
+        """
+        Principal components of a sample of vectors, keeping the `dimensions` largest.
+        """
+        sample = np.asarray(sample, dtype=np.float64)
+        if not 0 < dimensions <= min(sample.shape):
+            raise ValueError(f"Cannot fit {dimensions} components on a {sample.shape[0]}x{sample.shape[1]} sample")
+        mean = sample.mean(axis=0)
+        _, singular_values, components = np.linalg.svd(sample - mean, full_matrices=False)
+        variance = singular_values ** 2
+        return cls(components[:dimensions], mean, 'pca', explained_variance=float(variance[:dimensions].sum() /
+                                                                                     variance.sum()),
+                   sample_size=len(sample))
+
+    @classmethod
+    def truncation(cls, input_dimensions: int, dimensions: int, sample=None) -> 'Projection':
+        """
+        Keep the first `dimensions` of each vector. With a sample, the kept variance is recorded.
+        """
+        if not 0 < dimensions <= input_dimensions:
+            raise ValueError(f"Cannot keep {dimensions} of {input_dimensions} dimensions")
+        explained = None
+        if sample is not None and len(sample):
+            variance = np.asarray(sample, dtype=np.float64).var(axis=0)
+            explained = float(variance[:dimensions].sum() / variance.sum())
+        return cls(np.eye(dimensions, input_dimensions), None, 'truncate', explained_variance=explained,
+                   sample_size=None if sample is None else len(sample))
+
+    def apply(self, matrix) -> np.ndarray:
+        """
+        Project a matrix of vectors, one per row, to float32 rows of `output_dimensions`.
+        """
+        matrix = np.asarray(matrix, dtype=np.float32)
+        if matrix.shape[-1] != self.input_dimensions:
+            raise ValueError(f"Projection expects {self.input_dimensions} dimensions, got {matrix.shape[-1]}")
+        if self.method == 'truncate':
+            return np.ascontiguousarray(matrix[..., :self.output_dimensions])
+        if self.mean is not None:
+            matrix = matrix - self.mean
+        return matrix @ self.components.T
+
+    def info(self) -> dict:
+        return {"version": self.version, "method": self.method, "input_dimensions": self.input_dimensions,
+                "output_dimensions": self.output_dimensions, "explained_variance": self.explained_variance,
+                "sample_size": self.sample_size, "created_at": self.created_at}
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        arrays = {"components": self.components}
+        if self.mean is not None:
+            arrays["mean"] = self.mean
+        # Written next to the target and renamed, so readers never see a partial file
+        temporary = f"{path}.tmp.npz"
+        np.savez(temporary, info=np.array(json.dumps(self.info())), **arrays)
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'Projection':
+        with np.load(path) as data:
+            info = json.loads(str(data["info"]))
+            mean = data["mean"] if "mean" in data else None
+            return cls(data["components"], mean, info["method"], info["version"], info["explained_variance"],
+                       info["sample_size"], info["created_at"])
+
+
+def transform_embeddings(matrix, projection: Optional[Projection] = None, normalize: bool = False) -> np.ndarray:
+    """
+    Bring freshly encoded (or stored full-dimension) vectors into the served vector space:
+    normalized, projected, then normalized again so that projected vectors are unit length too.
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if normalize:
+        matrix = l2_normalize(matrix)
+    if projection is not None:
+        matrix = projection.apply(matrix)
+        if normalize:
+            matrix = l2_normalize(matrix)
+    return matrix
+
+
+def projection_directory(model_name: str, root: Optional[str] = None) -> str:
+    root = root or os.getenv('EMBEDDING_PROJECTION_DIR', 'projections')
+    return os.path.join(root, model_name.replace('/', '__'))
+
+
+def projection_path(model_name: str, version: int, root: Optional[str] = None) -> str:
+    """
+    File a projection version of a model is saved to: `<root>/<model>/v<version>.npz`.
+    """
+    return os.path.join(projection_directory(model_name, root), f"v{int(version)}.npz")
+
+
+def projection_versions(model_name: str, root: Optional[str] = None) -> List[int]:
+    """
+    Saved projection versions of a model, oldest first.
+    """
+    directory = projection_directory(model_name, root)
+    if not os.path.isdir(directory):
+        return []
+    return sorted(int(match.group(1)) for match in map(re.compile(r'v(\d+)\.npz$').match, os.listdir(directory))
+                  if match)
@@ -0,0 +1,95 @@
+import json
+from typing import AsyncIterator, List
+
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import ClientDisconnect
+from starlette.responses import StreamingResponse
+
+
+async def iter_ndjson_chunks(stream: AsyncIterator[bytes], max_line_bytes: int) -> AsyncIterator[str]:
+    """
+    Yield chunk texts from a newline-delimited JSON byte stream as they arrive.
+
+    Each non-blank line is either a JSON string or an object with a "text" field. Only the
+    current partial line is buffered.
+
+    Raises:
+        ValueError: On a malformed line or one longer than `max_line_bytes`.
+    """
+    buffer = b''
+    line_number = 0
+    async for data in stream:
+        buffer += data
+        *lines, buffer = buffer.split(b'\n')
+        for line in lines:
+            line_number += 1
+            chunk = _parse_line(line, line_number, max_line_bytes)
+            if chunk is not None:
+                yield chunk
+        if len(buffer) > max_line_bytes:
+            raise ValueError(f"Line {line_number + 1} is longer than {max_line_bytes} bytes")
+    chunk = _parse_line(buffer, line_number + 1, max_line_bytes)
+    if chunk is not None:
+        yield chunk
+
+
+async def iter_file(path: str, block_size: int = 1024 * 1024) -> AsyncIterator[bytes]:
+    """
+    Read a file as an async byte stream, one block at a time off the event loop.
+    """
+    with open(path, 'rb') as file:
+        while True:
+            data = await run_in_threadpool(file.read, block_size)
+            if not data:
+                return
+            yield data
+
+
+async def iter_batches(chunks: AsyncIterator[str], batch_size: int) -> AsyncIterator[List[str]]:
+    """
+    Group an async stream of chunks into lists of at most `batch_size`.
+    """
+    batch = []
+    async for chunk in chunks:
+        batch.append(chunk)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class NDJSONStreamingResponse(StreamingResponse):
+    """
+    Streaming response whose body is produced while the request body is still being read.
+
+    `StreamingResponse` listens for a client disconnect by consuming `receive`, which would
+    swallow the request body; here the body iterator is the only reader, and a disconnect
+    surfaces as `ClientDisconnect` from `Request.stream()`.
+    """
+    media_type = "application/x-ndjson"
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await self.stream_response(send)
+        except ClientDisconnect:
+            return
+        if self.background is not None:
+            await self.background()
+
+
+def _parse_line(line: bytes, line_number: int, max_line_bytes: int):
+    if len(line) > max_line_bytes:
+        raise ValueError(f"Line {line_number} is longer than {max_line_bytes} bytes")
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        value = json.loads(line)
+    except ValueError:
+        raise ValueError(f"Line {line_number} is not valid JSON")
+    if isinstance(value, dict):
+        value = value.get('text')
+    if not isinstance(value, str):
+        raise ValueError(f"Line {line_number} must be a JSON string or an object with a 'text' string")
+    return value
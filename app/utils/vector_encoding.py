@@ -0,0 +1,147 @@
+import base64
+import io
+import json
+from typing import List, NamedTuple, Optional
+
+import numpy as np
+from fastapi import HTTPException
+from fastapi.responses import Response
+
+from app.core.metrics import STAGE_SECONDS
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+DTYPES = {
+    'float32': np.dtype('<f4'),
+    'float16': np.dtype('<f2'),
+}
+
+# Media type -> how the vectors in the payload are encoded
+MEDIA_TYPES = {
+    'application/json': 'list',
+    'application/octet-stream': 'raw',
+    'application/x-npy': 'npy',
+    'application/msgpack': 'msgpack',
+    'application/x-msgpack': 'msgpack',
+}
+
+
+class VectorFormat(NamedTuple):
+    media_type: str
+    encoding: str
+    dtype: np.dtype
+
+
+JSON_FORMAT = VectorFormat('application/json', 'list', DTYPES['float32'])
+
+
+def negotiate_vector_format(accept: Optional[str]) -> VectorFormat:
+    """
+    Pick the response format from an Accept header.
+
+    Supported media types are application/json, application/octet-stream (raw little-endian
+    bytes), application/x-npy and application/msgpack. A `dtype=float16` parameter halves the
+    vector size, and `application/json; encoding=base64` sends each vector as base64 bytes.
+
+    Raises:
+        HTTPException: 406 when no acceptable format is supported.
+    """
+    if not accept:
+        return JSON_FORMAT
+
+    candidates = []
+    for position, item in enumerate(accept.split(',')):
+        media_type, *raw_params = [part.strip() for part in item.split(';')]
+        params = dict(param.split('=', 1) for param in raw_params if '=' in param)
+        params = {key.strip().lower(): value.strip().strip('"').lower() for key, value in params.items()}
+        try:
+            quality = float(params.pop('q', 1))
+        except ValueError:
+            quality = 0
+        if quality > 0:
+            candidates.append((-quality, position, media_type.lower(), params))
+
+    for _, _, media_type, params in sorted(candidates):
+        if media_type in ('*/*', 'application/*'):
+            return JSON_FORMAT
+        encoding = MEDIA_TYPES.get(media_type)
+        dtype = DTYPES.get(params.get('dtype', 'float32'))
+        if encoding is None or dtype is None or (encoding == 'msgpack' and msgpack is None):
+            continue
+        if encoding == 'list' and params.get('encoding') == 'base64':
+            encoding = 'base64'
+        elif encoding == 'list' and dtype != DTYPES['float32']:
+            continue
+        return VectorFormat(media_type, encoding, dtype)
+
+    raise HTTPException(status_code=406, detail="Supported formats: " + ", ".join(MEDIA_TYPES))
+
+
+def vector_response(content: dict, vector_format: VectorFormat, vectors: List[np.ndarray],
+                    ids: Optional[List[int]] = None) -> Response:
+    """
+    Render an endpoint payload in the negotiated format.
+
+    Args:
+        content (dict): JSON-style payload. NumPy arrays inside it are encoded according to
+            `vector_format`.
+        vector_format (VectorFormat): Result of `negotiate_vector_format`.
+        vectors (List[np.ndarray]): The vectors of the payload in order, sent as one matrix
+            by the raw and npy formats.
+        ids (List[int]): Ids of `vectors`, sent in the X-Embedding-Ids header by the raw and
+            npy formats.
+    """
+    with STAGE_SECONDS.labels('serialize').time():
+        return _vector_response(content, vector_format, vectors, ids)
+
+
+def _vector_response(content: dict, vector_format: VectorFormat, vectors: List[np.ndarray],
+                     ids: Optional[List[int]]) -> Response:
+    dtype = vector_format.dtype
+    headers = {} if vector_format.encoding == 'list' else {"X-Embedding-Dtype": dtype.name}
+
+    if vector_format.encoding in ('raw', 'npy'):
+        matrix = np.asarray(vectors, dtype=dtype)
+        if matrix.ndim != 2:
+            matrix = matrix.reshape(len(vectors), -1 if len(vectors) else 0)
+        headers["X-Embedding-Shape"] = f"{matrix.shape[0]},{matrix.shape[1]}"
+        if ids is not None:
+            headers["X-Embedding-Ids"] = ",".join(str(embedding_id) for embedding_id in ids)
+        if vector_format.encoding == 'raw':
+            body = matrix.tobytes()
+        else:
+            buffer = io.BytesIO()
+            np.save(buffer, matrix, allow_pickle=False)
+            body = buffer.getvalue()
+        return Response(content=body, media_type=vector_format.media_type, headers=headers)
+
+    if vector_format.encoding == 'msgpack':
+        body = msgpack.packb(content, default=lambda value: _encode_array(value, dtype, 'bytes'))
+        return Response(content=body, media_type=vector_format.media_type, headers=headers)
+
+    body = encode_json(content, 'base64' if vector_format.encoding == 'base64' else 'list', dtype)
+    return Response(content=body, media_type='application/json', headers=headers)
+
+
+def encode_json(content, encoding: str = 'list', dtype: np.dtype = DTYPES['float32']) -> str:
+    """
+    Serialize a payload to compact JSON, writing NumPy arrays as float lists or base64 bytes.
+    """
+    return json.dumps(content, separators=(',', ':'), default=lambda value: _encode_array(value, dtype, encoding))
+
+
+def _encode_array(value, dtype: np.dtype, encoding: str):
+    """
+    Encode one array for a serializer's fallback hook.
+    """
+    if isinstance(value, np.generic):
+        return value.item()
+    if not isinstance(value, np.ndarray):
+        raise TypeError(f"Object of type {type(value).__name__} is not serializable")
+    if encoding == 'list':
+        return value.tolist()
+    data = np.asarray(value, dtype=dtype).tobytes()
+    return base64.b64encode(data).decode('ascii') if encoding == 'base64' else data
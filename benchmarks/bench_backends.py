@@ -0,0 +1,52 @@
+"""
+Latency and throughput of each inference backend (torch, onnx, onnx-int8).
+
+Single-text latency is what a lone search query pays; throughput uses the same chunk length
+distribution as `bench_bucketing`. ONNX models are exported to `EMBEDDING_ONNX_DIR` on first use.
+
+    python -m benchmarks.bench_backends --chunks 1000 --backends torch onnx onnx-int8
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.core.model_registry import ModelRegistry
+from app.utils import embedding_utils
+from benchmarks.bench_bucketing import make_chunks
+
+
+def run(count, backends, queries):
+    chunks = make_chunks(count)
+    reference = None
+    print(f"{'backend':<12}{'p50 ms':>10}{'p99 ms':>10}{'chunks/s':>12}{'min cos':>10}")
+    for backend in backends:
+        # Encoding goes through the registry, so each backend gets one of its own
+        embedding_utils.model_registry = ModelRegistry(backend=backend)
+        embedding_utils.compute_embeddings_from_texts(chunks[:64])  # warm-up
+
+        timings = []
+        for text in chunks[:queries]:
+            start = time.perf_counter()
+            embedding_utils.compute_embeddings_from_texts([text])
+            timings.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        embeddings = embedding_utils.compute_embeddings_from_texts(chunks)
+        throughput = count / (time.perf_counter() - start)
+
+        normalized = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+        if reference is None:
+            reference = normalized
+        similarity = (normalized * reference).sum(axis=1).min()
+        print(f"{backend:<12}{np.median(timings) * 1000:>10.2f}{np.percentile(timings, 99) * 1000:>10.2f}"
+              f"{throughput:>12.1f}{similarity:>10.4f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chunks", type=int, default=1000)
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx", "onnx-int8"])
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+    run(args.chunks, args.backends, args.queries)
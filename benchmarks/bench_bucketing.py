@@ -0,0 +1,64 @@
+"""
+Throughput of plain `model.encode` against length-bucketed encoding with a token budget.
+
+Chunk lengths follow a log-normal distribution clipped to 5-500 words (median ~35), which is
+close to what document chunkers produce. Needs the model, but no database.
+
+    python -m benchmarks.bench_bucketing --chunks 2000 --budgets 4096 8192 16384
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.utils import embedding_utils
+
+WORDS = ("the of and to in is that for it as was with be by on not he this are or his from at which but have "
+         "an they you were her she there been one all we their has would when if so no will more can what out "
+         "about up them some could him into its then two time only new these may first any like now my other "
+         "over such our man me even most made after also did many before must through back years where much "
+         "your way well down should because each just those people how too little state good very make world "
+         "still own see men work long get here between both life being under never day same another know "
+         "while last might us great old year off come since against go came right used take three").split()
+
+
+def make_chunks(count, seed=0):
+    rng = np.random.default_rng(seed)
+    lengths = np.clip(rng.lognormal(mean=3.5, sigma=0.9, size=count), 5, 500).astype(int)
+    return [" ".join(rng.choice(WORDS, length)) for length in lengths]
+
+
+def measure(encode, chunks, repeats):
+    encode(chunks[:64])  # warm-up
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        encode(chunks)
+        timings.append(time.perf_counter() - start)
+    return len(chunks) / min(timings)
+
+
+def run(count, budgets, repeats):
+    chunks = make_chunks(count)
+    model = embedding_utils.get_model()
+    lengths = [len(ids) for ids in model.tokenizer(chunks, truncation=True,
+                                                   max_length=model.max_seq_length)["input_ids"]]
+    print(f"{count} chunks, tokens p50={int(np.median(lengths))} p95={int(np.percentile(lengths, 95))} "
+          f"max={max(lengths)}")
+
+    baseline = measure(lambda texts: model.encode(texts, batch_size=32), chunks, repeats)
+    print(f"{'strategy':<24}{'chunks/s':>12}{'speedup':>10}")
+    print(f"{'encode batch_size=32':<24}{baseline:>12.1f}{1.0:>10.2f}")
+    for budget in budgets:
+        throughput = measure(lambda texts: embedding_utils.compute_embeddings_bucketed(texts, budget),
+                             chunks, repeats)
+        print(f"{'bucketed ' + str(budget):<24}{throughput:>12.1f}{throughput / baseline:>10.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--budgets", type=int, nargs="+", default=[4096, 8192, 16384])
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+    run(args.chunks, args.budgets, args.repeats)
@@ -0,0 +1,75 @@
+"""
+Throughput of splitting whole documents into chunks and encoding them, with and without
+re-tokenizing the chunk texts.
+
+Documents are sentences of 5-30 common words, in paragraphs of 2-8 sentences. Each is split by
+`chunk_documents`, then its chunks are encoded either from their texts, which tokenizes them a
+second time, or from the token ids the split produced, as `/embedding/documents/` does. Needs
+the model, but no database.
+
+    python -m benchmarks.bench_chunking --documents 100 --words 2000 --max-tokens 256 --overlap 32
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.utils import embedding_utils
+from benchmarks.bench_bucketing import WORDS
+
+
+def make_documents(count, words, seed=0):
+    rng = np.random.default_rng(seed)
+    documents = []
+    for _ in range(count):
+        paragraphs, length = [], 0
+        while length < words:
+            sentences = []
+            for _ in range(rng.integers(2, 9)):
+                size = int(rng.integers(5, 31))
+                sentences.append(" ".join(rng.choice(WORDS, size)).capitalize() + ".")
+                length += size
+            paragraphs.append(" ".join(sentences))
+        documents.append("\n\n".join(paragraphs))
+    return documents
+
+
+def measure(run, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run(count, words, max_tokens, overlap, repeats):
+    documents = make_documents(count, words)
+    embedding_utils.chunk_documents(documents[:2], max_tokens, overlap)  # loads the model
+    chunked = embedding_utils.chunk_documents(documents, max_tokens, overlap)
+    chunks = [chunk for chunks in chunked for chunk in chunks]
+    tokens = [len(chunk.token_ids) for chunk in chunks]
+    print(f"{count} documents of ~{words} words, {len(chunks)} chunks, tokens per chunk "
+          f"p50={int(np.median(tokens))} max={max(tokens)}, overlap {overlap}")
+
+    split = measure(lambda: embedding_utils.chunk_documents(documents, max_tokens, overlap), repeats)
+    retokenize = measure(lambda: embedding_utils.compute_embeddings_from_texts([chunk.text for chunk in chunks]),
+                         repeats)
+    reuse = measure(lambda: embedding_utils.compute_embeddings_from_tokens([chunk.token_ids for chunk in chunks]),
+                    repeats)
+    print(f"{'pipeline':<28}{'seconds':>10}{'docs/s':>10}{'chunks/s':>10}")
+    for name, encode in (("split + encode texts", retokenize), ("split + encode token ids", reuse)):
+        total = split + encode
+        print(f"{name:<28}{total:>10.2f}{count / total:>10.1f}{len(chunks) / total:>10.1f}")
+    print(f"splitting alone takes {split:.2f} s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--documents", type=int, default=100)
+    parser.add_argument("--words", type=int, default=2000)
+    parser.add_argument("--max-tokens", type=int, default=256)
+    parser.add_argument("--overlap", type=int, default=32)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+    run(args.documents, args.words, args.max_tokens, args.overlap, args.repeats)
@@ -0,0 +1,68 @@
+"""
+Recall and latency of the FAISS index types against exact (flat) search.
+
+Uses synthetic vectors, so no database or model is needed.
+
+    python -m benchmarks.bench_faiss --rows 20000 --queries 200
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.utils.faiss_index import FaissIndex
+
+
+def build(index_type, vectors, **kwargs):
+    index = FaissIndex(vectors.shape[1], index_type=index_type, metric="cosine", **kwargs)
+    start = time.perf_counter()
+    index.load(lambda after_id: list(enumerate(vectors, start=1)))
+    return index, time.perf_counter() - start
+
+
+def measure(index, queries, k, truth, **search_kwargs):
+    found, timings = [], []
+    for query in queries:
+        start = time.perf_counter()
+        hits = index.search(query, k, **search_kwargs)
+        timings.append(time.perf_counter() - start)
+        found.append({embedding_id for embedding_id, _ in hits})
+    recall = np.mean([len(hits & expected) / k for hits, expected in zip(found, truth)])
+    return recall, np.median(timings) * 1000, np.percentile(timings, 99) * 1000
+
+
+def run(rows, queries, dimension, k):
+    rng = np.random.default_rng(0)
+    # Clustered data is closer to real embeddings than isotropic noise
+    centers = rng.standard_normal((64, dimension))
+    vectors = (centers[rng.integers(0, 64, rows)] + 0.5 * rng.standard_normal((rows, dimension))).astype(np.float32)
+    query_vectors = vectors[rng.choice(rows, queries, replace=False)] + 0.1 * rng.standard_normal(
+        (queries, dimension)).astype(np.float32)
+
+    exact, build_seconds = build("flat", vectors)
+    truth = [{embedding_id for embedding_id, _ in exact.search(query, k)} for query in query_vectors]
+
+    print(f"{'index':<12}{'param':<14}{'recall@' + str(k):>10}{'p50 ms':>10}{'p99 ms':>10}{'build s':>10}")
+    recall, p50, p99 = measure(exact, query_vectors, k, truth)
+    print(f"{'flat':<12}{'exact':<14}{recall:>10.3f}{p50:>10.3f}{p99:>10.3f}{build_seconds:>10.1f}")
+
+    hnsw, build_seconds = build("hnsw", vectors, hnsw_m=32)
+    for ef_search in (16, 64, 256):
+        recall, p50, p99 = measure(hnsw, query_vectors, k, truth, ef_search=ef_search)
+        print(f"{'hnsw':<12}{'ef=' + str(ef_search):<14}{recall:>10.3f}{p50:>10.3f}{p99:>10.3f}{build_seconds:>10.1f}")
+
+    ivf_lists = max(1, min(1024, rows // 39 // 4))
+    ivfpq, build_seconds = build("ivfpq", vectors, ivf_lists=ivf_lists, pq_subquantizers=48)
+    for probes in (1, 8, 32):
+        recall, p50, p99 = measure(ivfpq, query_vectors, k, truth, probes=probes)
+        print(f"{'ivfpq':<12}{'nprobe=' + str(probes):<14}{recall:>10.3f}{p50:>10.3f}{p99:>10.3f}{build_seconds:>10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+    run(args.rows, args.queries, args.dimension, args.k)
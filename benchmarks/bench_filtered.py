@@ -0,0 +1,148 @@
+"""
+Recall and latency of searches filtered to one tenant, with tenants of very different sizes.
+
+The same vectors are searched four ways, `k` nearest within a tenant, against exact results:
+
+  post-filter     the HNSW index of the whole table, filtered afterwards, as a plain query does
+  + exact retry   `EmbeddingCRUD.search_embeddings`: the above, searched again exactly when it
+                  returns fewer than `k` rows
+  partial index   as `+ exact retry`, with the small tenants in EMBEDDING_DEDICATED_TENANTS, so
+                  each has an HNSW index over its rows only
+  partitioned     a table partitioned by tenant (EMBEDDING_PARTITION_BY_TENANT), the small
+                  tenants with partitions of their own
+
+Tenants cover 90%, 9%, 0.9% and 0.1% of the rows, and every tenant's vectors are spread over
+the same clusters, so a tenant's nearest rows are mixed in with everybody else's.
+
+    python -m benchmarks.bench_filtered --rows 100000 --queries 100
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+from app.core.initializer import AppInitializer
+from app.crud.embedding_crud import EmbeddingCRUD
+from app.database.database import database_instance
+from app.models.embedding_model import embedding_table
+
+TENANTS = {"large": 0.9, "medium": 0.09, "small": 0.009, "tiny": 0.001}
+DEDICATED = ["medium", "small", "tiny"]
+
+
+def make_vectors(rows, queries, dimension):
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((64, dimension))
+    vectors = centers[rng.integers(0, 64, rows)] + 0.5 * rng.standard_normal((rows, dimension))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    tenants = rng.choice(list(TENANTS), rows, p=list(TENANTS.values()))
+    query_vectors = centers[rng.integers(0, 64, queries)] + 0.5 * rng.standard_normal((queries, dimension))
+    return vectors.astype(np.float32), tenants, query_vectors.astype(np.float32)
+
+
+def post_filter(crud, vector, k, tenant, ef_search):
+    # The filtered ANN query alone, without the exact retry of `search_embeddings`
+    sql, params, index_rows = crud._nearest_sql(vector, "cosine", k, tenant=tenant)
+    database = crud.table._meta.database
+    with database.atomic():
+        crud._tune_index(database, ef_search, None, index_rows)
+        return [row.id for row in crud.table.raw(sql, *params)]
+
+
+def load(table, vectors, tenants, partitioned):
+    database = database_instance.database
+    initializer = AppInitializer(None, database_instance)
+    database.drop_tables([table], safe=True, cascade=True)
+    if partitioned:
+        initializer.create_partitioned_tables([table])
+    database.create_tables([table])
+    crud = EmbeddingCRUD(copy_threshold=1, table=table)
+    # Ids start at 1 in input order, saved one tenant at a time
+    order = np.concatenate([np.flatnonzero(tenants == tenant) for tenant in TENANTS])
+    for tenant in TENANTS:
+        rows = order[tenants[order] == tenant]
+        for start in range(0, len(rows), 5000):
+            batch = rows[start:start + 5000]
+            crud.save_embedding([f"row {i}" for i in batch], vectors[batch], tenant=tenant)
+    if partitioned:
+        initializer.create_tenant_partitions([table], DEDICATED)
+    return crud, initializer, order
+
+
+def measure(search, query_vectors, truth, k):
+    found, timings = [], []
+    for query, expected in zip(query_vectors, truth):
+        start = time.perf_counter()
+        ids = search(query.tolist())
+        timings.append(time.perf_counter() - start)
+        found.append((len(set(ids) & expected) / k, len(ids)))
+    recall, returned = np.mean(found, axis=0)
+    return recall, returned, np.median(timings) * 1000, np.percentile(timings, 95) * 1000
+
+
+def measure_tenants(label, crud, search, order, tenants, vectors, query_vectors, k, ef_search):
+    # Row ids follow `order`, the input rows grouped by tenant
+    ids = np.empty(len(order), dtype=np.int64)
+    ids[order] = np.arange(1, len(order) + 1)
+    for tenant in TENANTS:
+        members = np.flatnonzero(tenants == tenant)
+        truth = [set(ids[members[np.argsort(-(vectors[members] @ query))[:k]]].tolist()) for query in query_vectors]
+        if search is None:
+            def run_search(vector):
+                return post_filter(crud, vector, k, tenant, ef_search)
+        else:
+            def run_search(vector):
+                return [row.id for row, _ in search(vector, k, "cosine", ef_search, tenant=tenant)]
+        run_search(query_vectors[0].tolist())  # warm-up
+        recall, returned, p50, p95 = measure(run_search, query_vectors, truth, k)
+        print(f"{label:<16}{tenant:<8}{len(members):>8}{recall:>10.3f}{returned:>10.1f}{p50:>8.2f}{p95:>8.2f}")
+
+
+def run(rows, queries, dimension, k, ef_search):
+    vectors, tenants, query_vectors = make_vectors(rows, queries, dimension)
+    database = database_instance.database
+    os.environ["EMBEDDING_INDEX_TYPE"] = "hnsw"
+    os.environ["EMBEDDING_INDEX_METRIC"] = "cosine"
+    print(f"{rows} vectors of {dimension} dimensions, {queries} queries per tenant, k={k}, ef_search={ef_search}")
+    print(f"{'search':<16}{'tenant':<8}{'rows':>8}{'recall@' + str(k):>10}{'returned':>10}{'p50 ms':>8}{'p95 ms':>8}")
+
+    with database.connection_context():
+        for name, partitioned in (("shared", False), ("partitioned", True)):
+            table = embedding_table("bench", dimension, table_name=f"embedding_bench_{name}")
+            os.environ["EMBEDDING_PARTITION_BY_TENANT"] = str(partitioned).lower()
+            try:
+                crud, initializer, order = load(table, vectors, tenants, partitioned)
+                initializer.create_vector_index([table])
+                database.execute_sql(f'ANALYZE "{table._meta.table_name}"')
+                searches = []
+                if partitioned:
+                    searches.append(("partitioned", crud.search_embeddings))
+                else:
+                    searches.append(("post-filter", None))
+                    searches.append(("+ exact retry", crud.search_embeddings))
+
+                for label, search in searches:
+                    measure_tenants(label, crud, search, order, tenants, vectors, query_vectors, k, ef_search)
+                if not partitioned:
+                    os.environ["EMBEDDING_DEDICATED_TENANTS"] = ",".join(DEDICATED)
+                    try:
+                        initializer.create_vector_index([table])
+                    finally:
+                        del os.environ["EMBEDDING_DEDICATED_TENANTS"]
+                    database.execute_sql(f'ANALYZE "{table._meta.table_name}"')
+                    measure_tenants("partial index", crud, crud.search_embeddings, order, tenants, vectors,
+                                    query_vectors, k, ef_search)
+            finally:
+                database.drop_tables([table], safe=True, cascade=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--ef-search", type=int, default=40)
+    args = parser.parse_args()
+    run(args.rows, args.queries, args.dimension, args.k, args.ef_search)
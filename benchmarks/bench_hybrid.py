@@ -0,0 +1,124 @@
+"""
+Recall and latency of hybrid (full-text + vector, fused with RRF) against vector-only search.
+
+The corpus is synthetic: every document belongs to a topic, whose words it uses and near whose
+center its vector lies, and carries a unique product code. Two query sets look for one document each:
+
+  identifier  the document's code and one of its words, with a vector that knows the topic but,
+              like a sentence embedding model, nothing of the code
+  semantic    two of the document's words, shared by many documents, with a noisy vector near the
+              document's
+
+    python -m benchmarks.bench_hybrid --rows 20000 --queries 200
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+from app.core.initializer import AppInitializer
+from app.crud.embedding_crud import EmbeddingCRUD
+from app.database.database import database_instance
+from app.models.embedding_model import embedding_table
+
+TOPICS = 64
+DIMENSION = 384
+
+
+def make_corpus(rows, rng):
+    syllables = ["ka", "lo", "mi", "ne", "ru", "sa", "ti", "vo", "ze", "pa", "qui", "dro"]
+    words = list(dict.fromkeys("".join(rng.choice(syllables, 4)) for _ in range(4000)))
+    vocabularies = [words[topic * 40:(topic + 1) * 40] for topic in range(TOPICS)]
+    common = words[TOPICS * 40:TOPICS * 40 + 200]
+    centers = rng.standard_normal((TOPICS, DIMENSION))
+    topics = rng.integers(0, TOPICS, rows)
+    texts = [" ".join([*rng.choice(vocabularies[topic], 12), *rng.choice(common, 4), f"PX-{row:06d}"])
+             for row, topic in enumerate(topics)]
+    vectors = centers[topics] + 0.6 * rng.standard_normal((rows, DIMENSION))
+    return texts, vectors.astype(np.float32), topics, centers
+
+
+def make_queries(kind, count, texts, vectors, topics, centers, rng):
+    queries = []
+    for target in rng.choice(len(texts), count, replace=False):
+        words = texts[target].split()
+        if kind == "identifier":
+            text = f"{words[-1]} {rng.choice(words[:-1])}"
+            vector = centers[topics[target]] + 0.6 * rng.standard_normal(DIMENSION)
+        else:
+            text = " ".join(rng.choice(words[:-1], 2, replace=False))
+            vector = vectors[target] + 0.6 * rng.standard_normal(DIMENSION)
+        queries.append((target, text, vector.astype(np.float32).tolist()))
+    return queries
+
+
+def text_only(crud, text, k):
+    table = crud.table._meta.table_name
+    cursor = crud.table._meta.database.execute_sql(
+        f'SELECT "id" FROM "{table}", websearch_to_tsquery(%s::regconfig, %s) AS "query" '
+        f'WHERE "text_search" @@ "query" ORDER BY ts_rank_cd("text_search", "query", 1) DESC LIMIT %s',
+        (crud.text_search_config, text, k))
+    return [row[0] for row in cursor.fetchall()]
+
+
+def evaluate(search, queries, k):
+    found, reciprocal_ranks, timings = 0, [], []
+    for target, text, vector in queries:
+        start = time.perf_counter()
+        ids = search(text, vector)
+        timings.append(time.perf_counter() - start)
+        # Ids start at 1 in corpus order
+        rank = ids.index(target + 1) + 1 if target + 1 in ids[:k] else None
+        found += rank is not None
+        reciprocal_ranks.append(1 / rank if rank else 0)
+    return found / len(queries), np.mean(reciprocal_ranks), np.median(timings) * 1000, \
+        np.percentile(timings, 95) * 1000
+
+
+def run(rows, query_count, k, candidates, ef_search):
+    rng = np.random.default_rng(0)
+    texts, vectors, topics, centers = make_corpus(rows, rng)
+    database = database_instance.database
+    table = embedding_table("bench", DIMENSION, table_name="embedding_bench_hybrid")
+    with database.connection_context():
+        database.drop_tables([table], safe=True)
+        database.create_tables([table])
+        try:
+            crud = EmbeddingCRUD(copy_threshold=1, table=table, hybrid_search=True, hybrid_candidates=candidates)
+            for start in range(0, rows, 5000):
+                crud.save_embedding(texts[start:start + 5000], vectors[start:start + 5000])
+            os.environ["EMBEDDING_INDEX_METRIC"] = "cosine"
+            initializer = AppInitializer(None, database_instance)
+            initializer.create_vector_index([table])
+            initializer.create_text_search([table])
+            database.execute_sql('ANALYZE "embedding_bench_hybrid"')
+
+            searches = {
+                "vector": lambda text, vector: [row.id for row, _ in
+                                                crud.search_embeddings(vector, k, ef_search=ef_search)],
+                "text": lambda text, vector: text_only(crud, text, k),
+                "hybrid": lambda text, vector: [row.id for row, _ in
+                                                crud.hybrid_search(text, vector, k, ef_search=ef_search)],
+            }
+            print(f"{rows} documents, {query_count} queries per set, k={k}, {candidates} candidates per side")
+            print(f"{'queries':<12}{'search':<8}{'recall@' + str(k):>10}{'MRR':>8}{'p50 ms':>8}{'p95 ms':>8}")
+            for kind in ("identifier", "semantic"):
+                queries = make_queries(kind, query_count, texts, vectors, topics, centers, rng)
+                for name, search in searches.items():
+                    search(*queries[0][1:])  # warm-up
+                    recall, mrr, p50, p95 = evaluate(search, queries, k)
+                    print(f"{kind:<12}{name:<8}{recall:>10.3f}{mrr:>8.3f}{p50:>8.2f}{p95:>8.2f}")
+        finally:
+            database.drop_tables([table], safe=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--candidates", type=int, default=50)
+    parser.add_argument("--ef-search", type=int, default=None)
+    args = parser.parse_args()
+    run(args.rows, args.queries, args.k, args.candidates, args.ef_search)
@@ -0,0 +1,118 @@
+"""
+Memory and throughput of serving from 1, 2, 4 and 8 worker processes with `app.core.prefork`.
+
+Each configuration starts the launcher and sends text searches to `POST /embeddings/search`,
+every one with a new query to encode, from 4 clients per worker. Memory is summed over the
+parent and its workers after the run:
+
+  RSS   resident memory, counting pages shared between processes once in every process
+  PSS   shared pages divided between the processes sharing them, so the sum is what the
+        server really uses
+  USS   pages private to one process
+
+The model is loaded three ways:
+
+  independent   --no-preload, every worker loads its own copy, like separate processes
+  cow           the parent loads it before forking, and workers share it copy-on-write
+  shm           as cow, with the weights moved to shared memory first
+
+Needs the model, and PostgreSQL with pgvector in DATABASE_URL. Linux only, for /proc.
+
+    python -m benchmarks.bench_prefork --workers 1 2 4 8 --requests 400
+"""
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.bench_bucketing import make_chunks
+from benchmarks.suite import drive
+
+MODES = {"independent": ["--no-preload"], "cow": ["--share", "cow"], "shm": ["--share", "shm"]}
+
+
+def children(pid):
+    return [int(child) for child in Path(f"/proc/{pid}/task/{pid}/children").read_text().split()]
+
+
+def memory(pid):
+    """
+    RSS, PSS and USS in bytes of `pid` and its children.
+    """
+    totals = np.zeros(3)
+    for process in [pid, *children(pid)]:
+        fields = {}
+        for line in Path(f"/proc/{process}/smaps_rollup").read_text().splitlines()[1:]:
+            name, value, _ = line.split()
+            fields[name.rstrip(":")] = int(value) * 1024
+        totals += [fields["Rss"], fields["Pss"], fields["Private_Clean"] + fields["Private_Dirty"]]
+    return totals
+
+
+def start(workers, mode):
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    server = subprocess.Popen([sys.executable, "-m", "app.core.prefork", "--workers", str(workers),
+                               "--host", "127.0.0.1", "--port", str(port), *MODES[mode]],
+                              env={**os.environ, "EMBEDDING_JOB_WORKERS": "0"},
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 300
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"The server exited with status {server.returncode}")
+        try:
+            with urllib.request.urlopen(f"{url}/health/ready", timeout=5) as response:
+                if response.status == 200 and len(children(server.pid)) == workers:
+                    return server, url
+        except OSError:
+            pass
+        time.sleep(0.2)
+    server.kill()
+    raise RuntimeError("The server did not become ready")
+
+
+def run(worker_counts, modes, requests):
+    corpus = make_chunks(2000)
+    counter = iter(range(10 ** 9))
+
+    def search(client, index):
+        # Queries never repeat, so every one is encoded
+        return client.post("/embeddings/search", json={"text": f"{corpus[index % len(corpus)]} {next(counter)}",
+                                                       "k": 10, "include_text": False})
+
+    print(f"{os.cpu_count()} CPUs, {requests} searches per run, 4 clients per worker")
+    print(f"{'workers':>8} {'loading':<12}{'RSS MB':>10}{'PSS MB':>10}{'USS MB':>10}{'req/s':>10}{'p50 ms':>10}")
+    for workers in worker_counts:
+        for mode in modes:
+            server, url = start(workers, mode)
+            try:
+                # Every worker loads, or touches, the model before it is measured
+                asyncio.run(drive(url, search, 4 * workers, 16 * workers))
+                timings, errors, elapsed = asyncio.run(drive(url, search, 4 * workers, requests))
+                rss, pss, uss = memory(server.pid) / 2 ** 20
+            finally:
+                server.send_signal(signal.SIGTERM)
+                server.wait(timeout=60)
+            if errors:
+                print(f"{errors} requests failed")
+            print(f"{workers:>8} {mode:<12}{rss:>10.0f}{pss:>10.0f}{uss:>10.0f}{requests / elapsed:>10.1f}"
+                  f"{np.median(timings) * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    parser.add_argument("--requests", type=int, default=400)
+    args = parser.parse_args()
+    run(args.workers, args.modes, args.requests)
@@ -0,0 +1,125 @@
+"""
+Storage and search latency of normalized and dimension-reduced vectors.
+
+Each configuration stores the same vectors in a table of its own, with an HNSW index for its
+metric, and runs the same queries through `EmbeddingCRUD.search_embeddings`. Recall@k is against
+exact cosine search on the full vectors. The vectors are synthetic, with the decaying variance
+spectrum of sentence embeddings, unless `--from-table` samples the `embedding` table instead.
+
+    python -m benchmarks.bench_projection --rows 20000 --queries 200
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+from app.core.initializer import AppInitializer
+from app.crud.embedding_crud import EmbeddingCRUD
+from app.database.database import database_instance
+from app.models.embedding_model import Embedding, embedding_table
+from app.utils.projection import Projection, l2_normalize, transform_embeddings
+
+# name, output dimensions (None for all), method, normalized, metric
+CONFIGURATIONS = (
+    ("full cosine", None, None, False, "cosine"),
+    ("full normalized ip", None, None, True, "inner_product"),
+    ("pca 192", 192, "pca", True, "inner_product"),
+    ("pca 128", 128, "pca", True, "inner_product"),
+    ("pca 64", 64, "pca", True, "inner_product"),
+    ("truncate 128", 128, "truncate", True, "inner_product"),
+)
+
+
+def make_vectors(rows, queries, dimension):
+    rng = np.random.default_rng(0)
+    # Variance falling off like the spectrum of sentence embeddings, in a random basis, around clusters
+    scale = np.arange(1, dimension + 1) ** -0.75
+    basis, _ = np.linalg.qr(rng.standard_normal((dimension, dimension)))
+    centers = rng.standard_normal((64, dimension)) * scale
+    vectors = (centers[rng.integers(0, 64, rows)] + 0.5 * rng.standard_normal((rows, dimension)) * scale) @ basis
+    query_vectors = vectors[rng.choice(rows, queries, replace=False)] + \
+        0.1 * (rng.standard_normal((queries, dimension)) * scale) @ basis
+    return vectors.astype(np.float32), query_vectors.astype(np.float32)
+
+
+def sample_table(rows, queries):
+    vectors = np.stack([row.embedding for row in Embedding.select(Embedding.embedding).limit(rows + queries)])
+    return vectors[:rows], vectors[rows:]
+
+
+def measure(name, vectors, query_vectors, truth, k, ef_search, metric):
+    database = database_instance.database
+    table = embedding_table("bench", vectors.shape[1],
+                            table_name=f"embedding_bench_{name.replace(' ', '_')}")
+    database.drop_tables([table], safe=True)
+    database.create_tables([table])
+    try:
+        crud = EmbeddingCRUD(copy_threshold=1, table=table)
+        for start in range(0, len(vectors), 5000):
+            batch = vectors[start:start + 5000]
+            crud.save_embedding([f"row {start + i}" for i in range(len(batch))], batch)
+        os.environ["EMBEDDING_INDEX_METRIC"] = metric
+        AppInitializer(None, database_instance).create_vector_index([table])
+        database.execute_sql(f'ANALYZE "{table._meta.table_name}"')
+
+        for query in query_vectors[:20]:
+            crud.search_embeddings(query.tolist(), k, metric, ef_search)  # warm-up
+        found, timings = [], []
+        for query in query_vectors:
+            start = time.perf_counter()
+            results = crud.search_embeddings(query.tolist(), k, metric, ef_search)
+            timings.append(time.perf_counter() - start)
+            # Ids start at 1 in input order
+            found.append({instance.id - 1 for instance, _ in results})
+        recall = np.mean([len(hits & set(expected)) / k for hits, expected in zip(found, truth)])
+        cursor = database.execute_sql("SELECT pg_table_size(%s), pg_indexes_size(%s)",
+                                      (table._meta.table_name, table._meta.table_name))
+        table_bytes, index_bytes = cursor.fetchone()
+        return table_bytes, index_bytes, recall, np.median(timings) * 1000, np.percentile(timings, 95) * 1000
+    finally:
+        database.drop_tables([table], safe=True)
+
+
+def run(rows, queries, dimension, k, ef_search, from_table):
+    database = database_instance.database
+    with database.connection_context():
+        if from_table:
+            vectors, query_vectors = sample_table(rows, queries)
+        else:
+            vectors, query_vectors = make_vectors(rows, queries, dimension)
+        unit_vectors, unit_queries = l2_normalize(vectors), l2_normalize(query_vectors)
+        truth = [np.argsort(-(unit_vectors @ query))[:k] for query in unit_queries]
+        # Fitted on a sample, as app.database.projection_migration does
+        sample = unit_vectors[np.random.default_rng(1).choice(len(vectors), min(len(vectors), 10000), replace=False)]
+
+        print(f"{len(vectors)} vectors of {vectors.shape[1]} dimensions, {len(query_vectors)} queries, "
+              f"k={k}, ef_search={ef_search}")
+        print(f"{'configuration':<20}{'dims':>6}{'variance':>10}{'table MB':>10}{'index MB':>10}"
+              f"{'recall@' + str(k):>10}{'p50 ms':>8}{'p95 ms':>8}")
+        for name, dimensions, method, normalize, metric in CONFIGURATIONS:
+            projection, variance = None, 1.0
+            if method == "pca":
+                projection = Projection.fit_pca(sample, dimensions)
+            elif method == "truncate":
+                projection = Projection.truncation(sample.shape[1], dimensions, sample)
+            if projection is not None:
+                variance = projection.explained_variance
+            stored = transform_embeddings(vectors, projection, normalize)
+            searched = transform_embeddings(query_vectors, projection, normalize)
+            table_bytes, index_bytes, recall, p50, p95 = measure(name, stored, searched, truth, k, ef_search,
+                                                                  metric)
+            print(f"{name:<20}{stored.shape[1]:>6}{variance:>10.3f}{table_bytes / 2 ** 20:>10.1f}"
+                  f"{index_bytes / 2 ** 20:>10.1f}{recall:>10.3f}{p50:>8.2f}{p95:>8.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--ef-search", type=int, default=40)
+    parser.add_argument("--from-table", action="store_true", help="Use vectors from the embedding table")
+    args = parser.parse_args()
+    run(args.rows, args.queries, args.dimension, args.k, args.ef_search, args.from_table)
@@ -0,0 +1,76 @@
+"""
+Compare EmbeddingCRUD.save_embedding write paths against the old per-row loop, and what
+re-ingesting chunks the table already holds costs.
+
+Needs a PostgreSQL database with pgvector reachable through DATABASE_URL.
+
+    python -m benchmarks.bench_save_embedding --rows 500 --repeat 3
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.crud.embedding_crud import EmbeddingCRUD
+from app.models.embedding_model import Embedding
+
+
+def save_embedding_per_row(chunks, embeddings):
+    """
+    The original write path: one Embedding.create (and autocommit) per chunk.
+    """
+    return [Embedding.create(text=chunk, embedding=embedding) for chunk, embedding in zip(chunks, embeddings)]
+
+
+def report(name, rows, timings):
+    best = min(timings)
+    print(f"{name:<16}{rows / best:>12.0f}{best * 1000:>12.1f}")
+
+
+def run(rows: int, repeat: int, dimension: int):
+    database = Embedding._meta.database
+    database.connect(reuse_if_open=True)
+    database.create_tables([Embedding], safe=True)
+
+    rng = np.random.default_rng(0)
+    embeddings = rng.standard_normal((rows, dimension)).astype(np.float32).tolist()
+
+    writers = {
+        "per-row create": save_embedding_per_row,
+        "insert_many": EmbeddingCRUD(copy_threshold=rows + 1).save_embedding,
+        "binary copy": EmbeddingCRUD(copy_threshold=1).save_embedding,
+    }
+    print(f"{'path':<16}{'rows/sec':>12}{'best ms':>12}")
+    for name, writer in writers.items():
+        timings = []
+        for attempt in range(repeat):
+            # New texts every time: saving a chunk the table already holds writes nothing
+            chunks = [f"benchmark chunk {name} {attempt} {i}" for i in range(rows)]
+            start = time.perf_counter()
+            writer(chunks, embeddings)
+            timings.append(time.perf_counter() - start)
+        report(name, rows, timings)
+
+    # The last batch again: all rows exist
+    crud = EmbeddingCRUD(copy_threshold=1)
+    for name, again in (("save again", lambda: crud.save_embedding(chunks, embeddings)),
+                        ("hash lookup", lambda: crud.find_by_content(chunks, include_embedding=False)),
+                        ("lookup+vectors", lambda: crud.find_by_content(chunks))):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            again()
+            timings.append(time.perf_counter() - start)
+        report(name, rows, timings)
+
+    Embedding.delete().where(Embedding.text.startswith("benchmark chunk ")).execute()
+    database.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--dimension", type=int, default=384)
+    args = parser.parse_args()
+    run(args.rows, args.repeat, args.dimension)
@@ -0,0 +1,44 @@
+"""
+Cold-start cost of the service: importing the app, then loading and warming the model.
+
+Each step runs in a fresh interpreter so nothing is cached between measurements. Importing
+`app.main` no longer loads torch or the weights; that now happens on the warm-up thread while
+the app already answers /health/live.
+
+    python -m benchmarks.bench_startup --repeats 3
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+
+STEPS = {
+    "import app.main": "import time; s = time.perf_counter(); import app.main; "
+                       "print(time.perf_counter() - s)",
+    "import sentence_transformers": "import time; s = time.perf_counter(); import sentence_transformers; "
+                                    "print(time.perf_counter() - s)",
+    "import + load + warm up": "import time; s = time.perf_counter(); "
+                               "from app.core.model_registry import model_registry; model_registry.warm_up(); "
+                               "print(time.perf_counter() - s)",
+}
+
+
+def measure(code, repeats):
+    timings = []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        timings.append(float(output.stdout.strip().splitlines()[-1]))
+    return statistics.median(timings)
+
+
+def run(repeats):
+    print(f"{'step':<32}{'seconds':>10}")
+    for name, code in STEPS.items():
+        print(f"{name:<32}{measure(code, repeats):>10.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+    run(args.repeats)
@@ -0,0 +1,129 @@
+"""
+Storage size and recall of the vector storage modes (vector, halfvec, bit, halfvec-bit).
+
+The first table models each mode in NumPy: float16 rounding of the stored vectors, and a
+Hamming-distance coarse pass over sign bits (as pgvector's `binary_quantize`) whose top
+`k * factor` candidates are reranked exactly. The second measures real tables in the database in
+DATABASE_URL: table and index size, recall@k and latency. Modes the installed pgvector does not
+support (halfvec and bit need 0.7) are skipped there.
+
+    python -m benchmarks.bench_storage --rows 20000 --queries 100
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.core.initializer import AppInitializer
+from app.crud.embedding_crud import EmbeddingCRUD
+from app.database.database import database_instance
+from app.models.embedding_model import embedding_table
+
+MODES = ("vector", "halfvec", "bit", "halfvec-bit")
+# Bytes per stored value of a pgvector column, plus its 8-byte header
+COLUMN_BYTES = {"vector": lambda d: 4 * d + 8, "halfvec": lambda d: 2 * d + 8}
+INDEXED_BYTES = {"vector": lambda d: 4 * d + 8, "halfvec": lambda d: 2 * d + 8,
+                 "bit": lambda d: d // 8 + 8, "halfvec-bit": lambda d: d // 8 + 8}
+
+
+def make_vectors(rows, queries, dimension):
+    rng = np.random.default_rng(0)
+    # Clustered data is closer to real embeddings than isotropic noise
+    centers = rng.standard_normal((64, dimension))
+    vectors = (centers[rng.integers(0, 64, rows)] + 0.5 * rng.standard_normal((rows, dimension))).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    query_vectors = vectors[rng.choice(rows, queries, replace=False)] + 0.05 * rng.standard_normal(
+        (queries, dimension)).astype(np.float32)
+    return vectors, query_vectors
+
+
+def top_k(vectors, query, k):
+    return np.argsort(1 - vectors @ query)[:k]
+
+
+def simulate(mode, vectors, query_vectors, truth, k, factor):
+    stored = vectors.astype(np.float16).astype(np.float32) if mode.startswith("halfvec") else vectors
+    if mode in ("vector", "halfvec"):
+        found = [top_k(stored, query, k) for query in query_vectors]
+    else:
+        bits = vectors > 0
+        found = []
+        for query in query_vectors:
+            candidates = np.argsort((bits != (query > 0)).sum(axis=1), kind="stable")[:k * factor]
+            found.append(candidates[top_k(stored[candidates], query, k)])
+    return np.mean([len(set(hits) & set(expected)) / k for hits, expected in zip(found, truth)])
+
+
+def pgvector_version(database):
+    cursor = database.execute_sql("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+    return tuple(int(part) for part in cursor.fetchone()[0].split("."))
+
+
+def measure_database(mode, vectors, query_vectors, truth, k, factor):
+    database = database_instance.database
+    table = embedding_table("bench", vectors.shape[1], mode, table_name=f"embedding_bench_{mode.replace('-', '_')}")
+    database.drop_tables([table], safe=True)
+    database.create_tables([table])
+    try:
+        crud = EmbeddingCRUD(copy_threshold=1, table=table, rerank_factor=factor)
+        for start in range(0, len(vectors), 5000):
+            batch = vectors[start:start + 5000]
+            crud.save_embedding([f"row {start + i}" for i in range(len(batch))], batch)
+        AppInitializer(None, database_instance).create_vector_index([table])
+        database.execute_sql(f'ANALYZE "{table._meta.table_name}"')
+
+        found, timings = [], []
+        for query in query_vectors:
+            start = time.perf_counter()
+            results = crud.search_embeddings(query.tolist(), k, ef_search=max(40, k))
+            timings.append(time.perf_counter() - start)
+            # Ids start at 1 in input order
+            found.append({instance.id - 1 for instance, _ in results})
+        recall = np.mean([len(hits & set(expected)) / k for hits, expected in zip(found, truth)])
+        cursor = database.execute_sql(
+            "SELECT pg_table_size(%s), pg_indexes_size(%s)", (table._meta.table_name, table._meta.table_name))
+        table_bytes, index_bytes = cursor.fetchone()
+        return table_bytes, index_bytes, recall, np.median(timings) * 1000
+    finally:
+        database.drop_tables([table], safe=True)
+
+
+def run(rows, queries, dimension, k, factors, database):
+    vectors, query_vectors = make_vectors(rows, queries, dimension)
+    truth = [top_k(vectors, query, k) for query in query_vectors]
+
+    print(f"Modelled, {rows} vectors of {dimension} dimensions")
+    print(f"{'mode':<14}{'factor':>8}{'column B':>10}{'indexed B':>11}{'recall@' + str(k):>11}")
+    for mode in MODES:
+        column_bytes = COLUMN_BYTES["halfvec" if mode.startswith("halfvec") else "vector"](dimension)
+        for factor in (factors if "bit" in mode else [1]):
+            recall = simulate(mode, vectors, query_vectors, truth, k, factor)
+            print(f"{mode:<14}{factor:>8}{column_bytes:>10}{INDEXED_BYTES[mode](dimension):>11}{recall:>11.3f}")
+
+    if not database:
+        return
+    with database_instance.database.connection_context():
+        version = pgvector_version(database_instance.database)
+        print(f"\nPostgreSQL, pgvector {'.'.join(map(str, version))}")
+        print(f"{'mode':<14}{'factor':>8}{'table MB':>10}{'index MB':>10}{'recall@' + str(k):>11}{'p50 ms':>9}")
+        for mode in MODES:
+            if mode != "vector" and version < (0, 7):
+                print(f"{mode:<14}  skipped, needs pgvector 0.7")
+                continue
+            for factor in (factors if "bit" in mode else [1]):
+                table_bytes, index_bytes, recall, p50 = measure_database(
+                    mode, vectors, query_vectors, truth, k, factor)
+                print(f"{mode:<14}{factor:>8}{table_bytes / 2 ** 20:>10.1f}{index_bytes / 2 ** 20:>10.1f}"
+                      f"{recall:>11.3f}{p50:>9.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--factors", type=int, nargs="+", default=[1, 4, 10, 20])
+    parser.add_argument("--no-database", action="store_true", help="Only print the modelled results")
+    args = parser.parse_args()
+    run(args.rows, args.queries, args.dimension, args.k, args.factors, not args.no_database)
@@ -0,0 +1,36 @@
+"""
+A stand-in for the sentence-transformers model, for benchmarking the service around the model.
+
+Vectors are derived from a hash of each text, so they are deterministic and cost next to nothing
+to compute, which leaves the database, batching and HTTP layers as the measured work.
+"""
+import hashlib
+import os
+
+import numpy as np
+
+
+class StubModel:
+    def __init__(self, dimension: int):
+        self.dimension = dimension
+
+    def encode(self, texts, **kwargs):
+        single = isinstance(texts, str)
+        rows = [self._vector(text) for text in ([texts] if single else texts)]
+        matrix = np.stack(rows) if rows else np.zeros((0, self.dimension), dtype=np.float32)
+        return matrix[0] if single else matrix
+
+    def _vector(self, text: str) -> np.ndarray:
+        seed = int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+        vector = np.random.default_rng(seed).standard_normal(self.dimension).astype(np.float32)
+        return vector / np.linalg.norm(vector)
+
+
+def install_stub_model(model_registry):
+    """
+    Make `model_registry` load `StubModel`s instead of real models.
+
+    The stub has no tokenizer, so length bucketing is turned off.
+    """
+    os.environ['EMBEDDING_TOKEN_BUDGET'] = '0'
+    model_registry.loader = lambda model_name, backend: StubModel(model_registry.models[model_name])
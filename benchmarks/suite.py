@@ -0,0 +1,318 @@
+"""
+Benchmark suite writing machine-readable results, for comparing runs against each other.
+
+Benchmarks:
+  encode  texts/s of compute_embeddings_from_texts by batch size and text length (no database)
+  save    rows/s of EmbeddingCRUD.save_embedding by batch size
+  get     latency of EmbeddingCRUD.get_embedding_by_id
+  http    requests/s and latency of POST /embedding/text/ and GET /embeddings/{id} through a
+          local uvicorn server, by concurrency
+
+save, get and http need PostgreSQL with pgvector in DATABASE_URL. `--stub-model` replaces the
+model with hashed vectors, to measure everything around it. `--seed-file` takes the corpus from
+a JSONL file (such as requests.jsonl) instead of synthetic text. `--compare` reports metrics
+that got worse than a previous results file by more than `--threshold` and exits non-zero.
+
+    python -m benchmarks.suite --output results.json
+    python -m benchmarks.suite --stub-model --seed-file requests.jsonl --only save get http \\
+        --output after.json --compare before.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from benchmarks.bench_bucketing import make_chunks
+
+BENCHMARKS = ("encode", "save", "get", "http")
+
+
+def load_corpus(seed_file=None, count=2000):
+    """
+    Texts to benchmark with: sentences grouped into chunks of up to ~120 words from every
+    string field of a JSONL file, or synthetic chunks when there is no file.
+    """
+    if not seed_file:
+        return make_chunks(count)
+    chunks = []
+    with open(seed_file) as lines:
+        for line in lines:
+            if not line.strip():
+                continue
+            text = " ".join(value for value in json.loads(line).values() if isinstance(value, str))
+            chunk = []
+            for sentence in re.split(r'(?<=[.!?])\s+', text):
+                chunk.append(sentence)
+                if sum(len(part.split()) for part in chunk) >= 120:
+                    chunks.append(" ".join(chunk))
+                    chunk = []
+            if chunk:
+                chunks.append(" ".join(chunk))
+    # Repeat the corpus with a suffix so there are enough distinct texts
+    return [chunks[i % len(chunks)] + ("" if i < len(chunks) else f" ({i // len(chunks)})")
+            for i in range(max(count, len(chunks)))]
+
+
+def texts_of_length(corpus, words, count):
+    """
+    `count` distinct texts of exactly `words` words drawn from the corpus.
+    """
+    vocabulary = " ".join(corpus).split()
+    return [" ".join(vocabulary[(i * words + j) % len(vocabulary)] for j in range(words)) + f" #{i}"
+            for i in range(count)]
+
+
+def latency_metrics(timings):
+    return {"p50_ms": float(np.median(timings) * 1000), "p99_ms": float(np.percentile(timings, 99) * 1000)}
+
+
+def bench_encode(corpus, batch_sizes, lengths, repeats):
+    from app.utils.embedding_utils import compute_embeddings_from_texts
+
+    results = []
+    for words in lengths:
+        for batch_size in batch_sizes:
+            texts = texts_of_length(corpus, words, batch_size)
+            compute_embeddings_from_texts(texts)  # warm-up
+            timings = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                compute_embeddings_from_texts(texts)
+                timings.append(time.perf_counter() - start)
+            results.append({"benchmark": "encode", "params": {"batch_size": batch_size, "words": words},
+                            "metrics": {"texts_per_s": batch_size / min(timings), **latency_metrics(timings)}})
+    return results
+
+
+def bench_save(corpus, batch_sizes, repeats, dimension):
+    from app.crud.embedding_crud import EmbeddingCRUD
+    from app.models.embedding_model import Embedding
+
+    crud = EmbeddingCRUD()
+    rng = np.random.default_rng(0)
+    results = []
+    for batch_size in batch_sizes:
+        texts = (corpus * (batch_size // len(corpus) + 1))[:batch_size]
+        embeddings = rng.standard_normal((batch_size, dimension)).astype(np.float32)
+        timings, saved = [], []
+        for repeat in range(repeats):
+            # Distinct texts, since saving a chunk the table holds writes nothing
+            chunks = [f"{text} [{repeat}.{index}]" for index, text in enumerate(texts)]
+            start = time.perf_counter()
+            saved.extend(instance.id for instance in crud.save_embedding(chunks, embeddings))
+            timings.append(time.perf_counter() - start)
+        Embedding.delete().where(Embedding.id.in_(saved)).execute()
+        results.append({"benchmark": "save", "params": {"batch_size": batch_size},
+                        "metrics": {"rows_per_s": batch_size / min(timings), **latency_metrics(timings)}})
+    return results
+
+
+def bench_get(ids, lookups):
+    from app.crud.embedding_crud import EmbeddingCRUD
+
+    crud = EmbeddingCRUD()
+    rng = np.random.default_rng(0)
+    timings = []
+    for embedding_id in rng.choice(ids, lookups):
+        start = time.perf_counter()
+        crud.get_embedding_by_id(int(embedding_id))
+        timings.append(time.perf_counter() - start)
+    return [{"benchmark": "get", "params": {"rows": len(ids)},
+             "metrics": {"lookups_per_s": lookups / sum(timings), **latency_metrics(timings)}}]
+
+
+class LocalServer:
+    """
+    The app served by uvicorn on a free local port, in a background thread.
+    """
+
+    def __init__(self, app):
+        import uvicorn
+
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            self.port = probe.getsockname()[1]
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.05)
+        return f"http://127.0.0.1:{self.port}"
+
+    def __exit__(self, *exc_info):
+        self.server.should_exit = True
+        self.thread.join()
+
+
+async def drive(url, make_request, concurrency, total):
+    """
+    Send `total` requests from `concurrency` workers; returns per-request timings and errors.
+    """
+    import httpx
+
+    timings, errors, counter = [], 0, iter(range(total))
+
+    async def worker(client):
+        nonlocal errors
+        for index in counter:
+            start = time.perf_counter()
+            response = await make_request(client, index)
+            timings.append(time.perf_counter() - start)
+            errors += response.status_code >= 400
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return timings, errors, elapsed
+
+
+def bench_http(corpus, ids, concurrency_levels, requests_per_level, chunks_per_request):
+    from app.main import create_app
+
+    def post_text(client, index):
+        start = index * chunks_per_request
+        chunks = [corpus[(start + offset) % len(corpus)] for offset in range(chunks_per_request)]
+        return client.post("/embedding/text/", json={"chunks": chunks})
+
+    def get_by_id(client, index):
+        return client.get(f"/embeddings/{ids[index % len(ids)]}")
+
+    results = []
+    with LocalServer(create_app()) as url:
+        for endpoint, make_request in (("POST /embedding/text/", post_text), ("GET /embeddings/{id}", get_by_id)):
+            for concurrency in concurrency_levels:
+                timings, errors, elapsed = asyncio.run(drive(url, make_request, concurrency, requests_per_level))
+                results.append({"benchmark": "http", "params": {"endpoint": endpoint, "concurrency": concurrency},
+                                "metrics": {"requests_per_s": requests_per_level / elapsed, "errors": errors,
+                                            **latency_metrics(timings)}})
+    return results
+
+
+def seed_rows(corpus, rows):
+    """
+    Encode and save `rows` corpus texts for the read benchmarks; returns their ids.
+    """
+    from app.crud.embedding_crud import EmbeddingCRUD
+    from app.utils.embedding_utils import compute_embeddings_from_texts
+
+    crud, ids = EmbeddingCRUD(), []
+    texts = (corpus * (rows // len(corpus) + 1))[:rows]
+    for start in range(0, rows, 256):
+        batch = texts[start:start + 256]
+        ids.extend(instance.id for instance in crud.save_embedding(batch, compute_embeddings_from_texts(batch)))
+    return ids
+
+
+def metadata(args):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {"timestamp": datetime.now(timezone.utc).isoformat(), "git_commit": commit or None,
+            "python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+            "stub_model": args.stub_model, "seed_file": args.seed_file, "backend": os.getenv('EMBEDDING_BACKEND', 'torch')}
+
+
+def compare(results, baseline, threshold):
+    """
+    Metrics that got worse than in `baseline` by more than `threshold` (a fraction).
+    Rates (`*_per_s`) should not drop and latencies (`*_ms`) should not rise.
+    """
+    previous = {(entry["benchmark"], json.dumps(entry["params"], sort_keys=True)): entry["metrics"]
+                for entry in baseline["results"]}
+    regressions = []
+    for entry in results:
+        old_metrics = previous.get((entry["benchmark"], json.dumps(entry["params"], sort_keys=True)))
+        if not old_metrics:
+            continue
+        for metric, value in entry["metrics"].items():
+            old = old_metrics.get(metric)
+            if not old:
+                continue
+            change = (value - old) / old
+            if (metric.endswith("_per_s") and change < -threshold) or (metric.endswith("_ms") and change > threshold):
+                regressions.append({"benchmark": entry["benchmark"], "params": entry["params"], "metric": metric,
+                                    "baseline": old, "current": value, "change": change})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS))
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--compare", help="Previous results file to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Allowed relative slowdown")
+    parser.add_argument("--stub-model", action="store_true", help="Replace the model with hashed vectors")
+    parser.add_argument("--seed-file", help="JSONL file whose string fields become the corpus")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--lengths", type=int, nargs="+", default=[16, 64, 256], help="Words per text")
+    parser.add_argument("--save-batch-sizes", type=int, nargs="+", default=[1, 50, 500])
+    parser.add_argument("--rows", type=int, default=2000, help="Rows seeded for the read benchmarks")
+    parser.add_argument("--lookups", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=400, help="HTTP requests per concurrency level")
+    parser.add_argument("--chunks-per-request", type=int, default=8)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    from app.core.model_registry import model_registry
+
+    if args.stub_model:
+        from benchmarks.stub_model import install_stub_model
+
+        install_stub_model(model_registry)
+    dimension = model_registry.models[model_registry.model_name]
+    corpus = load_corpus(args.seed_file)
+
+    results = []
+    if "encode" in args.only:
+        results += bench_encode(corpus, args.batch_sizes, args.lengths, args.repeats)
+    if "save" in args.only:
+        results += bench_save(corpus, args.save_batch_sizes, args.repeats, dimension)
+    if {"get", "http"} & set(args.only):
+        from app.models.embedding_model import Embedding
+
+        Embedding._meta.database.create_tables([Embedding], safe=True)
+        ids = seed_rows(corpus, args.rows)
+        try:
+            if "get" in args.only:
+                results += bench_get(ids, args.lookups)
+            if "http" in args.only:
+                results += bench_http(corpus, ids, args.concurrency, args.requests, args.chunks_per_request)
+        finally:
+            Embedding.delete().where(Embedding.id.in_(ids)).execute()
+
+    for entry in results:
+        params = " ".join(f"{key}={value}" for key, value in entry["params"].items())
+        metrics = " ".join(f"{key}={value:.2f}" for key, value in entry["metrics"].items())
+        print(f"{entry['benchmark']:<8}{params:<48}{metrics}")
+
+    report = {"meta": metadata(args), "results": results}
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            report["regressions"] = compare(results, json.load(baseline_file), args.threshold)
+        for regression in report["regressions"]:
+            print(f"REGRESSION {regression['benchmark']} {regression['params']} {regression['metric']}: "
+                  f"{regression['baseline']:.2f} -> {regression['current']:.2f} ({regression['change']:+.0%})")
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    return 1 if report.get("regressions") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,13 @@
+import io
+import json
+
+import numpy as np
 from fastapi import FastAPI
 
 from api.endpoints import EmbeddingRoutes
-from unittest.mock import MagicMock, create_autospec, patch
+from unittest.mock import MagicMock, AsyncMock, create_autospec, patch
+from fastapi import HTTPException
+from playhouse.pool import MaxConnectionsExceeded
 from fastapi.testclient import TestClient
 
 import pytest
@@ -16,6 +22,7 @@ def mock_embedding_crud():
     mock_crud = MagicMock(EmbeddingCRUD)
     mock_crud.save_embedding = MagicMock()
     mock_crud.get_embedding_by_id = MagicMock()
+    mock_crud.find_by_content.return_value = {}
     return mock_crud
 
 @pytest.fixture
@@ -121,3 +128,473 @@ def test_get_embedding_not_found(client, mock_embedding_crud):
     # Assertions
     assert response.status_code == 404
     assert response.json() == {"detail": "Embedding not found"}
+
+
+def test_create_embedding_from_text_queue_full(mock_embedding_crud):
+    # The inference pool rejects the batch when it is saturated
+    app = FastAPI()
+    mock_batcher = MagicMock()
+    mock_batcher.embed = AsyncMock(side_effect=HTTPException(
+        status_code=503, detail="Inference queue is full, retry later", headers={"Retry-After": "1"}))
+    embedding_routes = EmbeddingRoutes(dependency=MagicMock(spec=Dependency), embedding_crud=mock_embedding_crud,
+                                       embedding_batcher=mock_batcher)
+    app.include_router(embedding_routes.router)
+
+    response = TestClient(app).post("/embedding/text/", json={"chunks": ["chunk"]})
+
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+    mock_embedding_crud.save_embedding.assert_not_called()
+
+
+def test_get_embedding_cache_stats(mock_embedding_crud):
+    app = FastAPI()
+    mock_cache = MagicMock()
+    mock_cache.stats.return_value = {"hits": 3, "misses": 1}
+    embedding_routes = EmbeddingRoutes(dependency=MagicMock(spec=Dependency), embedding_crud=mock_embedding_crud,
+                                       embedding_cache=mock_cache)
+    app.include_router(embedding_routes.router)
+
+    response = TestClient(app).get("/embedding/cache/stats")
+
+    assert response.status_code == 200
+    assert response.json() == {"hits": 3, "misses": 1}
+
+
+def test_search_embeddings_by_vector(client, mock_embedding_crud):
+    mock_embedding_instance = MagicMock()
+    mock_embedding_instance.id = 7
+    mock_embedding_instance.text = "nearest"
+    mock_embedding_instance.embedding = [0.1] * 384
+    mock_embedding_crud.search_embeddings = MagicMock(return_value=[(mock_embedding_instance, 0.25)])
+
+    response = client.post("/embeddings/search", json={"vector": [0.1] * 384, "k": 3, "metric": "l2",
+                                                       "ef_search": 40, "include_embedding": True})
+
+    assert response.status_code == 200
+    assert response.json() == {"results": [{"id": 7, "text": "nearest", "distance": 0.25,
+                                            "embedding": [0.1] * 384}]}
+    mock_embedding_crud.search_embeddings.assert_called_once_with([0.1] * 384, 3, "l2", 40, None, True, None, None)
+
+
+def test_search_embeddings_by_text(mock_embedding_crud):
+    app = FastAPI()
+    mock_batcher = MagicMock()
+    mock_batcher.embed = AsyncMock(return_value=[[0.5] * 384])
+    mock_embedding_crud.search_embeddings = MagicMock(return_value=[])
+    embedding_routes = EmbeddingRoutes(dependency=MagicMock(spec=Dependency), embedding_crud=mock_embedding_crud,
+                                       embedding_batcher=mock_batcher)
+    app.include_router(embedding_routes.router)
+
+    response = TestClient(app).post("/embeddings/search", json={"text": "query"})
+
+    assert response.status_code == 200
+    assert response.json() == {"results": []}
+    mock_batcher.embed.assert_awaited_once_with(["query"])
+    mock_embedding_crud.search_embeddings.assert_called_once_with([0.5] * 384, 10, "cosine", None, None, True, None,
+                                                                 None)
+
+
+
+def test_hybrid_search(mock_embedding_crud):
+    app = FastAPI()
+    mock_batcher = MagicMock()
+    mock_batcher.embed = AsyncMock(return_value=[[0.5] * 384])
+    row = MagicMock(id=4, text="Part SKU-4471", distance=None, vector_rank=None, text_rank=1)
+    mock_embedding_crud.hybrid_search = MagicMock(return_value=[(row, 0.0164)])
+    embedding_routes = EmbeddingRoutes(dependency=MagicMock(spec=Dependency), embedding_crud=mock_embedding_crud,
+                                       embedding_batcher=mock_batcher)
+    app.include_router(embedding_routes.router)
+    client = TestClient(app)
+
+    response = client.post("/embeddings/search", json={"text": "SKU-4471", "mode": "hybrid", "k": 5,
+                                                       "candidates": 100})
+
+    assert response.status_code == 200
+    assert response.json() == {"results": [{"id": 4, "score": 0.0164, "distance": None, "vector_rank": None,
+                                            "text_rank": 1, "text": "Part SKU-4471"}]}
+    mock_embedding_crud.hybrid_search.assert_called_once_with("SKU-4471", [0.5] * 384, 5, "cosine", None, None,
+                                                              100, None, None)
+    assert client.post("/embeddings/search", json={"vector": [0.1] * 384, "mode": "hybrid"}).status_code == 422
+
+
+def test_search_embeddings_wrong_dimension(client, mock_embedding_crud):
+    mock_embedding_crud.search_embeddings = MagicMock()
+
+    response = client.post("/embeddings/search", json={"vector": [0.1, 0.2]})
+
+    assert response.status_code == 422
+    mock_embedding_crud.search_embeddings.assert_not_called()
+
+
+def test_search_embeddings_ids_only(client, mock_embedding_crud):
+    mock_embedding_instance = MagicMock()
+    mock_embedding_instance.id = 7
+    mock_embedding_crud.search_embeddings = MagicMock(return_value=[(mock_embedding_instance, 0.5)])
+
+    response = client.post("/embeddings/search", json={"vector": [0.1] * 384, "include_text": False})
+
+    assert response.status_code == 200
+    assert response.json() == {"results": [{"id": 7, "distance": 0.5}]}
+    mock_embedding_crud.search_embeddings.assert_called_once_with([0.1] * 384, 10, "cosine", None, None, False, None,
+                                                                 None)
+
+
+def test_get_embeddings_batch(client, mock_embedding_crud):
+    first, second = MagicMock(), MagicMock()
+    first.text, first.embedding = "first", [0.1, 0.2]
+    second.text, second.embedding = "second", [0.3, 0.4]
+    mock_embedding_crud.get_embeddings_by_ids = MagicMock(return_value={1: first, 2: second})
+
+    response = client.post("/embeddings/batch", json={"ids": [2, 5, 1]})
+
+    assert response.status_code == 200
+    assert response.json() == {
+        "embeddings": [
+            {"id": 2, "text": "second", "embedding": [0.3, 0.4]},
+            {"id": 1, "text": "first", "embedding": [0.1, 0.2]},
+        ],
+        "missing": [5],
+    }
+    mock_embedding_crud.get_embeddings_by_ids.assert_called_once_with([2, 5, 1], True, True)
+
+
+def test_get_embeddings_batch_ids_only(client, mock_embedding_crud):
+    mock_embedding_crud.get_embeddings_by_ids = MagicMock(return_value={4: MagicMock()})
+
+    response = client.post("/embeddings/batch",
+                           json={"ids": [4], "include_text": False, "include_embedding": False})
+
+    assert response.status_code == 200
+    assert response.json() == {"embeddings": [{"id": 4}], "missing": []}
+    mock_embedding_crud.get_embeddings_by_ids.assert_called_once_with([4], False, False)
+
+
+def test_get_embedding_as_raw_float32(client, mock_embedding_crud):
+    mock_embedding_instance = MagicMock()
+    mock_embedding_instance.id = 1
+    mock_embedding_instance.text = "sample"
+    mock_embedding_crud.get_embedding_by_id.return_value = (
+        mock_embedding_instance, np.array([0.1, 0.2, 0.3], dtype=np.float32))
+
+    response = client.get("/embeddings/1", headers={"Accept": "application/octet-stream"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/octet-stream"
+    assert response.headers["x-embedding-ids"] == "1"
+    assert np.frombuffer(response.content, dtype="<f4").tolist() == \
+        np.array([0.1, 0.2, 0.3], dtype=np.float32).tolist()
+
+
+def test_get_embedding_numpy_vector_as_json(client, mock_embedding_crud):
+    mock_embedding_instance = MagicMock()
+    mock_embedding_instance.id = 1
+    mock_embedding_instance.text = "sample"
+    mock_embedding_crud.get_embedding_by_id.return_value = (
+        mock_embedding_instance, np.array([0.5, 0.25], dtype=np.float32))
+
+    response = client.get("/embeddings/1")
+
+    assert response.status_code == 200
+    assert response.json() == {"id": 1, "text": "sample", "embedding": [0.5, 0.25]}
+
+
+def test_create_embedding_from_text_as_npy(mock_embedding_crud):
+    app = FastAPI()
+    mock_batcher = MagicMock()
+    mock_batcher.embed = AsyncMock(return_value=np.array([[1.0, 2.0], [3.0, 4.0]], dtype=np.float32))
+    mock_embedding_crud.save_embedding.return_value = [MagicMock(id=10), MagicMock(id=11)]
+    embedding_routes = EmbeddingRoutes(dependency=MagicMock(spec=Dependency), embedding_crud=mock_embedding_crud,
+                                       embedding_batcher=mock_batcher)
+    app.include_router(embedding_routes.router)
+
+    response = TestClient(app).post("/embedding/text/", json={"chunks": ["a", "b"]},
+                                    headers={"Accept": "application/x-npy"})
+
+    assert response.status_code == 200
+    assert response.headers["x-embedding-ids"] == "10,11"
+    assert np.load(io.BytesIO(response.content)).tolist() == [[1.0, 2.0], [3.0, 4.0]]
+
+
+def test_not_acceptable_format(client, mock_embedding_crud):
+    response = client.get("/embeddings/1", headers={"Accept": "text/csv"})
+
+    assert response.status_code == 406
+    mock_embedding_crud.get_embedding_by_id.assert_not_called()
+
+
+def test_delete_embedding(client, mock_embedding_crud):
+    mock_embedding_crud.delete_embeddings.return_value = 1
+
+    response = client.delete("/embeddings/3")
+
+    assert response.status_code == 200
+    assert response.json() == {"deleted": 3}
+    mock_embedding_crud.delete_embeddings.assert_called_once_with([3])
+
+
+def test_delete_embedding_not_found(client, mock_embedding_crud):
+    mock_embedding_crud.delete_embeddings.return_value = 0
+
+    response = client.delete("/embeddings/999")
+
+    assert response.status_code == 404
+    assert response.json() == {"detail": "Embedding not found"}
+
+
+def test_get_embedding_id_cache_stats(client, mock_embedding_crud):
+    mock_embedding_crud.id_cache = MagicMock()
+    mock_embedding_crud.id_cache.stats.return_value = {"hits": 3, "misses": 1}
+
+    response = client.get("/embedding/id-cache/stats")
+
+    assert response.status_code == 200
+    assert response.json() == {"hits": 3, "misses": 1}
+
+
+def test_get_database_pool_stats(mock_embedding_crud):
+    app = FastAPI()
+    mock_dependency = MagicMock()
+    mock_dependency.db.pool_stats.return_value = {"in_use": 1, "idle": 4}
+    embedding_routes = EmbeddingRoutes(dependency=mock_dependency, embedding_crud=mock_embedding_crud)
+    app.include_router(embedding_routes.router)
+
+    response = TestClient(app).get("/database/pool/stats")
+
+    assert response.status_code == 200
+    assert response.json() == {"in_use": 1, "idle": 4}
+
+
+def test_pool_exhausted_returns_503(client, mock_embedding_crud):
+    mock_embedding_crud.get_embedding_by_id.side_effect = MaxConnectionsExceeded("timed out")
+
+    response = client.get("/embeddings/1")
+
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+
+
+def test_crud_calls_run_inside_connection_context(mock_embedding_crud):
+    app = FastAPI()
+    events = []
+    mock_dependency = MagicMock()
+    mock_dependency.get_db.return_value.__enter__.side_effect = lambda *args: events.append("connect")
+    mock_dependency.get_db.return_value.__exit__.side_effect = lambda *args: events.append("close")
+    mock_embedding_crud.get_embedding_by_id.side_effect = lambda embedding_id: events.append("query")
+    embedding_routes = EmbeddingRoutes(dependency=mock_dependency, embedding_crud=mock_embedding_crud)
+    app.include_router(embedding_routes.router)
+
+    TestClient(app).get("/embeddings/1")
+
+    assert events == ["connect", "query", "close"]
+
+
+def test_create_embeddings_from_stream(mock_embedding_crud):
+    app = FastAPI()
+    mock_batcher = MagicMock()
+    mock_batcher.embed = AsyncMock(side_effect=lambda chunks: np.ones((len(chunks), 2), dtype=np.float32))
+    mock_embedding_crud.save_embedding.side_effect = lambda chunks, embeddings, tenant, metadata: [
+        MagicMock(id=index) for index, _ in enumerate(chunks)]
+    embedding_routes = EmbeddingRoutes(dependency=MagicMock(spec=Dependency), embedding_crud=mock_embedding_crud,
+                                       embedding_batcher=mock_batcher)
+    app.include_router(embedding_routes.router)
+
+    body = '"a"\n{"text": "b"}\n\n"c"\n'
+    response = TestClient(app).post("/embedding/stream/?batch_size=2&include_embeddings=true", content=body)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines == [{"batch": 0, "ids": [0, 1], "embeddings": [[1.0, 1.0], [1.0, 1.0]]},
+                     {"batch": 1, "ids": [0], "embeddings": [[1.0, 1.0]]}]
+    assert [call.args[0] for call in mock_batcher.embed.call_args_list] == [["a", "b"], ["c"]]
+
+
+def test_create_embeddings_from_stream_reports_bad_line(mock_embedding_crud):
+    app = FastAPI()
+    mock_batcher = MagicMock()
+    mock_batcher.embed = AsyncMock(side_effect=lambda chunks: np.ones((len(chunks), 2), dtype=np.float32))
+    mock_embedding_crud.save_embedding.side_effect = lambda chunks, embeddings, tenant, metadata: [
+        MagicMock(id=1) for _ in chunks]
+    embedding_routes = EmbeddingRoutes(dependency=MagicMock(spec=Dependency), embedding_crud=mock_embedding_crud,
+                                       embedding_batcher=mock_batcher)
+    app.include_router(embedding_routes.router)
+
+    response = TestClient(app).post("/embedding/stream/?batch_size=1", content='"a"\nnot json\n"c"\n')
+
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines[0] == {"batch": 0, "ids": [1]}
+    assert lines[1] == {"batch": 1, "error": "Line 2 is not valid JSON"}
+    assert mock_embedding_crud.save_embedding.call_count == 1
+
+
+
+def test_create_embedding_skips_saved_chunks(mock_embedding_crud):
+    app = FastAPI()
+    mock_batcher = MagicMock()
+    mock_batcher.embed = AsyncMock(side_effect=lambda chunks: np.ones((len(chunks), 2), dtype=np.float32))
+    mock_embedding_crud.find_by_content.return_value = {
+        "saved": Embedding(id=3, text="saved", embedding=np.array([0.5, 0.25], dtype=np.float32))}
+    mock_embedding_crud.save_embedding.side_effect = lambda chunks, embeddings, tenant, metadata: [
+        Embedding(id=10 + index, text=chunk) for index, chunk in enumerate(chunks)]
+    embedding_routes = EmbeddingRoutes(dependency=MagicMock(spec=Dependency), embedding_crud=mock_embedding_crud,
+                                       embedding_batcher=mock_batcher)
+    app.include_router(embedding_routes.router)
+
+    response = TestClient(app).post("/embedding/text/", json={"chunks": ["new", "saved", "new"]},
+                                    headers={"Accept": "application/octet-stream"})
+
+    assert response.status_code == 200
+    # Saved chunks and repeats are neither encoded nor written again
+    mock_batcher.embed.assert_awaited_once_with(["new"])
+    assert mock_embedding_crud.save_embedding.call_args.args[0] == ["new"]
+    assert response.headers["X-Embedding-Ids"] == "10,3,10"
+    assert np.frombuffer(response.content, dtype="<f4").reshape(3, 2).tolist() == [
+        [1.0, 1.0], [0.5, 0.25], [1.0, 1.0]]
+
+
+def test_create_embedding_for_tenant_with_metadata(mock_embedding_crud):
+    app = FastAPI()
+    mock_batcher = MagicMock()
+    mock_batcher.embed = AsyncMock(side_effect=lambda chunks: np.ones((len(chunks), 2), dtype=np.float32))
+    mock_embedding_crud.save_embedding.side_effect = lambda chunks, embeddings, tenant, metadata: [
+        Embedding(id=5, text=chunk, tenant=tenant, metadata=metadata) for chunk in chunks]
+    embedding_routes = EmbeddingRoutes(dependency=MagicMock(spec=Dependency), embedding_crud=mock_embedding_crud,
+                                       embedding_batcher=mock_batcher)
+    app.include_router(embedding_routes.router)
+
+    response = TestClient(app).post("/embedding/text/", json={"chunks": ["a"], "tenant": "acme",
+                                                              "metadata": {"source": "wiki", "page": 3}})
+
+    assert response.status_code == 200
+    # Chunks are looked up and saved within the tenant, with their metadata
+    mock_embedding_crud.find_by_content.assert_called_once_with(["a"], True, "acme", {"source": "wiki", "page": 3})
+    assert mock_embedding_crud.save_embedding.call_args.args[2:] == ("acme", {"source": "wiki", "page": 3})
+
+
+def _document_routes(mock_embedding_crud):
+    executor = MagicMock()
+    # Run the chunking and encoding inline instead of on a worker pool
+    executor.run = AsyncMock(side_effect=lambda fn, *args: fn(*args))
+    app = FastAPI()
+    app.include_router(EmbeddingRoutes(dependency=MagicMock(spec=Dependency), embedding_crud=mock_embedding_crud,
+                                       embedding_batcher=MagicMock(), inference_executor=executor).router)
+    return TestClient(app)
+
+
+def test_create_embeddings_from_documents(mock_embedding_crud):
+    from app.models.embedding_model import hash_content
+    from app.utils.chunking import DocumentChunk
+
+    chunked = [[DocumentChunk("a b", 0, 3, [5, 6]), DocumentChunk("b c", 2, 5, [6, 7])],
+               [DocumentChunk("x", 0, 1, [9])]]
+    mock_embedding_crud.find_by_hash.return_value = {hash_content("x", None, ("d2", 0, 1)): 42}
+    mock_embedding_crud.save_embedding.side_effect = lambda chunks, embeddings, tenant, metadata, sources: [
+        Embedding(id=10 + i) for i in range(len(chunks))]
+    encode = MagicMock(side_effect=lambda token_ids, *args: np.ones((len(token_ids), 2), dtype=np.float32))
+
+    with patch("api.endpoints.embedding_routes.chunk_documents", return_value=chunked) as chunk, \
+            patch("api.endpoints.embedding_routes.compute_embeddings_from_tokens", encode):
+        response = _document_routes(mock_embedding_crud).post("/embedding/documents/", json={
+            "documents": [{"id": "d1", "text": "a b c", "metadata": {"source": "wiki"}}, {"id": "d2", "text": "x"}],
+            "tenant": "acme", "max_tokens": 32, "overlap": 4})
+
+    assert response.status_code == 200
+    assert chunk.call_args.args[:3] == (["a b c", "x"], 32, 4)
+    # Only the chunks not saved yet are encoded, from the tokens of the split
+    assert encode.call_args.args[0] == [[5, 6], [6, 7]]
+    save = mock_embedding_crud.save_embedding.call_args
+    assert save.args[0] == ["a b", "b c"]
+    assert save.args[2:] == ("acme", {"source": "wiki"}, [("d1", 0, 3), ("d1", 2, 5)])
+    assert response.json() == {"documents": [
+        {"id": "d1", "chunks": [{"id": 10, "start": 0, "end": 3, "tokens": 2},
+                                {"id": 11, "start": 2, "end": 5, "tokens": 2}]},
+        {"id": "d2", "chunks": [{"id": 42, "start": 0, "end": 1, "tokens": 1}]},
+    ]}
+
+
+def test_create_embeddings_from_documents_rejects_large_overlap(mock_embedding_crud):
+    with patch("api.endpoints.embedding_routes.chunk_documents",
+               side_effect=ValueError("Chunk overlap must be between 0 and 31 tokens")):
+        response = _document_routes(mock_embedding_crud).post("/embedding/documents/", json={
+            "documents": [{"id": "d1", "text": "a b c"}], "max_tokens": 32, "overlap": 32})
+
+    assert response.status_code == 422
+    assert response.json()["detail"] == "Chunk overlap must be between 0 and 31 tokens"
+    mock_embedding_crud.save_embedding.assert_not_called()
+
+
+def test_search_embeddings_reports_document_source(client, mock_embedding_crud):
+    row = MagicMock(id=7, metadata=None, document_id="d1", chunk_start=10, chunk_end=42)
+    mock_embedding_crud.search_embeddings = MagicMock(return_value=[(row, 0.25)])
+
+    response = client.post("/embeddings/search", json={"vector": [0.1] * 384, "include_text": False,
+                                                       "include_metadata": True})
+
+    assert response.json() == {"results": [{"id": 7, "distance": 0.25, "metadata": None,
+                                            "document": {"id": "d1", "start": 10, "end": 42}}]}
+
+
+def test_search_embeddings_with_filter(client, mock_embedding_crud):
+    row = MagicMock(id=7, text="nearest", metadata={"source": "wiki"}, document_id=None)
+    mock_embedding_crud.search_embeddings = MagicMock(return_value=[(row, 0.25)])
+
+    response = client.post("/embeddings/search", json={"vector": [0.1] * 384, "tenant": "acme",
+                                                       "metadata": {"source": "wiki"}, "include_text": False,
+                                                       "include_metadata": True})
+
+    assert response.status_code == 200
+    assert response.json() == {"results": [{"id": 7, "distance": 0.25, "metadata": {"source": "wiki"}}]}
+    mock_embedding_crud.search_embeddings.assert_called_once_with([0.1] * 384, 10, "cosine", None, None, True,
+                                                                  "acme", {"source": "wiki"})
+
+
+def test_create_embedding_with_another_model(mock_embedding_crud):
+    from app.core.model_registry import ModelRegistry
+
+    app = FastAPI()
+    registry = ModelRegistry("default", backend="torch", models={"default": 2, "other": 3}, loader=MagicMock())
+    other_crud = MagicMock(EmbeddingCRUD)
+    other_crud.save_embedding.return_value = [MagicMock(id=7)]
+    other_crud.find_by_content.return_value = {}
+    mock_embedding_crud.for_table.return_value = other_crud
+    embedding_routes = EmbeddingRoutes(dependency=MagicMock(spec=Dependency), embedding_crud=mock_embedding_crud,
+                                       embedding_batcher=MagicMock(), model_registry=registry)
+    other_batcher = MagicMock()
+    other_batcher.embed = AsyncMock(return_value=np.ones((1, 3), dtype=np.float32))
+    embedding_routes._batchers["other"] = other_batcher
+    app.include_router(embedding_routes.router)
+    client = TestClient(app)
+
+    response = client.post("/embedding/text/", json={"chunks": ["a"], "model": "other"})
+
+    assert response.status_code == 200
+    assert response.json() == {"embeddings": [[1.0, 1.0, 1.0]]}
+    mock_embedding_crud.for_table.assert_called_once_with(registry.table("other"))
+    mock_embedding_crud.save_embedding.assert_not_called()
+
+    assert client.post("/embedding/text/", json={"chunks": ["a"], "model": "missing"}).status_code == 404
+    assert client.get("/embeddings/1?model=missing").status_code == 404
+
+
+def test_search_projects_full_dimension_vectors(mock_embedding_crud, tmp_path, monkeypatch):
+    from app.core.model_registry import ModelRegistry
+    from app.utils.projection import Projection, projection_path
+
+    monkeypatch.setenv("EMBEDDING_PROJECTION_DIR", str(tmp_path))
+    Projection.truncation(3, 2).save(projection_path("default", 1))
+    registry = ModelRegistry("default", backend="torch", models={"default": 3}, loader=MagicMock(), storage={},
+                             projections={"default": 1}, normalize=True)
+    app = FastAPI()
+    app.include_router(EmbeddingRoutes(dependency=MagicMock(spec=Dependency), embedding_crud=mock_embedding_crud,
+                                       embedding_batcher=MagicMock(), model_registry=registry).router)
+    mock_embedding_crud.search_embeddings.return_value = []
+    client = TestClient(app)
+
+    assert client.post("/embeddings/search", json={"vector": [3.0, 4.0, 12.0]}).status_code == 200
+    assert client.post("/embeddings/search", json={"vector": [0.6, 0.8]}).status_code == 200
+    assert client.post("/embeddings/search", json={"vector": [1.0]}).status_code == 422
+
+    searched = [call.args[0] for call in mock_embedding_crud.search_embeddings.call_args_list]
+    assert np.asarray(searched[0]).tolist() == pytest.approx([0.6, 0.8])
+    assert searched[1] == [0.6, 0.8]
@@ -0,0 +1,24 @@
+from unittest.mock import MagicMock
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from api.endpoints import HealthRoutes
+from app.core.model_registry import ModelRegistry
+
+
+def test_health_routes():
+    registry = ModelRegistry("some-model", backend="torch", loader=MagicMock())
+    app = FastAPI()
+    app.include_router(HealthRoutes(registry).router)
+    client = TestClient(app)
+
+    assert client.get("/health/live").json() == {"status": "ok"}
+    not_ready = client.get("/health/ready")
+    assert not_ready.status_code == 503
+    assert not_ready.json()["state"] == "not_loaded"
+
+    registry.get()
+    ready = client.get("/health/ready")
+    assert ready.status_code == 200
+    assert ready.json()["state"] == "ready"
@@ -0,0 +1,94 @@
+import json
+from unittest.mock import MagicMock
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from api.endpoints import EmbeddingRoutes, JobRoutes
+from app.core.model_registry import ModelRegistry
+from app.models.job_model import EmbeddingJob, EmbeddingJobBatch
+
+
+@pytest.fixture
+def job_tables():
+    database = EmbeddingJob._meta.database
+    database.create_tables([EmbeddingJob, EmbeddingJobBatch])
+    yield
+    database.drop_tables([EmbeddingJobBatch, EmbeddingJob])
+
+
+@pytest.fixture
+def client(job_tables, tmp_path, monkeypatch):
+    monkeypatch.setenv("EMBEDDING_JOB_FILE_ROOT", str(tmp_path))
+    registry = ModelRegistry("test-model", loader=MagicMock(), models={"test-model": 384})
+    embedding_routes = EmbeddingRoutes(dependency=MagicMock(), embedding_crud=MagicMock(), model_registry=registry)
+    app = FastAPI()
+    app.include_router(JobRoutes(embedding_routes).router)
+    return TestClient(app)
+
+
+def test_create_job_from_chunks(client):
+    response = client.post("/embedding/jobs", json={"chunks": ["a", "b", "c"], "batch_size": 2})
+
+    assert response.status_code == 202
+    job = response.json()
+    assert job["status"] == "queued"
+    assert job["total_chunks"] == 3
+    assert job["batches"]["pending"] == 2
+    assert client.get(f"/embedding/jobs/{job['id']}").json()["model"] == "test-model"
+
+
+def test_create_job_from_upload(client):
+    body = "\n".join(json.dumps(line) for line in ["a", {"text": "b"}, "c"])
+
+    response = client.post("/embedding/jobs/upload?batch_size=1", content=body)
+
+    assert response.status_code == 202
+    assert response.json()["source"] == "upload"
+    assert response.json()["batches"]["pending"] == 3
+
+
+def test_malformed_upload_creates_no_job(client):
+    response = client.post("/embedding/jobs/upload", content='"a"\n{not json\n')
+
+    assert response.status_code == 400
+    assert "Line 2" in response.json()["detail"]
+    assert EmbeddingJob.select().count() == 0
+
+
+def test_create_job_from_file(client, tmp_path):
+    (tmp_path / "corpus.jsonl").write_text('"a"\n"b"\n')
+
+    response = client.post("/embedding/jobs", json={"path": "corpus.jsonl"})
+
+    assert response.status_code == 202
+    assert response.json()["source"] == "file"
+    assert response.json()["total_chunks"] == 2
+
+
+@pytest.mark.parametrize("path, status_code", [("../etc/passwd", 403), ("/etc/passwd", 403), ("missing.jsonl", 404)])
+def test_create_job_from_file_is_confined(client, path, status_code):
+    assert client.post("/embedding/jobs", json={"path": path}).status_code == status_code
+
+
+def test_job_request_needs_one_source(client):
+    assert client.post("/embedding/jobs", json={}).status_code == 422
+    assert client.post("/embedding/jobs", json={"chunks": ["a"], "path": "x"}).status_code == 422
+
+
+def test_unknown_job_and_model(client):
+    assert client.get("/embedding/jobs/999999").status_code == 404
+    assert client.get("/embedding/jobs/999999/results").status_code == 404
+    assert client.post("/embedding/jobs", json={"chunks": ["a"], "model": "nope"}).status_code == 404
+
+
+def test_job_results_page_through_done_batches(client):
+    job_id = client.post("/embedding/jobs", json={"chunks": ["a", "b", "c"], "batch_size": 1}).json()["id"]
+    EmbeddingJobBatch.update(status="done", embedding_ids="[7]").where(EmbeddingJobBatch.position < 2).execute()
+
+    first = client.get(f"/embedding/jobs/{job_id}/results?limit=1").json()
+    second = client.get(f"/embedding/jobs/{job_id}/results?after={first['next']}").json()
+
+    assert first == {"batches": [{"batch": 0, "ids": [7]}], "next": 0}
+    assert second == {"batches": [{"batch": 1, "ids": [7]}], "next": 1}
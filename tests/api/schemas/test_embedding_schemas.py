@@ -1,7 +1,8 @@
 import pytest
 from pydantic import ValidationError
 
-from api.schemas.embedding_schemas import EmbeddingIdRequest, EmbeddingRequest, TextRequest
+from api.schemas.embedding_schemas import EmbeddingIdRequest, EmbeddingRequest, TextRequest, SearchRequest, \
+    BatchEmbeddingRequest, DocumentRequest
 
 
 # Test EmbeddingIdRequest
@@ -49,9 +50,70 @@ def test_text_request_valid():
     request = TextRequest(**data)
     assert request.chunks == ["chunk 1", "chunk 2"]
 
+def test_text_request_tenant_and_metadata():
+    assert TextRequest(chunks=["a"]).tenant == ""
+    request = TextRequest(chunks=["a"], tenant="acme", metadata={"source": "wiki", "tags": ["x"]})
+    assert request.metadata == {"source": "wiki", "tags": ["x"]}
+    with pytest.raises(ValidationError):
+        TextRequest(chunks=["a"], metadata=["not", "an", "object"])
+
 def test_text_request_invalid_chunks():
     data = {
         "chunks": "invalid"  # chunks should be a list of strings
     }
     with pytest.raises(ValidationError):
         TextRequest(**data)
+
+
+# Test SearchRequest
+def test_search_request_text_defaults():
+    request = SearchRequest(text="query")
+    assert request.k == 10
+    assert request.metric == "cosine"
+    assert request.vector is None
+
+def test_search_request_vector():
+    request = SearchRequest(vector=[0.1, 0.2], k=5, metric="inner_product", ef_search=80)
+    assert request.vector == [0.1, 0.2]
+    assert request.ef_search == 80
+
+def test_search_request_requires_one_query():
+    with pytest.raises(ValidationError):
+        SearchRequest()
+    with pytest.raises(ValidationError):
+        SearchRequest(text="query", vector=[0.1])
+
+def test_search_request_invalid_metric_and_k():
+    with pytest.raises(ValidationError):
+        SearchRequest(text="query", metric="hamming")
+    with pytest.raises(ValidationError):
+        SearchRequest(text="query", k=0)
+
+
+# Test BatchEmbeddingRequest
+def test_batch_embedding_request_valid():
+    request = BatchEmbeddingRequest(ids=[3, 1, 2], include_embedding=False)
+    assert request.ids == [3, 1, 2]
+    assert request.include_text is True
+    assert request.include_embedding is False
+
+def test_batch_embedding_request_limits():
+    with pytest.raises(ValidationError):
+        BatchEmbeddingRequest(ids=[])
+    with pytest.raises(ValidationError):
+        BatchEmbeddingRequest(ids=list(range(5001)))
+
+
+# Test DocumentRequest
+def test_document_request_valid():
+    request = DocumentRequest(documents=[{"id": "d1", "text": "Some text.", "metadata": {"source": "wiki"}}])
+    assert request.documents[0].metadata == {"source": "wiki"}
+    assert request.max_tokens is None and request.overlap is None
+
+def test_document_request_limits():
+    with pytest.raises(ValidationError):
+        DocumentRequest(documents=[])
+    with pytest.raises(ValidationError):
+        DocumentRequest(documents=[{"id": "", "text": "Some text."}])
+    with pytest.raises(ValidationError):
+        DocumentRequest(documents=[{"id": "d1", "text": "Some text."}], overlap=-1)
@@ -0,0 +1,70 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+from app.core.executor import InferenceExecutor
+
+
+def test_executor_reads_environment(monkeypatch):
+    monkeypatch.setenv("EMBEDDING_EXECUTOR", "process")
+    monkeypatch.setenv("EMBEDDING_WORKERS", "3")
+    monkeypatch.setenv("EMBEDDING_TORCH_THREADS", "2")
+    monkeypatch.setenv("EMBEDDING_MAX_QUEUE_DEPTH", "7")
+
+    executor = InferenceExecutor()
+
+    assert executor.mode == "process"
+    assert executor.max_workers == 3
+    assert executor.torch_threads == 2
+    assert executor.max_queue_depth == 7
+
+
+def test_executor_rejects_unknown_mode():
+    with pytest.raises(ValueError, match="Unknown executor mode"):
+        InferenceExecutor(mode="fiber")
+
+
+def test_executor_runs_off_the_event_loop():
+    executor = InferenceExecutor(mode="thread", max_workers=1)
+
+    async def run():
+        return await executor.run(threading.get_ident)
+
+    try:
+        worker_thread = asyncio.run(run())
+    finally:
+        executor.shutdown()
+
+    assert worker_thread != threading.get_ident()
+    assert executor.queue_depth == 0
+
+
+def test_executor_rejects_when_saturated():
+    executor = InferenceExecutor(mode="thread", max_workers=1, max_queue_depth=1)
+    release = threading.Event()
+
+    async def run():
+        blocked = asyncio.ensure_future(executor.run(release.wait))
+        await asyncio.sleep(0.01)
+        assert executor.queue_depth == 1
+        with pytest.raises(HTTPException) as exc_info:
+            await executor.run(lambda: None)
+        release.set()
+        await blocked
+        return exc_info.value
+
+    try:
+        error = asyncio.run(run())
+    finally:
+        executor.shutdown()
+
+    assert error.status_code == 503
+    assert error.headers == {"Retry-After": "1"}
+    assert executor.queue_depth == 0
+
+
+def test_executor_shutdown_without_pool():
+    executor = InferenceExecutor(mode="thread")
+    executor.shutdown()  # Nothing was submitted, so there is no pool to stop
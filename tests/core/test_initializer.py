@@ -1,10 +1,11 @@
 import pytest
 from unittest.mock import Mock
 from fastapi import FastAPI
+from peewee import PostgresqlDatabase
 
 from core.initializer import AppInitializer
-from database.database import Database
-from models.embedding_model import Embedding
+from database.database import Database, database_instance
+from models.embedding_model import Embedding, embedding_table, hash_content, tenant_relation_name
 
 
 @pytest.fixture
@@ -27,3 +28,216 @@ def test_app_initializer_initialize_calls_database_initialize(mock_app, mock_dat
     initializer = AppInitializer(app=mock_app, db=mock_database)
     initializer.initialize()
     mock_database.create_tables.assert_called_once()
+    mock_database.warm_up.assert_called_once()
+
+
+def test_app_initializer_creates_hnsw_index_by_default(mock_app, mock_database, monkeypatch):
+    monkeypatch.delenv("EMBEDDING_INDEX_TYPE", raising=False)
+    monkeypatch.delenv("EMBEDDING_INDEX_METRIC", raising=False)
+    initializer = AppInitializer(app=mock_app, db=mock_database)
+    initializer.initialize()
+    mock_database.execute_sql.assert_any_call(
+        'CREATE INDEX IF NOT EXISTS "embedding_embedding_hnsw_cosine_idx" ON "embedding" '
+        'USING hnsw ("embedding" vector_cosine_ops) WITH (m = 16, ef_construction = 64)')
+
+
+def test_app_initializer_creates_ivfflat_index(mock_app, mock_database, monkeypatch):
+    monkeypatch.setenv("EMBEDDING_INDEX_TYPE", "ivfflat")
+    monkeypatch.setenv("EMBEDDING_INDEX_METRIC", "l2")
+    monkeypatch.setenv("EMBEDDING_IVFFLAT_LISTS", "50")
+    initializer = AppInitializer(app=mock_app, db=mock_database)
+    initializer.create_vector_index()
+    mock_database.execute_sql.assert_called_once_with(
+        'CREATE INDEX IF NOT EXISTS "embedding_embedding_ivfflat_l2_idx" ON "embedding" '
+        'USING ivfflat ("embedding" vector_l2_ops) WITH (lists = 50)')
+
+
+def test_app_initializer_skips_index(mock_app, mock_database, monkeypatch):
+    monkeypatch.setenv("EMBEDDING_INDEX_TYPE", "none")
+    initializer = AppInitializer(app=mock_app, db=mock_database)
+    initializer.create_vector_index()
+    mock_database.execute_sql.assert_not_called()
+
+
+def test_app_initializer_rejects_unknown_index(mock_app, mock_database, monkeypatch):
+    monkeypatch.setenv("EMBEDDING_INDEX_TYPE", "lsh")
+    initializer = AppInitializer(app=mock_app, db=mock_database)
+    with pytest.raises(ValueError, match="Unknown vector index type"):
+        initializer.create_vector_index()
+
+
+def test_app_initializer_load_faiss_index(mock_app, mock_database):
+    faiss_index = Mock()
+    embedding_crud = Mock()
+    initializer = AppInitializer(app=mock_app, db=mock_database)
+
+    initializer.load_faiss_index(faiss_index, embedding_crud)
+
+    faiss_index.load.assert_called_once_with(embedding_crud.iter_embeddings_after)
+    assert faiss_index.save in mock_app.router.on_shutdown
+
+
+def test_app_initializer_indexes_binary_quantized_vectors(mock_app, mock_database, monkeypatch):
+    monkeypatch.delenv("EMBEDDING_INDEX_TYPE", raising=False)
+    table = embedding_table("test/bit-model", 384, "halfvec-bit")
+    initializer = AppInitializer(app=mock_app, db=mock_database)
+    initializer.create_vector_index([table], concurrently=True)
+    mock_database.execute_sql.assert_called_once_with(
+        'CREATE INDEX CONCURRENTLY IF NOT EXISTS "embedding_test_bit_model_embedding_hnsw_bit_idx" '
+        'ON "embedding_test_bit_model" USING hnsw ((binary_quantize("embedding")::bit(384)) bit_hamming_ops) '
+        'WITH (m = 16, ef_construction = 64)')
+
+
+def test_app_initializer_indexes_half_precision_vectors(mock_app, mock_database, monkeypatch):
+    monkeypatch.setenv("EMBEDDING_INDEX_TYPE", "ivfflat")
+    monkeypatch.setenv("EMBEDDING_INDEX_METRIC", "inner_product")
+    table = embedding_table("test/half-model", 384, "halfvec")
+    initializer = AppInitializer(app=mock_app, db=mock_database)
+    initializer.create_vector_index([table])
+    mock_database.execute_sql.assert_called_once_with(
+        'CREATE INDEX IF NOT EXISTS "embedding_test_half_model_embedding_ivfflat_inner_pr_11f308e38e" '
+        'ON "embedding_test_half_model" USING ivfflat ("embedding" halfvec_ip_ops) WITH (lists = 100)')
+
+
+def test_app_initializer_creates_text_search_when_hybrid_search_is_enabled(mock_app, mock_database, monkeypatch):
+    monkeypatch.setenv("EMBEDDING_HYBRID_SEARCH", "true")
+    monkeypatch.setenv("EMBEDDING_INDEX_TYPE", "none")
+    monkeypatch.setenv("EMBEDDING_TEXT_SEARCH_CONFIG", "simple")
+    initializer = AppInitializer(app=mock_app, db=mock_database)
+
+    initializer.initialize()
+
+    assert [call.args[0] for call in mock_database.execute_sql.call_args_list[-2:]] == [
+        'ALTER TABLE "embedding" ADD COLUMN IF NOT EXISTS "text_search" tsvector '
+        'GENERATED ALWAYS AS (to_tsvector(\'simple\'::regconfig, "text")) STORED',
+        'CREATE INDEX IF NOT EXISTS "embedding_text_search_idx" ON "embedding" USING gin ("text_search")',
+    ]
+
+
+def test_app_initializer_rejects_invalid_text_search_config(mock_app, mock_database, monkeypatch):
+    monkeypatch.setenv("EMBEDDING_TEXT_SEARCH_CONFIG", "english'); DROP TABLE embedding; --")
+    initializer = AppInitializer(app=mock_app, db=mock_database)
+
+    with pytest.raises(ValueError, match="Invalid text search configuration"):
+        initializer.create_text_search()
+
+
+def test_app_initializer_adds_content_hash_before_creating_tables(mock_app, mock_database, monkeypatch):
+    monkeypatch.setenv("EMBEDDING_INDEX_TYPE", "none")
+    calls = []
+    mock_database.execute_sql.side_effect = lambda sql, params=None: calls.append(sql)
+    mock_database.create_tables.side_effect = lambda tables: calls.append("create_tables")
+    initializer = AppInitializer(app=mock_app, db=mock_database)
+
+    initializer.initialize()
+
+    assert calls[3] == "create_tables"
+    assert 'ALTER TABLE "embedding" ADD COLUMN IF NOT EXISTS "content_hash" varchar(64)' in calls[0]
+    # Only the first of each set of duplicate rows gets a hash, so the unique index can be built
+    assert 'WHERE "id" IN (SELECT min("id") FROM "embedding" GROUP BY "text")' in calls[0]
+    # Hashes are unique per tenant from then on
+    assert calls[1:3] == [
+        'ALTER TABLE IF EXISTS "embedding" ADD COLUMN IF NOT EXISTS "tenant" text NOT NULL DEFAULT \'\', '
+        'ADD COLUMN IF NOT EXISTS "metadata" jsonb, ADD COLUMN IF NOT EXISTS "document_id" text, '
+        'ADD COLUMN IF NOT EXISTS "chunk_start" integer, ADD COLUMN IF NOT EXISTS "chunk_end" integer',
+        'DROP INDEX IF EXISTS "embedding_content_hash"',
+    ]
+    assert calls[4] == ('CREATE INDEX IF NOT EXISTS "embedding_metadata_idx" ON "embedding" '
+                        'USING gin ("metadata" jsonb_path_ops)')
+
+
+@pytest.mark.skipif(not isinstance(Embedding._meta.database, PostgresqlDatabase), reason="Needs PostgreSQL")
+def test_app_initializer_adds_content_hash_to_existing_table():
+    from crud.embedding_crud import EmbeddingCRUD
+
+    table = embedding_table("test/legacy-hash", 3)
+    name = table._meta.table_name
+    database = table._meta.database
+    with database.connection_context():
+        database.execute_sql(f'DROP TABLE IF EXISTS "{name}"')
+        database.execute_sql(f'CREATE TABLE "{name}" ("id" SERIAL PRIMARY KEY, "text" TEXT NOT NULL, '
+                             f'"embedding" vector(3) NOT NULL, "created_at" INTEGER NOT NULL DEFAULT 0, '
+                             f'"updated_at" INTEGER NOT NULL DEFAULT 0)')
+        database.execute_sql(f'INSERT INTO "{name}" ("text", "embedding") '
+                             f"VALUES ('café', '[1,0,0]'), ('twice', '[0,1,0]'), ('twice', '[0,0,1]')")
+    try:
+        initializer = AppInitializer(None, database_instance)
+        initializer.add_content_hash([table])
+        initializer.add_metadata([table])
+        database_instance.create_tables([table])
+        # Running again leaves the table as it is
+        initializer.add_content_hash([table])
+
+        with database.connection_context():
+            rows = list(table.select(table.id, table.text, table.content_hash).order_by(table.id).tuples())
+            # Only the first of the duplicates gets the hash
+            assert rows == [(1, 'café', hash_content('café')), (2, 'twice', hash_content('twice')),
+                            (3, 'twice', None)]
+            saved = EmbeddingCRUD(table=table).save_embedding(['twice', 'new'], [[0.0, 1.0, 0.0], [1.0, 1.0, 0.0]])
+            assert saved[0].id == 2 and saved[1].id > 3
+    finally:
+        with database.connection_context():
+            database.execute_sql(f'DROP TABLE IF EXISTS "{name}"')
+
+
+def test_app_initializer_creates_dedicated_tenant_indexes(mock_app, mock_database, monkeypatch):
+    monkeypatch.delenv("EMBEDDING_INDEX_TYPE", raising=False)
+    monkeypatch.delenv("EMBEDDING_INDEX_METRIC", raising=False)
+    monkeypatch.delenv("EMBEDDING_PARTITION_BY_TENANT", raising=False)
+    monkeypatch.setenv("EMBEDDING_DEDICATED_TENANTS", "acme, o'brien")
+    initializer = AppInitializer(app=mock_app, db=mock_database)
+
+    initializer.create_vector_index()
+
+    calls = mock_database.execute_sql.call_args_list
+    assert len(calls) == 3
+    for tenant, (args, _) in zip(["acme", "o'brien"], calls[1:]):
+        # The tenant is a parameter, quoted by the driver
+        assert args == (f'CREATE INDEX IF NOT EXISTS "{tenant_relation_name("embedding", tenant)}'
+                        f'_embedding_hnsw_cosine_idx" ON "embedding" USING hnsw ("embedding" vector_cosine_ops) '
+                        f'WITH (m = 16, ef_construction = 64) WHERE "tenant" = %s', (tenant,))
+
+
+@pytest.mark.skipif(not isinstance(Embedding._meta.database, PostgresqlDatabase), reason="Needs PostgreSQL")
+def test_app_initializer_partitions_tables_by_tenant(monkeypatch):
+    from crud.embedding_crud import EmbeddingCRUD
+
+    monkeypatch.setenv("EMBEDDING_INDEX_TYPE", "hnsw")
+    monkeypatch.setenv("EMBEDDING_INDEX_METRIC", "l2")
+    table = embedding_table("test/partitioned", 3)
+    name = table._meta.table_name
+    database = table._meta.database
+    initializer = AppInitializer(None, database_instance)
+    table.drop_table(safe=True, cascade=True)
+    try:
+        initializer.create_partitioned_tables([table])
+        database_instance.create_tables([table])
+        crud = EmbeddingCRUD(table=table, copy_threshold=1)
+        saved = crud.save_embedding(["a", "b"], [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]], tenant="acme")
+        crud.save_embedding(["a"], [[0.0, 0.0, 1.0]], tenant="other")
+
+        # Rows the tenant already has move to its new partition; running again changes nothing
+        initializer.create_tenant_partitions([table], ["acme"])
+        initializer.create_tenant_partitions([table], ["acme"])
+        initializer.create_vector_index([table])
+
+        with database.connection_context():
+            partitions = dict(database.execute_sql(
+                f'SELECT "id", tableoid::regclass::text FROM "{name}"').fetchall())
+            assert partitions == {saved[0].id: tenant_relation_name(name, "acme"),
+                                  saved[1].id: tenant_relation_name(name, "acme"),
+                                  saved[1].id + 1: f"{name}_default"}
+            results = crud.search_embeddings([0.0, 0.9, 0.0], k=2, metric="l2", tenant="acme")
+            assert [instance.text for instance, _ in results] == ["b", "a"]
+            # Deduplication holds across partitions
+            assert crud.save_embedding(["a"], [[0.5, 0.5, 0.0]], tenant="acme")[0].id == saved[0].id
+
+        # Any text is a valid tenant, including what would end a dollar-quoted block
+        tenant = "o'brien $$; drop"
+        crud.save_embedding(["c"], [[0.0, 0.0, 1.0]], tenant=tenant)
+        initializer.create_tenant_partitions([table], [tenant])
+        with database.connection_context():
+            assert database.execute_sql(f'SELECT tableoid::regclass::text FROM "{name}" WHERE "text" = %s',
+                                        ("c",)).fetchone()[0] == tenant_relation_name(name, tenant)
+    finally:
+        table.drop_table(safe=True, cascade=True)
@@ -0,0 +1,111 @@
+import asyncio
+from unittest.mock import MagicMock
+
+import numpy as np
+import pytest
+from fastapi import HTTPException
+
+from app.api.endpoints import EmbeddingRoutes
+from app.core.job_worker import JobWorker
+from app.core.model_registry import ModelRegistry
+from app.crud.embedding_crud import EmbeddingCRUD
+from app.crud.job_crud import JobCRUD
+from app.models.embedding_model import Embedding
+from app.models.job_model import EmbeddingJob, EmbeddingJobBatch
+from app.utils.embedding_utils import EmbeddingBatcher
+
+
+@pytest.fixture
+def job_tables():
+    database = EmbeddingJob._meta.database
+    database.create_tables([Embedding, EmbeddingJob, EmbeddingJobBatch])
+    # Chunks saved by an earlier test would not be encoded again
+    Embedding.delete().execute()
+    yield
+    database.drop_tables([EmbeddingJobBatch, EmbeddingJob])
+
+
+def make_worker(encode):
+    registry = ModelRegistry("test-model", loader=MagicMock(), models={"test-model": 384})
+    routes = EmbeddingRoutes(dependency=MagicMock(), embedding_crud=EmbeddingCRUD(),
+                             embedding_batcher=EmbeddingBatcher(encode=encode), model_registry=registry)
+    return JobWorker(routes, concurrency=1, poll_interval=0.01, lease_seconds=60, max_attempts=2)
+
+
+def submit(chunks, batch_size=2):
+    crud = JobCRUD()
+    job = crud.create_job("test-model", "chunks", batch_size)
+    batches = [chunks[i:i + batch_size] for i in range(0, len(chunks), batch_size)]
+    crud.add_batches(job.id, batches, 0)
+    crud.seal_job(job.id, len(chunks))
+    return job.id
+
+
+def test_worker_processes_every_batch(job_tables):
+    worker = make_worker(lambda texts: np.ones((len(texts), 384), dtype=np.float32))
+    job_id = submit(["a", "b", "c"])
+
+    async def drain():
+        while await worker.run_once():
+            pass
+
+    asyncio.run(drain())
+
+    status = JobCRUD().job_status(job_id)
+    assert status["status"] == "completed"
+    assert status["processed_chunks"] == 3
+
+
+def test_worker_does_not_encode_saved_chunks_again(job_tables):
+    encode = MagicMock(side_effect=lambda texts: np.ones((len(texts), 384), dtype=np.float32))
+    worker = make_worker(encode)
+    first = submit(["a", "b"])
+    assert asyncio.run(worker.run_once())
+
+    second = submit(["b", "c"])
+    assert asyncio.run(worker.run_once())
+
+    assert [call.args[0] for call in encode.call_args_list] == [["a", "b"], ["c"]]
+    first_ids = JobCRUD().job_results(first, -1, 10)[0]["ids"]
+    second_ids = JobCRUD().job_results(second, -1, 10)[0]["ids"]
+    assert second_ids[0] == first_ids[1]
+    assert Embedding.select().count() == 3
+
+
+def test_worker_retries_failing_batch_until_max_attempts(job_tables):
+    worker = make_worker(MagicMock(side_effect=RuntimeError("out of memory")))
+    job_id = submit(["a"])
+
+    assert asyncio.run(worker.run_once())
+    assert JobCRUD().job_status(job_id)["batches"]["pending"] == 1
+    assert asyncio.run(worker.run_once())
+
+    status = JobCRUD().job_status(job_id)
+    assert status["status"] == "failed"
+    assert status["errors"] == [{"batch": 0, "error": "out of memory"}]
+
+
+def test_worker_releases_batch_when_inference_queue_is_full(job_tables):
+    worker = make_worker(MagicMock(side_effect=HTTPException(status_code=503, detail="Inference queue is full")))
+    job_id = submit(["a"])
+
+    assert not asyncio.run(worker.run_once())
+
+    assert EmbeddingJobBatch.get(EmbeddingJobBatch.job == job_id).attempts == 0
+
+
+def test_worker_tasks_start_and_stop(job_tables):
+    worker = make_worker(lambda texts: np.ones((len(texts), 384), dtype=np.float32))
+    job_id = submit(["a", "b", "c"])
+
+    async def run():
+        worker.start()
+        for _ in range(200):
+            if JobCRUD().job_status(job_id)["status"] == "completed":
+                break
+            await asyncio.sleep(0.01)
+        await worker.stop()
+
+    asyncio.run(run())
+
+    assert JobCRUD().job_status(job_id)["status"] == "completed"
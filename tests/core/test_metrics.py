@@ -0,0 +1,48 @@
+from unittest.mock import MagicMock
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from api.endpoints import MetricsRoutes
+from app.core import metrics
+
+
+def _sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_middleware_records_route_template():
+    app = FastAPI()
+    app.add_middleware(metrics.MetricsMiddleware)
+
+    @app.get("/items/{item_id}")
+    async def get_item(item_id: int):
+        return {"id": item_id}
+
+    labels = {"method": "GET", "route": "/items/{item_id}", "status": "200"}
+    before = _sample("embedding_request_seconds_count", **labels)
+
+    client = TestClient(app)
+    client.get("/items/1")
+    client.get("/items/2")
+
+    assert _sample("embedding_request_seconds_count", **labels) == before + 2
+
+
+def test_observed_gauges_and_metrics_endpoint():
+    executor = MagicMock(queue_depth=3)
+    database = MagicMock()
+    database.database._in_use = {1: None}
+    database.database._connections = [1, 2]
+    metrics.observe_executor(executor)
+    metrics.observe_database(database)
+    app = FastAPI()
+    app.include_router(MetricsRoutes().router)
+
+    response = TestClient(app).get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "embedding_inference_queue_depth 3.0" in response.text
+    assert 'embedding_db_pool_connections{state="idle"} 2.0' in response.text
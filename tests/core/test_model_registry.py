@@ -0,0 +1,199 @@
+import threading
+import time
+from unittest.mock import MagicMock
+
+import numpy as np
+import pytest
+
+from app.core.model_registry import configured_models, configured_projections, configured_storage, load_model, \
+    ModelRegistry, MODEL_NAME
+
+
+def test_registry_loads_lazily_and_once():
+    loader = MagicMock(return_value="model")
+    registry = ModelRegistry("some-model", backend="torch", loader=loader)
+
+    assert registry.state == "not_loaded"
+    loader.assert_not_called()
+
+    threads = [threading.Thread(target=registry.get) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    loader.assert_called_once_with("some-model", "torch")
+    assert registry.ready
+    assert registry.status()["state"] == "ready"
+
+
+def test_registry_records_load_failure():
+    registry = ModelRegistry("missing", backend="torch", loader=MagicMock(side_effect=OSError("not found")))
+
+    registry.warm_up()
+
+    assert not registry.ready
+    assert registry.status()["state"] == "failed"
+    assert registry.status()["error"] == "not found"
+
+
+def test_registry_warms_up_in_background():
+    model = MagicMock()
+    registry = ModelRegistry("some-model", backend="torch",
+                             loader=lambda name, backend: time.sleep(0.05) or model)
+
+    thread = registry.start_warm_up()
+    thread.join()
+
+    assert registry.ready
+    model.encode.assert_called_once_with(["warm up"])
+
+
+def test_load_model_rejects_unknown_backend():
+    with pytest.raises(ValueError, match="Unknown embedding backend"):
+        load_model(backend="tensorrt")
+
+
+@pytest.mark.parametrize("backend, min_similarity", [("onnx", 0.999), ("onnx-int8", 0.98)])
+def test_onnx_backend_matches_torch(backend, min_similarity, tmp_path, monkeypatch):
+    pytest.importorskip("onnxruntime")
+    pytest.importorskip("optimum.onnxruntime")
+    monkeypatch.setenv("EMBEDDING_ONNX_DIR", str(tmp_path))
+    texts = ["The quick brown fox jumps over the lazy dog.", "Embeddings map text to vectors.",
+             "short", "A much longer sentence that talks about databases, indexes and vector search " * 5]
+
+    reference = load_model(MODEL_NAME, "torch").encode(texts)
+    candidate = load_model(MODEL_NAME, backend).encode(texts)
+
+    similarity = (reference * candidate).sum(axis=1) / (
+        np.linalg.norm(reference, axis=1) * np.linalg.norm(candidate, axis=1))
+    assert similarity.min() >= min_similarity
+
+
+def _sized_model(size):
+    model = MagicMock()
+    model.parameters.return_value = [MagicMock(**{"numel.return_value": size, "element_size.return_value": 1})]
+    return model
+
+
+def test_registry_evicts_least_recently_used_model_over_budget():
+    sizes = {"default": 100, "a": 100, "b": 100}
+    registry = ModelRegistry("default", backend="torch", models={"default": 3, "a": 3, "b": 3},
+                             loader=lambda name, backend: _sized_model(sizes[name]), memory_budget=250)
+
+    registry.get()
+    registry.get("a")
+    registry.get("b")
+
+    # "a" was the least recently used; the default model is never evicted
+    assert set(registry.status()["loaded"]) == {"default", "b"}
+    assert registry.evictions == 1
+    assert registry.status()["memory_bytes"] == 200
+
+
+def test_registry_resolves_models():
+    registry = ModelRegistry("default", backend="torch", models={"default": 384, "other": 768}, loader=MagicMock())
+
+    assert registry.resolve(None) == "default"
+    assert registry.resolve("other") == "other"
+    with pytest.raises(KeyError):
+        registry.resolve("missing")
+    with pytest.raises(KeyError):
+        registry.get("missing")
+
+
+def test_registry_tables_per_model():
+    from app.models.embedding_model import Embedding
+
+    registry = ModelRegistry("default", backend="torch", models={"default": 384, "other/model": 768},
+                             loader=MagicMock())
+
+    assert registry.table() is Embedding
+    table = registry.table("other/model")
+    assert table._meta.table_name == "embedding_other_model"
+    assert table.embedding.dimensions == 768
+
+
+def test_registry_default_table_follows_model_dimension():
+    from app.models.embedding_model import Embedding
+
+    registry = ModelRegistry("big", backend="torch", models={"big": 1024, "small": 384}, loader=MagicMock())
+
+    # Not the static class, whose column has DIMENSION dimensions
+    table = registry.table()
+    assert table is not Embedding
+    assert table._meta.table_name == "embedding"
+    assert table.embedding.dimensions == 1024
+
+
+def test_configured_models(monkeypatch):
+    monkeypatch.setenv("EMBEDDING_MODELS", "org/small:384, big:1024")
+
+    assert configured_models() == {"org/small": 384, "big": 1024}
+
+    monkeypatch.setenv("EMBEDDING_MODELS", "no-dimension")
+    with pytest.raises(ValueError, match="name:dimension"):
+        configured_models()
+
+
+def test_configured_storage(monkeypatch):
+    monkeypatch.setenv("EMBEDDING_MODELS", "org/small:384:halfvec-bit, big:1024")
+    monkeypatch.setenv("EMBEDDING_STORAGE", "halfvec")
+
+    assert configured_models() == {"org/small": 384, "big": 1024}
+    assert configured_storage() == {"org/small": "halfvec-bit", "big": "halfvec"}
+
+    monkeypatch.setenv("EMBEDDING_STORAGE", "float8")
+    with pytest.raises(ValueError, match="Unknown embedding storage"):
+        configured_storage()
+
+
+def test_registry_tables_follow_storage():
+    from app.models.embedding_model import Embedding
+
+    registry = ModelRegistry("main", loader=MagicMock(), models={"main": 384, "other": 768},
+                             storage={"main": "halfvec", "other": "bit"})
+
+    default = registry.table()
+    other = registry.table("other")
+
+    assert default._meta.table_name == "embedding"
+    assert default.storage == "halfvec"
+    assert default.embedding.field_type == "halfvec"
+    assert other.storage == "bit"
+    assert other.embedding.field_type == "vector"
+    assert ModelRegistry("main", loader=MagicMock(), storage={}).table() is Embedding
+
+
+def test_configured_projections(monkeypatch):
+    monkeypatch.setenv("EMBEDDING_PROJECTIONS", "org/small:2, big:10")
+
+    assert configured_projections() == {"org/small": 2, "big": 10}
+
+    monkeypatch.setenv("EMBEDDING_PROJECTIONS", "org/small")
+    with pytest.raises(ValueError, match="name:version"):
+        configured_projections()
+
+
+def test_registry_serves_projected_vectors(tmp_path, monkeypatch):
+    from app.utils.projection import Projection, projection_path
+
+    monkeypatch.setenv("EMBEDDING_PROJECTION_DIR", str(tmp_path))
+    Projection.truncation(384, 128).save(projection_path("main", 3))
+    Projection.truncation(768, 64).save(projection_path("other", 1))
+    registry = ModelRegistry("main", loader=MagicMock(), models={"main": 384, "other": 768, "plain": 512},
+                             storage={}, projections={"main": 3, "other": 1}, normalize=True)
+
+    assert registry.dimensions() == 128
+    assert registry.dimensions("plain") == 512
+    assert registry.table()._meta.table_name == "embedding_p3"
+    assert registry.table().embedding.dimensions == 128
+    assert registry.table("other")._meta.table_name == "embedding_other_p1"
+    assert registry.projection("plain") is None
+    assert registry.vector_space() == "main@v3+l2"
+    assert registry.vector_space("plain") == "plain+l2"
+
+    registry.projections["plain"] = 1
+    Projection.truncation(384, 8).save(projection_path("plain", 1))
+    with pytest.raises(ValueError, match="expects 384 dimensions"):
+        registry.projection("plain")
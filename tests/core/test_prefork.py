@@ -0,0 +1,134 @@
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import textwrap
+import time
+import urllib.request
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.prefork import PreforkServer, worker_cpus
+
+# A server of two workers around an app reporting which process answered
+SERVER = textwrap.dedent("""
+    import os, sys
+    from fastapi import FastAPI
+    from app.core.prefork import PreforkServer
+
+    class Registry:
+        backend = "torch"
+        model_name = "fake"
+
+        def get(self):
+            return object()
+
+    class Database:
+        def close_pool(self):
+            pass
+
+    def create_app():
+        app = FastAPI()
+
+        @app.get("/worker")
+        def worker():
+            return {"pid": os.getpid(), "parent": os.getppid(), "cpus": sorted(os.sched_getaffinity(0)),
+                    "threads": os.environ["OMP_NUM_THREADS"]}
+        return app
+
+    PreforkServer(create_app, Registry(), Database(), workers=2, host="127.0.0.1", port=int(sys.argv[1]),
+                  restart_delay=0.1).run()
+""")
+
+
+def test_worker_cpus_splits_cpus_evenly():
+    cpus = [0, 1, 2, 3, 4, 5, 6, 7]
+
+    assert [worker_cpus(index, 4, cpus) for index in range(4)] == [[0, 1], [2, 3], [4, 5], [6, 7]]
+    assert [worker_cpus(index, 3, cpus) for index in range(3)] == [[0, 1], [2, 3, 4], [5, 6, 7]]
+    assert worker_cpus(0, 1, cpus) == cpus
+    # More workers than CPUs share them in turn
+    assert [worker_cpus(index, 3, [2, 3]) for index in range(3)] == [[2], [3], [2]]
+
+
+def test_prefork_reads_environment(monkeypatch):
+    monkeypatch.setenv("EMBEDDING_PREFORK_WORKERS", "3")
+    monkeypatch.setenv("EMBEDDING_PREFORK_SHARE", "shm")
+    monkeypatch.setenv("EMBEDDING_PREFORK_PIN", "false")
+    monkeypatch.setenv("EMBEDDING_TORCH_THREADS", "2")
+
+    server = PreforkServer(lambda: None, SimpleNamespace(backend="torch"), object())
+
+    assert (server.workers, server.share, server.preload, server.pin, server.threads) == (3, "shm", True, False, 2)
+    with pytest.raises(ValueError, match="share mode"):
+        PreforkServer(lambda: None, SimpleNamespace(backend="torch"), object(), share="mmap")
+
+
+def test_prefork_refuses_faiss_with_several_workers(monkeypatch):
+    monkeypatch.setenv("EMBEDDING_FAISS_ENABLED", "true")
+
+    with pytest.raises(ValueError, match="EMBEDDING_FAISS_ENABLED"):
+        PreforkServer(lambda: None, SimpleNamespace(backend="torch"), object(), workers=2)
+    assert PreforkServer(lambda: None, SimpleNamespace(backend="torch"), object(), workers=1).workers == 1
+
+
+def test_prefork_loads_onnx_backends_in_each_worker():
+    server = PreforkServer(lambda: None, SimpleNamespace(backend="onnx"), object(), preload=True)
+
+    assert server.preload is False
+
+
+def get_worker(port):
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/worker", timeout=5) as response:
+        return json.loads(response.read())
+
+
+def wait_for_worker(port, exclude=(), timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            worker = get_worker(port)
+            if worker["pid"] not in exclude:
+                return worker
+        except OSError:
+            pass
+        time.sleep(0.1)
+    raise AssertionError("No worker answered")
+
+
+def wait_for_children(pid, done, timeout=30):
+    deadline = time.monotonic() + timeout
+    while True:
+        children = {int(child) for child in Path(f"/proc/{pid}/task/{pid}/children").read_text().split()}
+        if done(children) or time.monotonic() > deadline:
+            return children
+        time.sleep(0.1)
+
+
+@pytest.mark.skipif(not hasattr(os, "fork") or not hasattr(os, "sched_getaffinity"), reason="Needs Linux")
+def test_prefork_serves_from_forked_workers_and_restarts_them():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    parent = subprocess.Popen([sys.executable, "-c", SERVER, str(port)], cwd=Path(__file__).parents[2])
+    try:
+        worker = wait_for_worker(port)
+        assert worker["parent"] == parent.pid
+        assert worker["threads"] == str(len(worker["cpus"]))
+
+        assert len(wait_for_children(parent.pid, lambda pids: len(pids) == 2)) == 2
+
+        # A worker that dies is replaced
+        os.kill(worker["pid"], signal.SIGKILL)
+        children = wait_for_children(parent.pid, lambda pids: len(pids) == 2 and worker["pid"] not in pids)
+        assert worker["pid"] not in children
+        assert wait_for_worker(port, exclude={worker["pid"]})["parent"] == parent.pid
+    finally:
+        parent.send_signal(signal.SIGTERM)
+        code = parent.wait(timeout=30)
+
+    assert code == 0
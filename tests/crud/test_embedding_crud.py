@@ -1,16 +1,29 @@
 import json
+import numpy as np
 import pytest
+import struct
 from unittest.mock import patch, MagicMock, call
 
 from fastapi import HTTPException
-from peewee import SqliteDatabase
+from peewee import PostgresqlDatabase, SqliteDatabase
+from pgvector.utils import HalfVector
 
 from crud.embedding_crud import EmbeddingCRUD
+from app.utils.faiss_index import FaissIndex
 from database.database import database_instance
-from models.embedding_model import Embedding
+from models.embedding_model import Embedding, embedding_table, hash_content, tenant_relation_name
 
 
 
+def pgvector_version():
+    database = Embedding._meta.database
+    if not isinstance(database, PostgresqlDatabase):
+        return (0,)
+    with database.connection_context():
+        row = database.execute_sql("SELECT extversion FROM pg_extension WHERE extname = 'vector'").fetchone()
+    return tuple(int(part) for part in row[0].split(".")) if row else (0,)
+
+
 @pytest.fixture
 def mock_database():
     db = SqliteDatabase(":memory:")
@@ -31,37 +44,68 @@ def test_save_embedding_spy(mock_database):
 
     # Patch database_instance to use the mock database
     with patch("app.models.embedding_model.database_instance", return_value=mock_database):
-        # Mock the Embedding.create method to avoid real database interaction
-        with patch("app.models.embedding_model.Embedding.create") as spy_create:
-            # Simulate the behavior of the create method with different returns for each call
-            spy_create.side_effect = [
-                MagicMock(id=1, text="chunk1", embedding=[0.1] * 384),
-                MagicMock(id=2, text="chunk2", embedding=[0.3] * 384)
-            ]
+        # Spy on insert_many so we can check all rows go out in one statement
+        with patch("app.models.embedding_model.Embedding.insert_many") as spy_insert_many:
+            spy_insert_many.return_value.on_conflict_ignore.return_value.returning.return_value.tuples.return_value \
+                .execute.return_value = [(hash_content("chunk1"), 1), (hash_content("chunk2"), 2)]
 
             # Create a CRUD instance and run the save_embedding method
             crud = EmbeddingCRUD()
             result = crud.save_embedding(chunks, embeddings)
 
-            # Ensure the `create` method was called the correct number of times
-            assert spy_create.call_count == 2
-
-            # Verify the arguments passed to `create` using unittest.mock.call
-            spy_create.assert_has_calls([
-                call(text="chunk1", embedding=[0.1] * 384),
-                call(text="chunk2", embedding=[0.3] * 384)
+            # A single multi-row INSERT instead of one per chunk
+            spy_insert_many.assert_called_once_with([
+                {"text": "chunk1", "content_hash": hash_content("chunk1"), "tenant": "", "metadata": None,
+                 "embedding": [0.1] * 384},
+                {"text": "chunk2", "content_hash": hash_content("chunk2"), "tenant": "", "metadata": None,
+                 "embedding": [0.3] * 384}
             ])
 
-            # Verify the returned result (mocked instances)
+            # Verify the returned result
             assert len(result) == 2
             assert result[0].text == "chunk1"
             assert result[1].text == "chunk2"
 
-            # Ensure the mocked result has the correct ids
+            # Ensure the result has the returned ids, in input order
             assert result[0].id == 1
             assert result[1].id == 2
 
 
+def test_save_embedding_splits_insert_batches(mock_database):
+    chunks = [f"chunk{i}" for i in range(5)]
+    embeddings = [[float(i)] * 384 for i in range(5)]
+
+    crud = EmbeddingCRUD(insert_batch_size=2)
+    result = crud.save_embedding(chunks, embeddings)
+
+    ids = [instance.id for instance in result]
+    assert ids == sorted(ids)
+    for instance, chunk, embedding in zip(result, chunks, embeddings):
+        stored = Embedding.get_by_id(instance.id)
+        assert stored.text == chunk
+        assert list(stored.embedding) == embedding
+
+
+def test_save_embedding_copy_path(mock_database):
+    chunks = ["first", "second ünïcode", "third"]
+    embeddings = [[0.5] * 384, [0.25] * 384, [-1.0] * 384]
+
+    crud = EmbeddingCRUD(copy_threshold=1)
+    result = crud.save_embedding(chunks, embeddings)
+
+    assert [instance.text for instance in result] == chunks
+    for instance, chunk, embedding in zip(result, chunks, embeddings):
+        stored = Embedding.get_by_id(instance.id)
+        assert stored.text == chunk
+        assert list(stored.embedding) == embedding
+        assert stored.created_at is not None
+
+
+def test_save_embedding_empty(mock_database):
+    crud = EmbeddingCRUD()
+    assert crud.save_embedding([], []) == []
+
+
 def test_get_embedding_by_id_valid(mock_database):
     # Create a sample embedding in the database
     with patch("app.models.embedding_model.database_instance", return_value=mock_database):
@@ -104,3 +148,390 @@ def test_get_embedding_by_id_not_found(mock_database):
 
     # Verify the result is None
     assert result is None
+
+
+def test_get_embedding_by_id_reads_through_cache(mock_database):
+    embedding_instance = Embedding.create(text="Popular", embedding=[0.5] * 384)
+    crud = EmbeddingCRUD()
+
+    crud.get_embedding_by_id(embedding_instance.id)
+    with patch("app.models.embedding_model.Embedding.get_or_none") as spy_get:
+        instance, vector = crud.get_embedding_by_id(embedding_instance.id)
+
+    spy_get.assert_not_called()
+    assert instance.id == embedding_instance.id
+    assert instance.text == "Popular"
+    assert vector.dtype == np.float32
+    assert vector.tolist() == [0.5] * 384
+
+
+def test_delete_embeddings_invalidates_cache(mock_database):
+    embedding_instance = Embedding.create(text="Gone soon", embedding=[0.5] * 384)
+    crud = EmbeddingCRUD()
+    assert crud.get_embedding_by_id(embedding_instance.id) is not None
+
+    assert crud.delete_embeddings([embedding_instance.id, 999999]) == 1
+
+    assert crud.get_embedding_by_id(embedding_instance.id) is None
+    assert crud.delete_embeddings([]) == 0
+
+
+def test_save_embedding_invalidates_reused_ids(mock_database):
+    crud = EmbeddingCRUD()
+    crud.id_cache.get(1, lambda embedding_id: ("stale", [0.0] * 384))
+
+    with patch("app.models.embedding_model.Embedding.insert_many") as spy_insert_many:
+        spy_insert_many.return_value.on_conflict_ignore.return_value.returning.return_value.tuples.return_value \
+            .execute.return_value = [(hash_content("fresh"), 1)]
+        crud.save_embedding(["fresh"], [[0.1] * 384])
+
+    assert crud.id_cache.stats()["entries"] == 0
+
+
+@pytest.fixture
+def search_rows(mock_database):
+    Embedding.delete().execute()
+    crud = EmbeddingCRUD()
+    vectors = [[1.0, 0.0] + [0.0] * 382, [0.0, 1.0] + [0.0] * 382, [0.7, 0.7] + [0.0] * 382]
+    return crud.save_embedding(["east", "north", "north-east"], vectors)
+
+
+@pytest.mark.parametrize("metric", ["cosine", "l2", "inner_product"])
+def test_search_embeddings_orders_by_distance(search_rows, metric):
+    crud = EmbeddingCRUD()
+    query = [0.9, 0.1] + [0.0] * 382
+
+    results = crud.search_embeddings(query, k=2, metric=metric)
+
+    assert [instance.text for instance, _ in results] == ["east", "north-east"]
+    assert results[0][1] <= results[1][1]
+
+
+def test_search_embeddings_with_tuning(search_rows):
+    crud = EmbeddingCRUD()
+
+    results = crud.search_embeddings([0.0, 1.0] + [0.0] * 382, k=1, ef_search=100, probes=5)
+
+    assert len(results) == 1
+    instance, distance = results[0]
+    assert instance.text == "north"
+    assert distance == pytest.approx(0.0)
+
+
+def test_save_embedding_keeps_faiss_index_in_sync(search_rows):
+    faiss_index = FaissIndex(384, metric="cosine")
+    crud = EmbeddingCRUD(faiss_index=faiss_index)
+    faiss_index.load(crud.iter_embeddings_after)
+    assert faiss_index.size == 3
+
+    saved = crud.save_embedding(["south"], [[0.0, -1.0] + [0.0] * 382])
+
+    assert faiss_index.size == 4
+    results = crud.search_embeddings([0.0, -1.0] + [0.0] * 382, k=2)
+    assert [instance.text for instance, _ in results] == ["south", "east"]
+    assert results[0][0].id == saved[0].id
+
+
+def test_save_embedding_adds_to_faiss_when_the_outer_transaction_commits(search_rows):
+    faiss_index = FaissIndex(384, metric="cosine")
+    crud = EmbeddingCRUD(faiss_index=faiss_index)
+    faiss_index.load(crud.iter_embeddings_after)
+    database = Embedding._meta.database
+
+    with pytest.raises(RuntimeError):
+        with database.atomic():
+            crud.save_embedding(["south"], [[0.0, -1.0] + [0.0] * 382])
+            raise RuntimeError("rolled back")
+    # The rolled back row never reaches the index
+    assert faiss_index.size == 3
+
+    with database.atomic():
+        crud.save_embedding(["west"], [[-1.0, 0.0] + [0.0] * 382])
+        # Only a savepoint so far
+        assert faiss_index.size == 3
+    assert faiss_index.size == 4
+
+
+@pytest.mark.parametrize("copy_threshold", [100, 1])
+def test_save_embedding_keeps_existing_rows_of_resubmitted_chunks(search_rows, copy_threshold):
+    faiss_index = FaissIndex(384, metric="cosine")
+    crud = EmbeddingCRUD(faiss_index=faiss_index, copy_threshold=copy_threshold)
+    faiss_index.load(crud.iter_embeddings_after)
+    ids = {instance.text: instance.id for instance in search_rows}
+
+    saved = crud.save_embedding(["north", "south", "east", "south"], [[0.5] * 384] * 4)
+
+    assert [instance.id for instance in saved[:3]] == [ids["north"], saved[1].id, ids["east"]]
+    assert saved[3].id == saved[1].id
+    assert Embedding.select().count() == 4
+    # The existing rows are not rewritten, and only the new one reaches the FAISS index
+    assert Embedding.get_by_id(ids["north"]).embedding.tolist()[:2] == [0.0, 1.0]
+    assert faiss_index.size == 4
+
+
+def test_find_by_content(search_rows):
+    crud = EmbeddingCRUD()
+
+    found = crud.find_by_content(["north", "missing", "east"])
+
+    assert set(found) == {"north", "east"}
+    assert found["north"].id == search_rows[1].id
+    assert found["north"].embedding.tolist()[:2] == [0.0, 1.0]
+    assert crud.find_by_content(["east"], include_embedding=False)["east"].embedding is None
+    assert crud.find_by_content([]) == {}
+
+
+def test_search_embeddings_from_faiss_without_rows(search_rows):
+    faiss_index = FaissIndex(384, metric="cosine")
+    crud = EmbeddingCRUD(faiss_index=faiss_index)
+    faiss_index.load(crud.iter_embeddings_after)
+
+    with patch("app.models.embedding_model.Embedding.select") as spy_select:
+        results = crud.search_embeddings([1.0, 0.0] + [0.0] * 382, k=1, with_rows=False)
+
+    spy_select.assert_not_called()
+    assert results[0][0].id == search_rows[0].id
+
+
+def test_search_embeddings_unsupported_metric_uses_postgres(search_rows):
+    faiss_index = FaissIndex(384, metric="cosine")
+    faiss_index.search = MagicMock()
+    crud = EmbeddingCRUD(faiss_index=faiss_index)
+    faiss_index.load(crud.iter_embeddings_after)
+
+    results = crud.search_embeddings([1.0, 0.0] + [0.0] * 382, k=1, metric="l2")
+
+    faiss_index.search.assert_not_called()
+    assert results[0][0].text == "east"
+
+
+def test_get_embeddings_by_ids(search_rows):
+    crud = EmbeddingCRUD()
+    ids = [row.id for row in search_rows]
+
+    result = crud.get_embeddings_by_ids([ids[2], 999999, ids[0], ids[2]])
+
+    assert set(result) == {ids[0], ids[2]}
+    assert result[ids[2]].text == "north-east"
+    assert list(result[ids[0]].embedding) == [1.0, 0.0] + [0.0] * 382
+
+
+def test_get_embeddings_by_ids_skips_unrequested_columns(search_rows):
+    crud = EmbeddingCRUD()
+
+    result = crud.get_embeddings_by_ids([search_rows[0].id], include_text=False, include_embedding=False)
+
+    instance = result[search_rows[0].id]
+    assert instance.text is None
+    assert instance.embedding is None
+
+
+def test_get_embeddings_by_ids_empty(mock_database):
+    assert EmbeddingCRUD().get_embeddings_by_ids([]) == {}
+
+
+def test_crud_for_another_model_table():
+    table = embedding_table("test/tiny-model", 3)
+    table.create_table(safe=True)
+    try:
+        crud = EmbeddingCRUD(faiss_index=MagicMock()).for_table(table)
+        saved = crud.save_embedding(["up", "right"], [[0.0, 1.0, 0.0], [1.0, 0.0, 0.0]])
+
+        results = crud.search_embeddings([0.9, 0.1, 0.0], k=1)
+
+        assert table._meta.table_name == "embedding_test_tiny_model"
+        assert crud.faiss_index is None
+        assert [instance.text for instance, _ in results] == ["right"]
+        assert crud.get_embeddings_by_ids([saved[0].id])[saved[0].id].text == "up"
+    finally:
+        table.drop_table(safe=True)
+
+
+def test_binary_storage_search_reranks_coarse_candidates():
+    table = embedding_table("test/bit-model", 3, "bit")
+    crud = EmbeddingCRUD(table=table, rerank_factor=20)
+    database = MagicMock()
+
+    with patch.object(table._meta, "database", database), patch.object(table, "raw") as spy_raw:
+        spy_raw.return_value = [MagicMock(id=4, distance=0.25)]
+        results = crud.search_embeddings([1.0, 0.0, -1.0], k=5, metric="l2", ef_search=10)
+
+    assert [(instance.id, distance) for instance, distance in results] == [(4, 0.25)]
+    # HNSW must return every one of the k * rerank_factor candidates
+    database.execute_sql.assert_called_once_with("SET LOCAL hnsw.ef_search = 100")
+    sql, *params = spy_raw.call_args.args
+    assert 'ORDER BY binary_quantize("embedding")::bit(3) <~> binary_quantize(%s::vector(3)) LIMIT %s' in sql
+    assert '"embedding" <-> %s::vector(3) AS "distance"' in sql
+    assert sql.endswith('ORDER BY "distance" LIMIT %s')
+    assert params == ["[1.0,0.0,-1.0]", "[1.0,0.0,-1.0]", 100, 5]
+
+
+def test_copy_writes_half_precision_vectors():
+    table = embedding_table("test/half-model", 3, "halfvec")
+    crud = EmbeddingCRUD(table=table)
+    database = MagicMock()
+    database.execute_sql.return_value.fetchall.return_value = [(7,)]
+    written = []
+    database.cursor.return_value.copy_expert.side_effect = lambda sql, buffer: written.append(buffer.read())
+
+    crud._copy_embeddings(database, ["half"], [hash_content("half")], [[0.5, -1.0, 2.0]])
+
+    expected = HalfVector([0.5, -1.0, 2.0]).to_binary()
+    assert struct.pack('>i', len(expected)) + expected in written[0]
+
+
+@pytest.mark.skipif(pgvector_version() < (0, 7), reason="halfvec and binary_quantize need pgvector 0.7")
+@pytest.mark.parametrize("storage", ["halfvec", "bit", "halfvec-bit"])
+def test_quantized_storage_round_trip(storage):
+    table = embedding_table("test/quantized", 384, storage)
+    table.create_table(safe=True)
+    try:
+        crud = EmbeddingCRUD(table=table, copy_threshold=2)
+        vectors = [[1.0, 0.0] + [0.0] * 382, [0.0, 1.0] + [0.0] * 382, [0.7, 0.7] + [0.0] * 382]
+        crud.save_embedding(["east"], vectors[:1])
+        crud.save_embedding(["north", "north-east"], vectors[1:])
+
+        results = crud.search_embeddings([0.9, 0.1] + [0.0] * 382, k=2)
+
+        assert [instance.text for instance, _ in results] == ["east", "north-east"]
+        assert results[0][0].embedding.dtype == np.float32
+    finally:
+        table.drop_table(safe=True)
+
+
+@pytest.fixture
+def hybrid_table(monkeypatch):
+    from app.core.initializer import AppInitializer
+
+    monkeypatch.setenv("EMBEDDING_TEXT_SEARCH_CONFIG", "english")
+    table = embedding_table("test/hybrid", 3)
+    table.create_table(safe=True)
+    AppInitializer(None, database_instance).create_text_search([table])
+    yield table
+    table.drop_table(safe=True)
+
+
+@pytest.mark.skipif(not isinstance(Embedding._meta.database, PostgresqlDatabase), reason="Needs PostgreSQL")
+def test_hybrid_search_fuses_text_and_vector_rankings(hybrid_table):
+    crud = EmbeddingCRUD(table=hybrid_table, hybrid_search=True, rrf_k=60)
+    crud.save_embedding(["Baked apple pies", "Replacement part SKU-4471 for the blue widget", "Green apples",
+                         "Unrelated"],
+                        [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.9, 0.1, 0.0], [0.5, 0.0, 0.5]])
+
+    results = crud.hybrid_search("Apples or SKU-4471", [1.0, 0.05, 0.0], k=3, candidates=3)
+
+    by_text = {instance.text: (instance, score) for instance, score in results}
+    assert list(by_text) == ["Baked apple pies", "Green apples", "Replacement part SKU-4471 for the blue widget"]
+    pie, pie_score = by_text["Baked apple pies"]
+    assert pie.vector_rank == 1 and pie.text_rank is not None
+    assert pie_score == pytest.approx(1 / 61 + 1 / (60 + pie.text_rank))
+    # Too far from the vector to be a vector candidate, found by its identifier alone
+    part, part_score = by_text["Replacement part SKU-4471 for the blue widget"]
+    assert (part.vector_rank, part.distance) == (None, None)
+    assert part_score == pytest.approx(1 / (60 + part.text_rank))
+    assert "Unrelated" not in by_text
+    assert crud.hybrid_search("Apples or SKU-4471", [1.0, 0.05, 0.0], k=3, tenant="other") == []
+
+
+@pytest.fixture
+def tenant_table(monkeypatch):
+    from app.core.initializer import AppInitializer
+
+    monkeypatch.setenv("EMBEDDING_INDEX_TYPE", "hnsw")
+    monkeypatch.setenv("EMBEDDING_INDEX_METRIC", "l2")
+    table = embedding_table("test/tenants", 3)
+    table.drop_table(safe=True)
+    table.create_table(safe=True)
+    yield table, AppInitializer(None, database_instance)
+    table.drop_table(safe=True)
+
+
+@pytest.mark.skipif(not isinstance(Embedding._meta.database, PostgresqlDatabase), reason="Needs PostgreSQL")
+@pytest.mark.parametrize("copy_threshold", [100, 1])
+def test_save_embedding_deduplicates_per_tenant_and_metadata(tenant_table, copy_threshold):
+    table, _ = tenant_table
+    crud = EmbeddingCRUD(table=table, copy_threshold=copy_threshold)
+
+    first = crud.save_embedding(["same", "other"], [[1.0, 0.0, 0.0]] * 2, tenant="a")
+    second = crud.save_embedding(["same"], [[1.0, 0.0, 0.0]], tenant="b")
+    tagged = crud.save_embedding(["same"], [[1.0, 0.0, 0.0]], tenant="a", metadata={"source": "wiki"})
+    again = crud.save_embedding(["same", "new"], [[0.0, 1.0, 0.0]] * 2, tenant="a", metadata={"source": "wiki"})
+
+    assert len({first[0].id, second[0].id, tagged[0].id}) == 3
+    assert again[0].id == tagged[0].id
+    assert table.get_by_id(tagged[0].id).metadata == {"source": "wiki"}
+    assert table.get_by_id(again[1].id).tenant == "a"
+    assert set(crud.find_by_content(["same", "new"], tenant="a", metadata={"source": "wiki"})) == {"same", "new"}
+    assert set(crud.find_by_content(["same", "new"], tenant="a")) == {"same"}
+
+
+@pytest.mark.skipif(not isinstance(Embedding._meta.database, PostgresqlDatabase), reason="Needs PostgreSQL")
+@pytest.mark.parametrize("copy_threshold", [100, 1])
+def test_save_embedding_with_document_sources(tenant_table, copy_threshold):
+    table, _ = tenant_table
+    crud = EmbeddingCRUD(table=table, copy_threshold=copy_threshold)
+    sources = [("doc-1", 0, 12), ("doc-1", 8, 20)]
+
+    first = crud.save_embedding(["the same", "the same"], [[1.0, 0.0, 0.0]] * 2, tenant="a", sources=sources)
+    again = crud.save_embedding(["the same"], [[0.0, 1.0, 0.0]], tenant="a", sources=[("doc-1", 0, 12)])
+    other = crud.save_embedding(["the same"], [[0.0, 1.0, 0.0]], tenant="a", sources=[("doc-2", 0, 12)])
+
+    # The same text at another place of a document, or in another one, is another row
+    assert len({first[0].id, first[1].id, other[0].id}) == 3
+    assert again[0].id == first[0].id
+    row = table.get_by_id(first[1].id)
+    assert (row.document_id, row.chunk_start, row.chunk_end) == ("doc-1", 8, 20)
+    assert crud.find_by_hash([hash_content("the same", None, ("doc-2", 0, 12)), "missing"], tenant="a") == {
+        hash_content("the same", None, ("doc-2", 0, 12)): other[0].id}
+    nearest, _ = crud.search_embeddings([1.0, 0.0, 0.0], k=1, metric="l2", tenant="a")[0]
+    assert (nearest.document_id, nearest.chunk_start, nearest.chunk_end) == ("doc-1", 0, 12)
+
+
+@pytest.mark.skipif(not isinstance(Embedding._meta.database, PostgresqlDatabase), reason="Needs PostgreSQL")
+def test_filtered_search_returns_k_rows_of_a_small_tenant(tenant_table):
+    table, initializer = tenant_table
+    crud = EmbeddingCRUD(table=table)
+    rng = np.random.default_rng(0)
+    # A large tenant crowding the query's neighbourhood, and a small one far from it
+    crud.save_embedding([f"large {i}" for i in range(500)], rng.normal(0, 0.1, (500, 3)), tenant="large",
+                        metadata={"source": "crawl"})
+    crud.save_embedding(["small 0", "small 1", "small 2"], [[5.0, 0.0, 0.0], [6.0, 0.0, 0.0], [7.0, 0.0, 0.0]],
+                        tenant="small", metadata={"source": "wiki", "lang": "en"})
+    initializer.create_vector_index([table])
+    initializer.create_metadata_index([table])
+    table._meta.database.execute_sql(f'ANALYZE "{table._meta.table_name}"')
+
+    for filters in ({"tenant": "small"}, {"metadata": {"source": "wiki"}}):
+        results = crud.search_embeddings([0.0, 0.0, 0.0], k=3, metric="l2", ef_search=10, **filters)
+        assert [instance.text for instance, _ in results] == ["small 0", "small 1", "small 2"]
+        assert results[0][0].metadata == {"source": "wiki", "lang": "en"}
+    assert crud.search_embeddings([0.0, 0.0, 0.0], k=3, metric="l2", tenant="missing") == []
+    assert len(crud.search_embeddings([0.0, 0.0, 0.0], k=5, metric="l2", tenant="large")) == 5
+
+
+@pytest.mark.skipif(not isinstance(Embedding._meta.database, PostgresqlDatabase), reason="Needs PostgreSQL")
+def test_filtered_search_uses_dedicated_tenant_index(tenant_table, monkeypatch):
+    table, initializer = tenant_table
+    monkeypatch.setenv("EMBEDDING_DEDICATED_TENANTS", "small")
+    crud = EmbeddingCRUD(table=table)
+    rng = np.random.default_rng(0)
+    crud.save_embedding([f"large {i}" for i in range(2000)], rng.normal(0, 1, (2000, 3)), tenant="large")
+    crud.save_embedding([f"small {i}" for i in range(200)], rng.normal(0, 1, (200, 3)), tenant="small")
+    initializer.create_vector_index([table])
+    database = table._meta.database
+    database.execute_sql(f'ANALYZE "{table._meta.table_name}"')
+
+    sql, params, _ = crud._nearest_sql([0.0, 0.0, 0.0], "l2", 5, tenant="small")
+    plan = "\n".join(row[0] for row in database.execute_sql(f"EXPLAIN {sql}", params).fetchall())
+
+    # The planner picks the tenant's partial index, which holds only its rows
+    assert f'{tenant_relation_name(table._meta.table_name, "small")}_embedding_hnsw_l2_idx' in plan
+
+
+def test_hybrid_search_needs_enabling():
+    crud = EmbeddingCRUD(hybrid_search=False)
+
+    with pytest.raises(HTTPException) as error:
+        crud.hybrid_search("text", [0.0] * 384, k=1)
+
+    assert error.value.status_code == 400
@@ -0,0 +1,137 @@
+import threading
+import time
+
+import pytest
+from peewee import PostgresqlDatabase
+
+from app.crud.embedding_crud import EmbeddingCRUD
+from app.crud.job_crud import JobCRUD
+from app.models.embedding_model import Embedding
+from app.models.job_model import EmbeddingJob, EmbeddingJobBatch
+
+
+@pytest.fixture
+def job_tables():
+    database = EmbeddingJob._meta.database
+    database.create_tables([Embedding, EmbeddingJob, EmbeddingJobBatch])
+    yield database
+    database.drop_tables([EmbeddingJobBatch, EmbeddingJob])
+
+
+@pytest.fixture
+def job(job_tables):
+    crud = JobCRUD()
+    job = crud.create_job("test-model", "chunks", 2)
+    crud.add_batches(job.id, [["a", "b"], ["c", "d"], ["e"]], 0)
+    crud.seal_job(job.id, 5)
+    return job
+
+
+def test_unsealed_jobs_are_not_claimed(job_tables):
+    crud = JobCRUD()
+    job = crud.create_job("test-model", "upload", 2)
+    crud.add_batches(job.id, [["a"]], 0)
+
+    assert crud.claim_batch(60, 3) is None
+    assert crud.job_status(job.id)["status"] == "receiving"
+
+
+def test_claim_complete_and_progress(job):
+    crud = JobCRUD()
+    assert crud.job_status(job.id)["status"] == "queued"
+
+    batch = crud.claim_batch(60, 3)
+    assert (batch.position, batch.status, batch.attempts) == (0, "running", 1)
+    assert batch.job.model_name == "test-model"
+    assert crud.complete_batch(batch, EmbeddingCRUD(), [[0.1] * 384, [0.2] * 384])
+
+    status = crud.job_status(job.id)
+    assert status["status"] == "running"
+    assert status["processed_chunks"] == 2
+    assert status["batches"] == {"pending": 2, "running": 0, "done": 1, "failed": 0}
+    results = crud.job_results(job.id, -1, 10)
+    assert [result["batch"] for result in results] == [0]
+    assert [Embedding.get_by_id(i).text for i in results[0]["ids"]] == ["a", "b"]
+    assert EmbeddingJobBatch.get_by_id(batch.id).chunks is None
+
+
+def test_failed_batch_is_retried_then_marked_failed(job):
+    crud = JobCRUD()
+    for attempt in (1, 2):
+        batch = crud.claim_batch(60, 2)
+        assert (batch.position, batch.attempts) == (0, attempt)
+        crud.fail_batch(batch, "model exploded", 2)
+
+    status = crud.job_status(job.id)
+    assert status["failed_chunks"] == 2
+    assert status["errors"] == [{"batch": 0, "error": "model exploded"}]
+    assert crud.claim_batch(60, 2).position == 1
+
+
+def test_expired_lease_is_taken_over(job):
+    crud = JobCRUD()
+    crashed = crud.claim_batch(0.01, 3)
+    time.sleep(0.02)
+
+    resumed = crud.claim_batch(60, 3)
+
+    assert resumed.id == crashed.id
+    assert resumed.attempts == 2
+    # The worker that lost its lease can no longer complete the batch
+    assert not crud.complete_batch(crashed, EmbeddingCRUD(), [[0.1] * 384] * 2)
+    assert crud.complete_batch(resumed, EmbeddingCRUD(), [[0.1] * 384] * 2)
+
+
+def test_batch_losing_workers_too_often_is_failed(job):
+    crud = JobCRUD()
+    for _ in range(2):
+        crud.claim_batch(0.001, 2)
+        time.sleep(0.01)
+
+    assert crud.claim_batch(60, 2).position == 1
+    assert "after 2 attempts" in crud.job_status(job.id)["errors"][0]["error"]
+
+
+def test_release_batch_does_not_count_the_attempt(job):
+    crud = JobCRUD()
+    crud.release_batch(crud.claim_batch(60, 3))
+
+    batch = crud.claim_batch(60, 3)
+    assert (batch.position, batch.attempts) == (0, 1)
+
+
+def test_claims_skip_locked_batches(job):
+    database = EmbeddingJob._meta.database
+    if not isinstance(database, PostgresqlDatabase):
+        pytest.skip("SKIP LOCKED needs PostgreSQL")
+    locked, release = threading.Event(), threading.Event()
+
+    def hold_first_batch():
+        # Another worker mid-claim: batch 0 is locked by its open transaction
+        with database.connection_context(), database.atomic():
+            database.execute_sql("SELECT id FROM embedding_job_batch WHERE position = 0 FOR UPDATE")
+            locked.set()
+            release.wait(5)
+
+    holder = threading.Thread(target=hold_first_batch)
+    holder.start()
+    locked.wait(5)
+    try:
+        batch = JobCRUD().claim_batch(60, 3)
+    finally:
+        release.set()
+        holder.join(5)
+
+    assert batch.position == 1
+
+
+def test_completed_status_and_missing_job(job):
+    crud = JobCRUD()
+    while (batch := crud.claim_batch(60, 3)) is not None:
+        crud.complete_batch(batch, EmbeddingCRUD(), [[0.1] * 384] * batch.size)
+
+    status = crud.job_status(job.id)
+    assert status["status"] == "completed"
+    assert status["processed_chunks"] == status["total_chunks"] == 5
+    assert [result["batch"] for result in crud.job_results(job.id, 0, 10)] == [1, 2]
+    assert crud.job_status(999999) is None
@@ -1,5 +1,9 @@
+import sqlite3
+import threading
+
 import pytest
 from unittest.mock import patch, MagicMock
+from playhouse.pool import MaxConnectionsExceeded
 from app.database.database import Database
 
 
@@ -8,7 +12,7 @@ def mock_database():
     """
     Fixture to create a mock database instance.
     """
-    with patch("app.database.database.PostgresqlDatabase") as MockPostgresqlDatabase:
+    with patch("app.database.database.HealthCheckedPooledPostgresqlDatabase") as MockPostgresqlDatabase:
         mock_db_instance = MagicMock()
         MockPostgresqlDatabase.return_value = mock_db_instance
         yield mock_db_instance
@@ -62,3 +66,144 @@ def test_database_initialize(mock_database):
         mock_connect.assert_called_once()
         mock_create_tables.assert_called_once_with([mock_table], safe=True)
         mock_close.assert_called_once()
+
+
+def test_database_execute_sql(mock_database):
+    """
+    Test if execute_sql runs the statement between connect() and close().
+    """
+    db = Database('test_db')
+
+    with patch.object(db, "connect") as mock_connect, \
+            patch.object(db, "close") as mock_close:
+        db.execute_sql("CREATE INDEX foo ON bar (baz)")
+
+        mock_connect.assert_called_once()
+        mock_database.execute_sql.assert_called_once_with("CREATE INDEX foo ON bar (baz)", None)
+        mock_close.assert_called_once()
+
+
+@pytest.fixture
+def sqlite_url(tmp_path):
+    """
+    SQLite stand-in for PostgreSQL, backed by a file so pooled connections share it.
+    """
+    return f"sqlite:///{tmp_path / 'pool.db'}"
+
+
+def test_database_pool_reuses_connections(sqlite_url):
+    """
+    Test if a closed connection goes back to the pool and is handed out again.
+    """
+    db = Database(sqlite_url, max_connections=2)
+
+    db.connect()
+    first = db.database.connection()
+    db.close()
+    db.connect()
+    second = db.database.connection()
+    db.close()
+
+    assert first is second
+    stats = db.pool_stats()
+    assert stats["checkouts"] == 2
+    assert stats["in_use"] == 0
+    assert stats["idle"] == 1
+
+
+def test_database_pool_health_check_discards_dead_connection(sqlite_url):
+    """
+    Test if an idle connection that fails SELECT 1 is replaced on checkout.
+    """
+    db = Database(sqlite_url, health_check=True)
+    db.connect()
+    db.close()
+    # Swap the idle connection for one that looks open but whose server went away
+    dead = MagicMock()
+    dead.cursor.return_value.execute.side_effect = sqlite3.OperationalError("server closed the connection")
+    timestamp, sentinel, _ = db.database._connections[0]
+    db.database._connections[0] = (timestamp, sentinel, dead)
+
+    db.connect()
+    replacement = db.database.connection()
+    replacement.execute("SELECT 1")
+    db.close()
+
+    assert replacement is not dead
+    dead.close.assert_called_once()
+    assert db.pool_stats()["health_check_failures"] == 1
+
+
+def test_database_pool_wait_timeout(sqlite_url):
+    """
+    Test if checkout gives up after the wait timeout when the pool is exhausted.
+    """
+    db = Database(sqlite_url, max_connections=1, wait_timeout=0.2)
+    held, release = threading.Event(), threading.Event()
+
+    def hold_connection():
+        db.connect()
+        held.set()
+        release.wait()
+        db.close()
+
+    thread = threading.Thread(target=hold_connection)
+    thread.start()
+    held.wait()
+    try:
+        with pytest.raises(MaxConnectionsExceeded):
+            db.connect()
+    finally:
+        release.set()
+        thread.join()
+
+    assert db.pool_stats()["wait_timeouts"] == 1
+
+
+def test_database_warm_up(sqlite_url):
+    """
+    Test if warm_up parks min_connections idle connections in the pool.
+    """
+    db = Database(sqlite_url, min_connections=3, max_connections=5)
+    db.warm_up()
+
+    assert db.pool_stats()["idle"] == 3
+    assert db.pool_stats()["in_use"] == 0
+
+
+def test_database_pool_reads_environment(monkeypatch, sqlite_url):
+    monkeypatch.setenv("DATABASE_POOL_MAX", "7")
+    monkeypatch.setenv("DATABASE_POOL_MIN", "2")
+    monkeypatch.setenv("DATABASE_POOL_STALE_TIMEOUT", "60")
+    monkeypatch.setenv("DATABASE_POOL_WAIT_TIMEOUT", "1.5")
+    monkeypatch.setenv("DATABASE_POOL_HEALTH_CHECK", "false")
+
+    db = Database(sqlite_url)
+
+    assert db.max_connections == 7
+    assert db.min_connections == 2
+    assert db.stale_timeout == 60
+    assert db.wait_timeout == 1.5
+    assert db.database.health_check is False
+
+
+def test_database_runs_callbacks_on_commit(sqlite_url):
+    db = Database(sqlite_url)
+    calls = []
+
+    db.database.on_commit(lambda: calls.append("outside"))
+    assert calls == ["outside"]
+
+    with db.database.atomic():
+        with db.database.atomic():
+            db.database.on_commit(lambda: calls.append("nested"))
+        assert calls == ["outside"]
+    assert calls == ["outside", "nested"]
+
+    with pytest.raises(RuntimeError):
+        with db.database.atomic():
+            db.database.on_commit(lambda: calls.append("rolled back"))
+            raise RuntimeError
+    with db.database.atomic():
+        pass
+    assert calls == ["outside", "nested"]
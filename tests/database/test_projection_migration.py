@@ -0,0 +1,66 @@
+from unittest.mock import MagicMock
+
+import numpy as np
+import pytest
+from peewee import PostgresqlDatabase
+
+from app.core.model_registry import ModelRegistry
+from app.database.database import database_instance
+from app.database.projection_migration import migrate_projection
+from app.utils.projection import projection_versions
+
+pytestmark = pytest.mark.skipif(not isinstance(database_instance.database, PostgresqlDatabase),
+                                reason="Projection migration needs PostgreSQL")
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    monkeypatch.setenv("EMBEDDING_PROJECTION_DIR", str(tmp_path))
+    monkeypatch.setenv("EMBEDDING_INDEX_TYPE", "hnsw")
+    monkeypatch.setenv("EMBEDDING_INDEX_METRIC", "inner_product")
+    registry = ModelRegistry("default", loader=MagicMock(), models={"default": 384, "test/projected": 8},
+                             storage={}, projections={}, normalize=True)
+    source = registry.table("test/projected")
+    database = database_instance.database
+    with database.connection_context():
+        database.drop_tables([source], safe=True)
+        database.create_tables([source])
+        rng = np.random.default_rng(0)
+        # Rank-3 data, so 3 principal components keep all of it
+        vectors = rng.standard_normal((40, 3)) @ rng.standard_normal((3, 8))
+        source.insert_many([{"text": f"row {i}", "embedding": vector} for i, vector in enumerate(vectors)]).execute()
+    yield registry
+    with database.connection_context():
+        database.drop_tables([source], safe=True)
+        database.execute_sql('DROP TABLE IF EXISTS "embedding_test_projected_p1"')
+        database.execute_sql('DROP SEQUENCE IF EXISTS "embedding_test_projected_id_seq"')
+
+
+def test_migrate_projection_fills_projected_table(registry):
+    database = database_instance.database
+    source = registry.table("test/projected")
+
+    projection = migrate_projection(database_instance, registry, "test/projected", dimensions=3, sample_size=30)
+
+    target = registry.table("test/projected")
+    assert projection.version == 1
+    assert projection_versions("test/projected") == [1]
+    assert projection.explained_variance == pytest.approx(1.0)
+    assert target._meta.table_name == "embedding_test_projected_p1"
+    with database.connection_context():
+        rows = list(target.select().order_by(target.id))
+        assert [row.text for row in rows] == [f"row {i}" for i in range(40)]
+        assert [row.id for row in rows] == [row.id for row in source.select(source.id).order_by(source.id)]
+        assert np.linalg.norm(rows[0].embedding) == pytest.approx(1.0, abs=1e-5)
+        assert database.execute_sql("SELECT indexname FROM pg_indexes WHERE tablename = %s AND indexname LIKE %s",
+                                    (target._meta.table_name, '%hnsw%')).fetchall() == [
+            ("embedding_test_projected_p1_embedding_hnsw_inner_product_idx",)]
+
+        # Rows saved to the full table before the restart are copied by a second run
+        late = source.create(text="late", embedding=np.ones(8))
+    migrate_projection(database_instance, registry, "test/projected", version=1)
+
+    with database.connection_context():
+        assert target.get_by_id(late.id).text == "late"
+        # Both tables draw from one sequence, so new projected rows never reuse an id
+        assert target.create(text="new", embedding=np.ones(3)).id > late.id
@@ -0,0 +1,82 @@
+import pytest
+from peewee import PostgresqlDatabase
+
+from app.database.database import database_instance
+from app.database.storage_migration import column_type, embedding_indexes, migrate_storage
+from app.models.embedding_model import embedding_table, vector_index_definition
+
+pytestmark = pytest.mark.skipif(not isinstance(database_instance.database, PostgresqlDatabase),
+                                reason="Storage migration needs PostgreSQL")
+
+
+@pytest.fixture
+def legacy_table(monkeypatch):
+    """
+    A vector table whose column is still `real[]`, which casts to `vector` like `vector` does to `halfvec`.
+    """
+    monkeypatch.setenv("EMBEDDING_INDEX_TYPE", "hnsw")
+    monkeypatch.setenv("EMBEDDING_INDEX_METRIC", "l2")
+    table = embedding_table("test/migration", 3)
+    database = database_instance.database
+    with database.connection_context():
+        database.execute_sql(f'DROP TABLE IF EXISTS "{table._meta.table_name}"')
+        database.execute_sql(f'CREATE TABLE "{table._meta.table_name}" '
+                             '("id" SERIAL PRIMARY KEY, "text" TEXT NOT NULL, "embedding" REAL[] NOT NULL)')
+        database.execute_sql(f'INSERT INTO "{table._meta.table_name}" ("text", "embedding") '
+                             "SELECT 'row ' || i, ARRAY[i, 0, 1]::REAL[] FROM generate_series(1, 25) i")
+    yield table
+    with database.connection_context():
+        database.execute_sql(f'DROP TABLE IF EXISTS "{table._meta.table_name}"')
+
+
+@pytest.mark.parametrize("offline", [False, True])
+def test_migrate_storage_converts_column_and_indexes_it(legacy_table, offline):
+    database = database_instance.database
+
+    migrate_storage(database_instance, legacy_table, batch_size=10, offline=offline)
+
+    with database.connection_context():
+        assert column_type(database, legacy_table._meta.table_name) == "vector(3)"
+        assert embedding_indexes(database, legacy_table._meta.table_name) == [
+            "embedding_test_migration_embedding_hnsw_l2_idx"]
+        assert legacy_table.select().count() == 25
+        row = legacy_table.select(legacy_table.embedding).where(legacy_table.text == "row 7").get()
+        assert row.embedding.tolist() == [7.0, 0.0, 1.0]
+
+
+def test_migrate_storage_drops_indexes_of_other_modes(legacy_table):
+    database = database_instance.database
+    table_name = legacy_table._meta.table_name
+    migrate_storage(database_instance, legacy_table)
+    with database.connection_context():
+        database.execute_sql(f'CREATE INDEX "{table_name}_embedding_old_idx" ON "{table_name}" '
+                             'USING hnsw ("embedding" vector_cosine_ops)')
+
+    migrate_storage(database_instance, legacy_table, drop_old_indexes=True)
+
+    with database.connection_context():
+        assert embedding_indexes(database, table_name) == ["embedding_test_migration_embedding_hnsw_l2_idx"]
+
+
+def test_migrate_storage_with_a_long_table_name(monkeypatch):
+    # Index names of this table run past what Postgres keeps, and differ only there
+    monkeypatch.setenv("EMBEDDING_INDEX_TYPE", "hnsw")
+    monkeypatch.setenv("EMBEDDING_INDEX_METRIC", "cosine")
+    table = embedding_table("sentence-transformers/all-MiniLM-L6-v2-migration-test", 3)
+    table_name = table._meta.table_name
+    database = database_instance.database
+    with database.connection_context():
+        database.execute_sql(f'DROP TABLE IF EXISTS "{table_name}"')
+        database.create_tables([table])
+    try:
+        migrate_storage(database_instance, table)
+        monkeypatch.setenv("EMBEDDING_INDEX_METRIC", "l2")
+        migrate_storage(database_instance, table, drop_old_indexes=True)
+
+        with database.connection_context():
+            # The l2 index was built rather than skipped as a duplicate name, and kept
+            assert embedding_indexes(database, table_name) == sorted(
+                vector_index_definition(table, "hnsw", metric)[0] for metric in ("cosine", "l2"))
+    finally:
+        with database.connection_context():
+            database.execute_sql(f'DROP TABLE IF EXISTS "{table_name}"')
@@ -1,3 +1,4 @@
+import hashlib
 import json
 from unittest.mock import patch
 
@@ -6,7 +7,8 @@ import pytest
 from peewee import SqliteDatabase
 from torch.nn.functional import embedding
 
-from app.models.embedding_model import Embedding
+from app.models.embedding_model import Embedding, HalfVectorField, embedding_table, hash_content, \
+    postgres_identifier, tenant_relation_name, vector_index_definition
 
 
 # Use an in-memory SQLite database for testing
@@ -68,4 +70,71 @@ def test_delete_embedding(mock_database):
         embedding_id = embedding
         embedding.delete_instance()
         with pytest.raises(Embedding.DoesNotExist):
-            Embedding.get_by_id(embedding_id)
\ No newline at end of file
+            Embedding.get_by_id(embedding_id)
+
+def test_half_precision_field_reads_float32_arrays():
+    field = HalfVectorField(dimensions=3)
+
+    value = field.python_value(field.db_value(np.array([0.5, -1.0, 0.1], dtype=np.float32)))
+
+    assert value.dtype == np.float32
+    assert value.tolist() == pytest.approx([0.5, -1.0, 0.1], abs=1e-3)
+    assert field.python_value(None) is None
+
+
+@pytest.mark.parametrize("storage, field_type, index", [
+    ("vector", "vector", ("embedding_test_storage_embedding_hnsw_l2_idx", '("embedding" vector_l2_ops)')),
+    ("halfvec", "halfvec", ("embedding_test_storage_embedding_hnsw_l2_halfvec_idx", '("embedding" halfvec_l2_ops)')),
+    ("bit", "vector", ("embedding_test_storage_embedding_hnsw_bit_idx",
+                       '((binary_quantize("embedding")::bit(8)) bit_hamming_ops)')),
+    ("halfvec-bit", "halfvec", ("embedding_test_storage_embedding_hnsw_bit_idx",
+                                '((binary_quantize("embedding")::bit(8)) bit_hamming_ops)')),
+])
+def test_embedding_table_storage(storage, field_type, index):
+    table = embedding_table("test/storage", 8, storage)
+
+    assert table.storage == storage
+    assert table.embedding.field_type == field_type
+    assert table is embedding_table("test/storage", 8, storage)
+    assert vector_index_definition(table, "hnsw", "l2") == index
+
+
+def test_metadata_round_trip(mock_database):
+    embedding = Embedding.create(text="Tagged", embedding=[1.0] * 384, tenant="acme",
+                                 metadata={"source": "wiki", "page": 3})
+    stored = Embedding.get_by_id(embedding.id)
+    assert stored.tenant == "acme"
+    assert stored.metadata == {"source": "wiki", "page": 3}
+    assert Embedding.get_by_id(Embedding.create(text="Plain", embedding=[1.0] * 384).id).tenant == ""
+
+
+def test_hash_content_covers_metadata():
+    assert hash_content("text") == hashlib.sha256(b"text").hexdigest()
+    assert hash_content("text", {}) == hash_content("text")
+    # Key order does not matter, values do
+    assert hash_content("text", {"a": 1, "b": 2}) == hash_content("text", {"b": 2, "a": 1})
+    assert hash_content("text", {"a": 1}) not in (hash_content("text"), hash_content("text", {"a": 2}))
+
+
+def test_tenant_partial_index_definition():
+    name, definition = vector_index_definition(Embedding, "hnsw", "cosine", "acme")
+    assert name == f"{tenant_relation_name('embedding', 'acme')}_embedding_hnsw_cosine_idx"
+    assert definition == '("embedding" vector_cosine_ops)'
+    # Any text makes a valid, distinct name
+    assert tenant_relation_name("embedding", "o'brien; drop") != tenant_relation_name("embedding", "acme")
+    assert tenant_relation_name("embedding", "acme").replace("_", "").isalnum()
+
+
+def test_vector_index_names_fit_postgres_identifiers():
+    names = set()
+    for storage in ("vector", "halfvec", "bit"):
+        table = embedding_table("sentence-transformers/all-MiniLM-L6-v2", 384, storage)
+        for metric in ("cosine", "l2"):
+            for tenant in (None, "acme", "globex"):
+                names.add(vector_index_definition(table, "hnsw", metric, tenant)[0])
+
+    # Distinct within 63 bytes, where Postgres would have cut them all to the same name; the
+    # binary index is the same for every metric
+    assert len(names) == 2 * 2 * 3 + 3
+    assert all(len(name) <= 63 for name in names)
+    assert postgres_identifier("embedding_embedding_hnsw_cosine_idx") == "embedding_embedding_hnsw_cosine_idx"
@@ -0,0 +1,101 @@
+import pytest
+from tokenizers import Tokenizer
+from tokenizers.models import WordPiece
+from tokenizers.normalizers import BertNormalizer
+from tokenizers.pre_tokenizers import BertPreTokenizer
+from tokenizers.processors import TemplateProcessing
+from transformers import PreTrainedTokenizerFast
+
+from app.utils.chunking import chunk_settings, chunk_text
+
+WORDS = ["the", "cat", "sat", "on", "mat", "a", "dog", "ran", "far", "away", "and", "then", "slept"]
+
+
+def make_tokenizer():
+    """A small BERT-style WordPiece tokenizer, built locally instead of downloaded."""
+    vocab = {token: index for index, token in enumerate(["[PAD]", "[UNK]", "[CLS]", "[SEP]", ".", ",", "!", *WORDS,
+                                                          "super", "##cal", "##if", "##rag"])}
+    backend = Tokenizer(WordPiece(vocab, unk_token="[UNK]"))
+    backend.normalizer = BertNormalizer(lowercase=True)
+    backend.pre_tokenizer = BertPreTokenizer()
+    backend.post_processor = TemplateProcessing(single="[CLS] $A [SEP]", pair="[CLS] $A [SEP] $B:1 [SEP]:1",
+                                                special_tokens=[("[CLS]", 2), ("[SEP]", 3)])
+    return PreTrainedTokenizerFast(tokenizer_object=backend, unk_token="[UNK]", pad_token="[PAD]",
+                                   cls_token="[CLS]", sep_token="[SEP]",
+                                   model_input_names=["input_ids", "token_type_ids", "attention_mask"])
+
+
+@pytest.fixture(scope="module")
+def tokenizer():
+    return make_tokenizer()
+
+
+def test_chunk_text_keeps_chunks_within_budget_and_overlapping(tokenizer):
+    text = " ".join(WORDS * 6)
+
+    chunks = chunk_text(tokenizer, text, max_tokens=16, overlap=4)
+
+    assert len(chunks) > 1
+    assert all(len(chunk.token_ids) <= 16 for chunk in chunks)
+    for chunk in chunks:
+        # Offsets locate the chunk in the document, and its tokens are the chunk's own
+        assert text[chunk.start:chunk.end] == chunk.text
+        assert chunk.token_ids == tokenizer(chunk.text, add_special_tokens=False)["input_ids"]
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert previous.token_ids[-4:] == chunk.token_ids[:4]
+    # Every token of the document is in a chunk
+    assert chunks[0].start == 0 and chunks[-1].end == len(text)
+
+
+def test_chunk_text_prefers_paragraph_and_sentence_ends(tokenizer):
+    text = "the cat sat on the mat. a dog ran far away and then slept"
+
+    chunks = chunk_text(tokenizer, text, max_tokens=10, overlap=0)
+
+    assert chunks[0].text == "the cat sat on the mat."
+
+    text = "the cat sat.\n\nthe dog ran. a cat slept on the mat"
+    chunks = chunk_text(tokenizer, text, max_tokens=12, overlap=0)
+
+    assert chunks[0].text == "the cat sat.\n\nthe dog ran."
+
+    chunks = chunk_text(tokenizer, "the cat.\n\nthe dog ran far away and then slept on a mat", max_tokens=12,
+                        overlap=0)
+    # A break in the first half of the chunk would leave it too short
+    assert len(chunks[0].token_ids) > 6
+
+
+def test_chunk_text_splits_between_words(tokenizer):
+    text = "the cat sat on supercal the mat and then the dog"
+
+    chunks = chunk_text(tokenizer, text, max_tokens=6, overlap=2)
+
+    # "supercal" is one word of two tokens, and overlaps start on a word
+    assert [chunk.text for chunk in chunks] == ["the cat sat on supercal", "supercal the mat and then",
+                                                "and then the dog"]
+
+    chunks = chunk_text(tokenizer, "the cat sat on supercalifragcalif the mat", max_tokens=6, overlap=2)
+
+    # Only a word longer than a chunk is cut
+    assert [chunk.text for chunk in chunks] == ["the cat sat on", "sat on supercalifrag", "ifragcalif the mat"]
+
+
+def test_chunk_text_of_an_empty_document(tokenizer):
+    assert chunk_text(tokenizer, "  ", max_tokens=8, overlap=2) == []
+
+
+def test_chunk_text_of_unknown_words(tokenizer):
+    chunks = chunk_text(tokenizer, "the zebra sat on the mat", max_tokens=4, overlap=0)
+
+    assert [chunk.text for chunk in chunks] == ["the zebra sat on", "the mat"]
+
+
+def test_chunk_settings(monkeypatch):
+    monkeypatch.setenv("EMBEDDING_CHUNK_TOKENS", "256")
+    monkeypatch.setenv("EMBEDDING_CHUNK_OVERLAP", "32")
+
+    assert chunk_settings(512, 2) == (256, 32)
+    # Chunks are capped to what the model reads
+    assert chunk_settings(128, 2, max_tokens=400, overlap=0) == (126, 0)
+    with pytest.raises(ValueError, match="overlap"):
+        chunk_settings(512, 2, max_tokens=64, overlap=64)
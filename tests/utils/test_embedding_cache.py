@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+from app.models.embedding_cache_model import EmbeddingCacheEntry
+from app.utils.embedding_cache import EmbeddingCache, normalize_text, text_hash
+
+
+def _as_lists(results):
+    return [None if result is None else result.tolist() for result in results]
+
+
+@pytest.fixture
+def cache_table():
+    database = EmbeddingCacheEntry._meta.database
+    database.create_tables([EmbeddingCacheEntry])
+    yield
+    database.drop_tables([EmbeddingCacheEntry])
+
+
+def test_normalize_text_collapses_whitespace():
+    assert normalize_text("  Terms\tand\n\nconditions ") == "Terms and conditions"
+    assert text_hash("Terms and conditions") == text_hash(" Terms  and conditions\n")
+    assert text_hash("Terms and conditions") != text_hash("terms and conditions")
+
+
+def test_lookup_counts_hits_and_misses():
+    cache = EmbeddingCache("test-model", max_entries=10, max_bytes=1024, persistent=False)
+    cache.store(["footer"], [[1.0, 2.0]])
+
+    results = cache.lookup(["footer", "header"])
+
+    assert isinstance(results[0], np.ndarray)
+    assert _as_lists(results) == [[1.0, 2.0], None]
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["entries"] == 1
+    assert stats["bytes"] == 8
+
+
+def test_evicts_least_recently_used_by_entries():
+    cache = EmbeddingCache("test-model", max_entries=2, max_bytes=1024, persistent=False)
+    cache.store(["a", "b"], [[1.0], [2.0]])
+    cache.lookup(["a"])  # "a" becomes most recently used
+    cache.store(["c"], [[3.0]])
+
+    assert _as_lists(cache.lookup(["a", "b", "c"])) == [[1.0], None, [3.0]]
+
+
+def test_evicts_by_bytes():
+    cache = EmbeddingCache("test-model", max_entries=100, max_bytes=16, persistent=False)
+    cache.store(["a", "b", "c"], [[1.0, 1.0], [2.0, 2.0], [3.0, 3.0]])
+
+    assert cache.stats()["bytes"] <= 16
+    assert _as_lists(cache.lookup(["a", "b", "c"])) == [None, [2.0, 2.0], [3.0, 3.0]]
+
+
+def test_zero_entries_disables_memory_tier():
+    cache = EmbeddingCache("test-model", max_entries=0, max_bytes=1024, persistent=False)
+    cache.store(["a"], [[1.0]])
+
+    assert cache.lookup(["a"]) == [None]
+
+
+def test_persistent_tier_survives_new_cache(cache_table):
+    vector = np.linspace(0, 1, 384).astype(np.float32)
+    EmbeddingCache("test-model", persistent=True).store(["disclaimer"], [vector.tolist()])
+
+    cache = EmbeddingCache("test-model", persistent=True)
+    results = cache.lookup(["disclaimer", "other"])
+
+    assert np.allclose(results[0], vector)
+    assert results[1] is None
+    assert cache.stats()["persistent_hits"] == 1
+    # The persistent hit was promoted to memory
+    assert cache.stats()["entries"] == 1
+
+
+def test_persistent_tier_is_keyed_by_model(cache_table):
+    EmbeddingCache("model-a", persistent=True).store(["disclaimer"], [[0.5] * 384])
+
+    assert EmbeddingCache("model-b", persistent=True).lookup(["disclaimer"]) == [None]
@@ -0,0 +1,162 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from app.utils.embedding_id_cache import ENTRY_OVERHEAD_BYTES, EmbeddingIdCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_read_through_stores_float32():
+    cache = EmbeddingIdCache(ttl=60, max_bytes=1024)
+    loads = []
+
+    def load(embedding_id):
+        loads.append(embedding_id)
+        return "footer", [1.0, 2.0]
+
+    first = cache.get(1, load)
+    second = cache.get(1, load)
+
+    assert loads == [1]
+    assert first[0] == second[0] == "footer"
+    assert second[1].dtype == np.float32
+    assert second[1].tolist() == [1.0, 2.0]
+    assert not second[1].flags.writeable
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_missing_ids_are_not_cached():
+    cache = EmbeddingIdCache(ttl=60, max_bytes=1024)
+    loads = []
+
+    assert cache.get(1, lambda embedding_id: loads.append(embedding_id)) is None
+    assert cache.get(1, lambda embedding_id: loads.append(embedding_id)) is None
+
+    assert loads == [1, 1]
+    assert cache.stats()["entries"] == 0
+
+
+def test_entries_expire_after_ttl():
+    clock = Clock()
+    cache = EmbeddingIdCache(ttl=10, max_bytes=1024, clock=clock)
+    cache.get(1, lambda embedding_id: ("old", [1.0]))
+
+    clock.now = 11
+    result = cache.get(1, lambda embedding_id: ("new", [2.0]))
+
+    assert result[0] == "new"
+
+
+def test_evicts_least_recently_used_by_bytes():
+    entry_bytes = 4 + 1 + ENTRY_OVERHEAD_BYTES
+    cache = EmbeddingIdCache(ttl=60, max_bytes=2 * entry_bytes)
+    for embedding_id in (1, 2):
+        cache.get(embedding_id, lambda embedding_id: ("a", [1.0]))
+    cache.get(1, lambda embedding_id: pytest.fail("1 should be cached"))  # 1 becomes most recently used
+
+    cache.get(3, lambda embedding_id: ("a", [1.0]))
+
+    assert cache.stats()["bytes"] == 2 * entry_bytes
+    assert cache.get(2, lambda embedding_id: None) is None
+    assert cache.get(1, lambda embedding_id: pytest.fail("1 should be cached"))[0] == "a"
+
+
+def test_invalidate_forgets_entries():
+    cache = EmbeddingIdCache(ttl=60, max_bytes=1024)
+    cache.get(1, lambda embedding_id: ("old", [1.0]))
+
+    cache.invalidate([1])
+
+    assert cache.get(1, lambda embedding_id: ("new", [2.0]))[0] == "new"
+
+
+def test_zero_ttl_disables_cache():
+    cache = EmbeddingIdCache(ttl=0, max_bytes=1024)
+    loads = []
+
+    def load(embedding_id):
+        loads.append(embedding_id)
+        return "a", [1.0]
+
+    cache.get(1, load)
+    cache.get(1, load)
+
+    assert loads == [1, 1]
+
+
+def test_concurrent_misses_share_one_load():
+    cache = EmbeddingIdCache(ttl=60, max_bytes=1024)
+    started, release = threading.Event(), threading.Event()
+    loads = []
+
+    def load(embedding_id):
+        loads.append(embedding_id)
+        started.set()
+        release.wait(5)
+        return "popular", [1.0]
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get(7, load))) for _ in range(8)]
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    while cache.stats()["coalesced"] < 7:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert loads == [7]
+    assert [text for text, _ in results] == ["popular"] * 8
+
+
+def test_waiters_see_the_load_error():
+    cache = EmbeddingIdCache(ttl=60, max_bytes=1024)
+    started, release = threading.Event(), threading.Event()
+    errors = []
+
+    def load(embedding_id):
+        started.set()
+        release.wait(5)
+        raise RuntimeError("database down")
+
+    def get():
+        try:
+            cache.get(1, load)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=get) for _ in range(2)]
+    threads[0].start()
+    started.wait(5)
+    threads[1].start()
+    while cache.stats()["coalesced"] < 1:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert errors == ["database down"] * 2
+    assert cache.get(1, lambda embedding_id: ("back", [1.0]))[0] == "back"
+
+
+def test_invalidate_during_load_does_not_cache_stale_result():
+    cache = EmbeddingIdCache(ttl=60, max_bytes=1024)
+
+    def load(embedding_id):
+        cache.invalidate([embedding_id])  # e.g. a delete committing while the read runs
+        return "stale", [1.0]
+
+    assert cache.get(1, load)[0] == "stale"
+    assert cache.stats()["entries"] == 0
@@ -1,10 +1,15 @@
+import asyncio
+
 import numpy as np
 import pytest
+import torch
 from unittest.mock import patch, MagicMock
 import json
 
 from app.utils.embedding_utils import compute_embedding_from_text, compute_embeddings_from_texts, \
-    convert_embedding_to_float_list
+    compute_embeddings_bucketed, convert_embedding_to_float_list, EmbeddingBatcher, chunk_documents, \
+    compute_embeddings_from_tokens, special_token_template
+from app.utils.embedding_cache import EmbeddingCache
 
 
 @pytest.fixture
@@ -15,10 +20,11 @@ def mock_model():
     return mock
 
 
-@patch("app.utils.embedding_utils.model", new_callable=lambda: MagicMock())
-def test_compute_embedding_from_text(mock_model):
+@patch("app.utils.embedding_utils.get_model")
+def test_compute_embedding_from_text(mock_get_model):
     """Test compute_embedding_from_text."""
     # Arrange
+    mock_model = mock_get_model.return_value
     mock_model.encode.return_value = [1.0, 2.0, 3.0]
     text = "Test input text"
 
@@ -30,19 +36,38 @@ def test_compute_embedding_from_text(mock_model):
     assert embedding == [1.0, 2.0, 3.0]
 
 
-@patch("app.utils.embedding_utils.model", new_callable=lambda: MagicMock())
-def test_compute_embeddings_from_texts(mock_model):
+@patch("app.utils.embedding_utils.get_model")
+def test_compute_embeddings_from_texts(mock_get_model):
     """Test compute_embeddings_from_texts."""
     # Arrange
+    mock_model = mock_get_model.return_value
     texts = ["Test input 1", "Test input 2"]
     mock_model.encode.return_value = [np.array([1.0, 2.0, 3.0]), np.array([4.0, 5.0, 6.0])]
 
     # Act
-    embeddings = compute_embeddings_from_texts(texts)
+    embeddings = compute_embeddings_from_texts(texts, token_budget=0)
 
     # Assert
     mock_model.encode.assert_called_once_with(texts)
-    assert embeddings == [[1.0, 2.0, 3.0], [4.0, 5.0, 6.0]]
+    assert isinstance(embeddings, np.ndarray)
+    assert embeddings.dtype == np.float32
+    assert embeddings.tolist() == [[1.0, 2.0, 3.0], [4.0, 5.0, 6.0]]
+
+
+
+@patch("app.utils.embedding_utils.get_model")
+def test_compute_embeddings_from_texts_normalizes_and_projects(mock_get_model):
+    from app.utils.projection import Projection
+
+    mock_get_model.return_value.encode.return_value = [np.array([3.0, 4.0, 12.0]), np.array([0.0, 2.0, 0.0])]
+
+    normalized = compute_embeddings_from_texts(["a", "b"], token_budget=0, normalize=True)
+    with patch("app.utils.embedding_utils.model_registry.projection", return_value=Projection.truncation(3, 2)):
+        projected = compute_embeddings_from_texts(["a", "b"], token_budget=0, normalize=True)
+
+    assert np.linalg.norm(normalized, axis=1).tolist() == pytest.approx([1.0, 1.0])
+    assert normalized[0].tolist() == pytest.approx([3 / 13, 4 / 13, 12 / 13])
+    np.testing.assert_allclose(projected, [[0.6, 0.8], [0.0, 1.0]], rtol=1e-6)
 
 
 def test_convert_embedding_to_float_list_valid_string():
@@ -99,3 +124,221 @@ def test_convert_embedding_to_float_list_missing_attribute():
     # Act & Assert
     with pytest.raises(ValueError, match="Failed to parse embedding"):
         convert_embedding_to_float_list(embedding_instance)
+
+
+def _fake_encode(calls):
+    def encode(texts):
+        calls.append(list(texts))
+        return [[float(len(text))] for text in texts]
+    return encode
+
+
+def test_embedding_batcher_pools_concurrent_requests():
+    """Concurrent requests are encoded in one call and each gets its own slice back."""
+    calls = []
+    batcher = EmbeddingBatcher(encode=_fake_encode(calls), max_batch_size=100, max_wait_ms=20)
+
+    async def run():
+        return await asyncio.gather(
+            batcher.embed(["a"]),
+            batcher.embed(["bb", "ccc"]),
+            batcher.embed(["dddd"]),
+        )
+
+    results = asyncio.run(run())
+
+    assert calls == [["a", "bb", "ccc", "dddd"]]
+    assert results == [[[1.0]], [[2.0], [3.0]], [[4.0]]]
+
+
+def test_embedding_batcher_flushes_when_full():
+    """A batch is flushed as soon as it reaches max_batch_size."""
+    calls = []
+    batcher = EmbeddingBatcher(encode=_fake_encode(calls), max_batch_size=2, max_wait_ms=10_000)
+
+    async def run():
+        return await asyncio.wait_for(
+            asyncio.gather(batcher.embed(["a"]), batcher.embed(["b"])), timeout=1
+        )
+
+    results = asyncio.run(run())
+
+    assert calls == [["a", "b"]]
+    assert results == [[[1.0]], [[1.0]]]
+
+
+def test_embedding_batcher_propagates_errors():
+    """An encode failure is raised in every request of the batch."""
+    def failing_encode(texts):
+        raise RuntimeError("model failure")
+
+    batcher = EmbeddingBatcher(encode=failing_encode, max_batch_size=10, max_wait_ms=1)
+
+    async def run():
+        return await asyncio.gather(batcher.embed(["a"]), batcher.embed(["b"]), return_exceptions=True)
+
+    results = asyncio.run(run())
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_embedding_batcher_empty_chunks():
+    """An empty request does not trigger an encode call."""
+    calls = []
+    batcher = EmbeddingBatcher(encode=_fake_encode(calls), dimensions=3)
+
+    embeddings = asyncio.run(batcher.embed([]))
+    # Still an array, so callers can stack it or read its shape
+    assert embeddings.shape == (0, 3)
+    assert embeddings.dtype == np.float32
+    assert calls == []
+
+
+def test_embedding_batcher_runs_encode_on_executor():
+    """When an executor is given, the batch is encoded through it."""
+    calls = []
+
+    class RecordingExecutor:
+        def __init__(self):
+            self.submitted = []
+
+        async def run(self, fn, *args):
+            self.submitted.append(args)
+            return fn(*args)
+
+    executor = RecordingExecutor()
+    batcher = EmbeddingBatcher(encode=_fake_encode(calls), max_wait_ms=1, executor=executor)
+
+    result = asyncio.run(batcher.embed(["abc"]))
+
+    assert executor.submitted == [(["abc"],)]
+    assert result == [[3.0]]
+
+
+def test_embedding_batcher_only_encodes_cache_misses():
+    """Cached chunks skip the model and repeated misses are encoded once."""
+    calls = []
+    cache = EmbeddingCache("test-model", max_entries=10, max_bytes=1024, persistent=False)
+    cache.store(["header"], [[100.0]])
+    batcher = EmbeddingBatcher(encode=_fake_encode(calls), max_wait_ms=1, cache=cache)
+
+    async def run():
+        return await asyncio.gather(batcher.embed(["header", "body"]), batcher.embed(["body", "footer!"]))
+
+    results = asyncio.run(run())
+
+    assert calls == [["body", "footer!"]]
+    assert [result.tolist() for result in results] == [[[100.0], [4.0]], [[4.0], [7.0]]]
+    assert cache.lookup(["footer!"])[0].tolist() == [7.0]
+
+
+class FakeTokenizerModel:
+    """Model whose 'embedding' of a text is [token count, padded batch length]."""
+    max_seq_length = 512
+    device = "cpu"
+
+    def __init__(self):
+        self.batches = []
+        self.tokenizer = MagicMock(side_effect=lambda texts, **kwargs: {
+            "input_ids": [[1] * len(text.split()) for text in texts]})
+        self.tokenizer.pad.side_effect = self.pad
+
+    def pad(self, encoded, return_tensors):
+        width = max(len(ids) for ids in encoded["input_ids"])
+        return {"attention_mask": torch.tensor([[1] * len(ids) + [0] * (width - len(ids))
+                                                for ids in encoded["input_ids"]])}
+
+    def __call__(self, features):
+        mask = features["attention_mask"]
+        self.batches.append(tuple(mask.shape))
+        return {"sentence_embedding": torch.stack([mask.sum(dim=1), torch.full((mask.shape[0],), mask.shape[1])],
+                                                  dim=1).float()}
+
+
+def test_compute_embeddings_bucketed_keeps_order_and_budget():
+    fake_model = FakeTokenizerModel()
+    texts = ["a " * 2, "a " * 50, "a " * 3, "a " * 40, "a " * 2]
+
+    with patch("app.utils.embedding_utils.get_model", return_value=fake_model):
+        embeddings = compute_embeddings_bucketed(texts, token_budget=100)
+
+    # Rows come back in input order, each padded only to its own bucket
+    assert embeddings[:, 0].tolist() == [2, 50, 3, 40, 2]
+    assert embeddings[:, 1].tolist() == [3, 50, 3, 50, 3]
+    assert all(rows * width <= 100 for rows, width in fake_model.batches)
+    assert fake_model.tokenizer.call_count == 1
+
+
+def test_compute_embeddings_from_texts_uses_token_budget():
+    fake_model = FakeTokenizerModel()
+    fake_model.encode = MagicMock()
+
+    with patch("app.utils.embedding_utils.get_model", return_value=fake_model):
+        embeddings = compute_embeddings_from_texts(["a b", "c"], token_budget=64)
+
+    fake_model.encode.assert_not_called()
+    assert embeddings.dtype == np.float32
+    assert embeddings[:, 0].tolist() == [2, 1]
+
+
+
+def test_compute_embeddings_bucketed_records_metrics():
+    from prometheus_client import REGISTRY
+
+    def count(name, labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    fake_model = FakeTokenizerModel()
+    before_forward = count("embedding_stage_seconds_count", {"stage": "forward"})
+    before_tokens = count("embedding_chunk_tokens_sum", {"model": "fake"})
+
+    with patch("app.utils.embedding_utils.get_model", return_value=fake_model):
+        compute_embeddings_from_texts(["a " * 2, "a " * 50, "a " * 3], token_budget=100, model_name="fake")
+
+    assert count("embedding_stage_seconds_count", {"stage": "forward"}) == before_forward + len(fake_model.batches)
+    assert count("embedding_chunk_tokens_sum", {"model": "fake"}) == before_tokens + 55
+    assert count("embedding_batch_size_count", {"model": "fake"}) >= 1
+
+
+class FakeChunkingModel:
+    """Model with a real tokenizer whose 'embedding' of a text is [first token id, token count]."""
+    max_seq_length = 10
+    device = "cpu"
+
+    def __init__(self):
+        from tests.utils.test_chunking import make_tokenizer
+
+        self.tokenizer = make_tokenizer()
+        self.features = []
+
+    def __call__(self, features):
+        self.features.append(features)
+        return {"sentence_embedding": torch.stack([features["input_ids"][:, 0],
+                                                   features["attention_mask"].sum(dim=1)], dim=1).float()}
+
+
+def test_chunk_documents_and_encode_their_tokens():
+    fake_model = FakeChunkingModel()
+    text = "the cat sat on the mat. a dog ran far away and then slept"
+
+    with patch("app.utils.embedding_utils.get_model", return_value=fake_model):
+        chunked = chunk_documents([text, ""], max_tokens=64, overlap=2)
+        chunks = chunked[0]
+        embeddings = compute_embeddings_from_tokens([chunk.token_ids for chunk in chunks], token_budget=64,
+                                                    normalize=False)
+
+    # Chunks are capped to the model's 10 tokens less [CLS] and [SEP], and the first ends its sentence
+    assert [chunk.text for chunk in chunks] == ["the cat sat on the mat.", "mat. a dog ran far away and",
+                                                "away and then slept"]
+    assert chunked[1] == []
+    # Encoded from their own tokens, with the special tokens added around them
+    assert embeddings.tolist() == [[2, 9], [2, 10], [2, 6]]
+    rows = {tuple(token for token in row.tolist() if token) for features in fake_model.features
+            for row in features["input_ids"]}
+    assert rows == {(2, *chunk.token_ids, 3) for chunk in chunks}
+
+
+def test_special_token_template():
+    from tests.utils.test_chunking import make_tokenizer
+
+    assert special_token_template(make_tokenizer()) == ([2], [3], True)
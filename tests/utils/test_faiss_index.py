@@ -0,0 +1,115 @@
+import numpy as np
+import pytest
+
+from app.utils.faiss_index import FaissIndex
+
+
+@pytest.fixture
+def vectors():
+    rng = np.random.default_rng(0)
+    return rng.standard_normal((50, 8)).astype(np.float32)
+
+
+def _rows(vectors, start_id=1):
+    def rows(after_id):
+        return [(start_id + i, vector) for i, vector in enumerate(vectors) if start_id + i > after_id]
+    return rows
+
+
+@pytest.mark.parametrize("metric", ["cosine", "l2", "inner_product"])
+def test_flat_search_matches_brute_force(vectors, metric):
+    index = FaissIndex(8, index_type="flat", metric=metric)
+    index.load(_rows(vectors))
+    query = vectors[3] + 0.01
+
+    results = index.search(query, k=5)
+
+    if metric == "cosine":
+        normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        expected = 1 - normalized @ (query / np.linalg.norm(query))
+    elif metric == "l2":
+        expected = np.linalg.norm(vectors - query, axis=1)
+    else:
+        expected = -(vectors @ query)
+    order = np.argsort(expected)[:5]
+    assert [embedding_id for embedding_id, _ in results] == [int(i) + 1 for i in order]
+    assert np.allclose([distance for _, distance in results], expected[order], atol=1e-4)
+
+
+def test_hnsw_add_and_search(vectors):
+    index = FaissIndex(8, index_type="hnsw", metric="cosine", hnsw_m=8)
+    index.add(list(range(100, 150)), vectors)
+
+    results = index.search(vectors[10], k=1, ef_search=64)
+
+    assert results[0][0] == 110
+    assert results[0][1] == pytest.approx(0.0, abs=1e-5)
+    assert index.size == 50
+    assert index.last_id == 149
+
+
+def test_ivfpq_falls_back_to_flat_with_few_vectors(vectors):
+    index = FaissIndex(8, index_type="ivfpq", metric="l2", ivf_lists=4, pq_subquantizers=2)
+    index.load(_rows(vectors))
+
+    assert index.size == 50
+    assert index.search(vectors[0], k=1, probes=2)[0][0] == 1
+
+
+def test_supports_only_configured_metric(vectors):
+    index = FaissIndex(8, metric="cosine")
+    assert not index.supports("cosine")  # Not loaded yet
+
+    index.load(_rows(vectors))
+
+    assert index.supports("cosine")
+    assert not index.supports("l2")
+
+
+def test_snapshot_restores_and_catches_up(vectors, tmp_path):
+    path = str(tmp_path / "faiss.index")
+    index = FaissIndex(8, metric="l2", snapshot_path=path)
+    index.load(_rows(vectors[:30]))
+    index.save()
+
+    requested_after = []
+
+    def rows(after_id):
+        requested_after.append(after_id)
+        return _rows(vectors)(after_id)
+
+    restored = FaissIndex(8, metric="l2", snapshot_path=path)
+    restored.load(rows)
+
+    assert requested_after == [30]
+    assert restored.size == 50
+    assert restored.search(vectors[40], k=1)[0][0] == 41
+
+
+def test_snapshot_ignored_when_settings_change(vectors, tmp_path):
+    path = str(tmp_path / "faiss.index")
+    index = FaissIndex(8, metric="l2", snapshot_path=path)
+    index.load(_rows(vectors))
+    index.save()
+
+    rebuilt = FaissIndex(8, metric="cosine", snapshot_path=path)
+    rebuilt.load(_rows(vectors))
+
+    assert rebuilt.size == 50
+
+
+def test_from_env(monkeypatch):
+    monkeypatch.delenv("EMBEDDING_FAISS_ENABLED", raising=False)
+    assert FaissIndex.from_env(384) is None
+
+    monkeypatch.setenv("EMBEDDING_FAISS_ENABLED", "true")
+    monkeypatch.setenv("EMBEDDING_FAISS_INDEX", "hnsw")
+    monkeypatch.setenv("EMBEDDING_FAISS_METRIC", "inner_product")
+    index = FaissIndex.from_env(384)
+    assert index.index_type == "hnsw"
+    assert index.metric == "inner_product"
+
+
+def test_rejects_unknown_index_type():
+    with pytest.raises(ValueError, match="Unknown FAISS index type"):
+        FaissIndex(8, index_type="lsh")
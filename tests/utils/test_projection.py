@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from app.utils.projection import l2_normalize, Projection, projection_path, projection_versions, \
+    transform_embeddings
+
+
+def test_l2_normalize_scales_rows_to_unit_length():
+    matrix = np.array([[3.0, 4.0], [0.0, 0.0], [-1.0, 0.0]])
+
+    normalized = l2_normalize(matrix)
+
+    assert normalized.dtype == np.float32
+    assert normalized.tolist() == [[0.6000000238418579, 0.800000011920929], [0.0, 0.0], [-1.0, 0.0]]
+
+
+def test_pca_keeps_low_rank_structure():
+    rng = np.random.default_rng(0)
+    sample = rng.standard_normal((500, 4)) @ rng.standard_normal((4, 32)) + 5.0
+
+    projection = Projection.fit_pca(sample, 4)
+    projected = projection.apply(sample)
+
+    assert projection.input_dimensions == 32
+    assert projected.shape == (500, 4)
+    assert projection.explained_variance == pytest.approx(1.0)
+    # An orthonormal projection of rank-4 data preserves the distances between points
+    assert np.linalg.norm(projected[0] - projected[1]) == pytest.approx(np.linalg.norm(sample[0] - sample[1]),
+                                                                         rel=1e-4)
+    with pytest.raises(ValueError, match="Cannot fit"):
+        Projection.fit_pca(sample, 40)
+
+
+def test_truncation_keeps_leading_dimensions():
+    sample = np.array([[1.0, 2.0, 3.0, 4.0], [-1.0, -2.0, -3.0, -4.0]])
+
+    projection = Projection.truncation(4, 2, sample)
+
+    assert projection.apply(sample).tolist() == [[1.0, 2.0], [-1.0, -2.0]]
+    assert projection.explained_variance == pytest.approx(5 / 30)
+    with pytest.raises(ValueError, match="expects 4 dimensions"):
+        projection.apply([[1.0, 2.0]])
+
+
+def test_transform_embeddings_normalizes_projected_vectors():
+    projection = Projection.truncation(3, 2)
+
+    transformed = transform_embeddings([[3.0, 4.0, 12.0]], projection, normalize=True)
+
+    assert np.linalg.norm(transformed[0]) == pytest.approx(1.0)
+    assert transformed[0].tolist() == pytest.approx([0.6, 0.8])
+    assert transform_embeddings([[3.0, 4.0, 12.0]], projection).tolist() == [[3.0, 4.0]]
+
+
+def test_projection_versions_round_trip(tmp_path):
+    projection = Projection.fit_pca(np.random.default_rng(1).standard_normal((50, 8)), 3)
+    projection.version = 2
+    projection.save(projection_path("org/model", 2, str(tmp_path)))
+
+    loaded = Projection.load(projection_path("org/model", 2, str(tmp_path)))
+
+    assert projection_versions("org/model", str(tmp_path)) == [2]
+    assert projection_versions("other", str(tmp_path)) == []
+    assert loaded.info() == projection.info()
+    np.testing.assert_array_equal(loaded.components, projection.components)
+    np.testing.assert_array_equal(loaded.mean, projection.mean)
@@ -0,0 +1,40 @@
+import asyncio
+
+import pytest
+
+from app.utils.stream_utils import iter_batches, iter_ndjson_chunks
+
+
+async def _stream(*parts):
+    for part in parts:
+        yield part
+
+
+async def _collect(iterator):
+    return [item async for item in iterator]
+
+
+def test_iter_ndjson_chunks_joins_lines_split_across_reads():
+    stream = _stream(b'"fir', b'st"\n{"text": "sec', b'ond"}\n\n  \n"third"')
+
+    chunks = asyncio.run(_collect(iter_ndjson_chunks(stream, max_line_bytes=100)))
+
+    assert chunks == ["first", "second", "third"]
+
+
+def test_iter_ndjson_chunks_rejects_long_lines():
+    stream = _stream(b'"' + b'x' * 50, b'x' * 50)
+
+    with pytest.raises(ValueError, match="Line 1 is longer than 64 bytes"):
+        asyncio.run(_collect(iter_ndjson_chunks(stream, max_line_bytes=64)))
+
+
+def test_iter_ndjson_chunks_rejects_non_text_values():
+    with pytest.raises(ValueError, match="Line 2"):
+        asyncio.run(_collect(iter_ndjson_chunks(_stream(b'"a"\n{"chunk": "b"}\n'), max_line_bytes=100)))
+
+
+def test_iter_batches():
+    batches = asyncio.run(_collect(iter_batches(_stream("a", "b", "c", "d", "e"), batch_size=2)))
+
+    assert batches == [["a", "b"], ["c", "d"], ["e"]]
@@ -0,0 +1,106 @@
+import base64
+import io
+import json
+
+import msgpack
+import numpy as np
+import pytest
+from fastapi import HTTPException
+
+from app.utils.vector_encoding import negotiate_vector_format, vector_response, JSON_FORMAT
+
+
+@pytest.fixture
+def vectors():
+    return [np.array([0.5, -1.0, 2.0], dtype=np.float32), np.array([1.5, 0.25, -2.0], dtype=np.float32)]
+
+
+@pytest.mark.parametrize("accept", [None, "", "*/*", "application/json", "text/html, application/*;q=0.5"])
+def test_negotiate_defaults_to_json(accept):
+    assert negotiate_vector_format(accept) == JSON_FORMAT
+
+
+def test_negotiate_parameters_and_quality():
+    vector_format = negotiate_vector_format("application/json;q=0.5, application/octet-stream; dtype=float16")
+    assert vector_format.media_type == "application/octet-stream"
+    assert vector_format.encoding == "raw"
+    assert vector_format.dtype == np.dtype("<f2")
+
+    assert negotiate_vector_format("application/json; encoding=base64").encoding == "base64"
+    assert negotiate_vector_format("application/x-npy").encoding == "npy"
+    assert negotiate_vector_format("application/msgpack").encoding == "msgpack"
+
+
+def test_negotiate_skips_unsupported():
+    # float16 lists are not offered, so the next acceptable type wins
+    vector_format = negotiate_vector_format("application/json; dtype=float16, application/x-npy;q=0.1")
+    assert vector_format.encoding == "npy"
+
+
+def test_negotiate_not_acceptable():
+    with pytest.raises(HTTPException) as exc_info:
+        negotiate_vector_format("text/csv, application/octet-stream; dtype=int8")
+    assert exc_info.value.status_code == 406
+
+
+def test_json_response(vectors):
+    response = vector_response({"embeddings": vectors}, JSON_FORMAT, vectors, [1, 2])
+
+    assert response.media_type == "application/json"
+    assert json.loads(response.body) == {"embeddings": [[0.5, -1.0, 2.0], [1.5, 0.25, -2.0]]}
+
+
+def test_base64_json_response(vectors):
+    vector_format = negotiate_vector_format("application/json; encoding=base64")
+
+    response = vector_response({"id": 1, "embedding": vectors[0], "distance": np.float32(0.5)}, vector_format,
+                               vectors[:1])
+
+    body = json.loads(response.body)
+    assert body["distance"] == 0.5
+    decoded = np.frombuffer(base64.b64decode(body["embedding"]), dtype="<f4")
+    assert decoded.tolist() == vectors[0].tolist()
+    assert response.headers["x-embedding-dtype"] == "float32"
+
+
+@pytest.mark.parametrize("dtype", ["float32", "float16"])
+def test_raw_response(vectors, dtype):
+    vector_format = negotiate_vector_format(f"application/octet-stream; dtype={dtype}")
+
+    response = vector_response({"embeddings": vectors}, vector_format, vectors, [7, 9])
+
+    assert response.headers["x-embedding-shape"] == "2,3"
+    assert response.headers["x-embedding-ids"] == "7,9"
+    assert response.headers["x-embedding-dtype"] == dtype
+    matrix = np.frombuffer(response.body, dtype=vector_format.dtype).reshape(2, 3)
+    assert np.array_equal(matrix, np.asarray(vectors))
+
+
+def test_raw_response_empty():
+    vector_format = negotiate_vector_format("application/octet-stream")
+
+    response = vector_response({"embeddings": []}, vector_format, [], [])
+
+    assert response.body == b""
+    assert response.headers["x-embedding-shape"] == "0,0"
+
+
+def test_npy_response(vectors):
+    vector_format = negotiate_vector_format("application/x-npy")
+
+    response = vector_response({"embeddings": vectors}, vector_format, vectors, [1, 2])
+
+    matrix = np.load(io.BytesIO(response.body))
+    assert matrix.dtype == np.float32
+    assert np.array_equal(matrix, np.asarray(vectors))
+
+
+def test_msgpack_response(vectors):
+    vector_format = negotiate_vector_format("application/msgpack; dtype=float16")
+
+    response = vector_response({"embeddings": [{"id": 1, "embedding": vectors[0]}], "missing": [3]},
+                               vector_format, vectors[:1])
+
+    body = msgpack.unpackb(response.body)
+    assert body["missing"] == [3]
+    assert np.frombuffer(body["embeddings"][0]["embedding"], dtype="<f2").tolist() == vectors[0].tolist()